@@ -3,6 +3,7 @@ from flask import (
     redirect, url_for, g
 )
 from flask_wtf.csrf import CSRFProtect, generate_csrf
+from werkzeug.middleware.proxy_fix import ProxyFix
 from datetime import timedelta
 from openai import OpenAI
 from db import init_db
@@ -20,6 +21,12 @@ from writerwork import  writerwork_bp
 from bookshelf import bookshelf_bp
 from comment import comment_bp
 from search import search_bp
+from stats import stats_bp
+from ranking import ranking_bp
+from related import related_bp
+from summary_jobs import summary_bp, init_summary_workers
+from prerender import prerender_bp
+from summarizer import FakeOpenAIClient
 import os
 
 
@@ -32,7 +39,11 @@ app.permanent_session_lifetime = timedelta(days=14)
 # ---------- สร้าง OpenAI client ----------
 api_key = os.environ.get("OPENAI_API_KEY")
 
-if not api_key:
+if os.environ.get("OPENAI_FAKE") == "1":
+    # รันบนเครื่อง/ทดสอบคิวสรุปโดยไม่ต่อ OpenAI จริง
+    client = FakeOpenAIClient(delay=float(os.environ.get("OPENAI_FAKE_DELAY", "0") or 0))
+    print("[INFO] ใช้ FakeOpenAIClient (OPENAI_FAKE=1)")
+elif not api_key:
     # ถ้าไม่มี key ให้แค่เตือน และปิดฟีเจอร์ AI summary ไปก่อน
     print(
         "[WARNING] OPENAI_API_KEY ยังไม่ได้ตั้งค่า "
@@ -47,10 +58,34 @@ else:
         print("[ERROR] สร้าง OpenAI client ไม่สำเร็จ:", repr(e))
         client = None
 
-# เก็บ client ไว้ให้ blueprint อื่นใช้ เช่น novelcover.generate_comment_summary
+# เก็บ client ไว้ให้ blueprint อื่นใช้ เช่น summarizer.generate_comment_summary (ผ่าน summary_jobs)
 app.config['OPENAI_CLIENT'] = client
+
+# จำนวน thread สรุปความคิดเห็นต่อ process (0 = ไม่รันในเว็บ ใช้ flask summary work แทน)
+app.config['SUMMARY_WORKERS'] = int(os.environ.get('SUMMARY_WORKERS', '2'))
+# วิธีสรุปความคิดเห็น: llm (ค่าเริ่มต้น) / extractive / engine ที่ลงทะเบียนเพิ่ม  (ดู summarizer.ENGINES)
+app.config['SUMMARY_ENGINE'] = os.environ.get('SUMMARY_ENGINE', 'llm')
 # -----------------------------------------
 
+# จำกัดความถี่ route ที่เขียนข้อมูล: shm (ค่าเริ่มต้น ใช้ร่วมทุก worker) / memory / off  (ดู ratelimit.py)
+app.config['RATE_LIMIT_BACKEND'] = os.environ.get('RATE_LIMIT_BACKEND', 'shm')
+
+# จำนวน reverse proxy ที่เชื่อถือหน้าแอป (เช่น nginx = 1) → request.remote_addr อ่านจาก X-Forwarded-For
+# ให้ bucket ต่อ IP เป็น IP จริงของผู้ใช้ ไม่ใช่ IP ของ proxy  (0 = ต่อตรง ไม่เชื่อ header นี้)
+app.config['PROXY_FIX_HOPS'] = int(os.environ.get('PROXY_FIX_HOPS', '0'))
+if app.config['PROXY_FIX_HOPS'] > 0:
+    hops = app.config['PROXY_FIX_HOPS']
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
+
+# หน้า novel cover สำเร็จรูปสำหรับผู้ไม่ล็อกอิน (ดู prerender.py) PRERENDER=0 ปิด
+app.config['PRERENDER'] = os.environ.get('PRERENDER', '1') != '0'
+app.config['PRERENDER_MAX_AGE'] = float(os.environ.get('PRERENDER_MAX_AGE', '600'))
+# ให้ nginx ส่งไฟล์เองผ่าน X-Accel-Redirect เช่น /_prerendered (ว่าง = Flask ส่งไฟล์เอง)
+app.config['PRERENDER_ACCEL_PREFIX'] = os.environ.get('PRERENDER_ACCEL_PREFIX', '')
+
+# engine ค้นหา: index (ค่าเริ่มต้น) / fulltext / like  (ดู search.SEARCH_ENGINES)
+app.config['SEARCH_ENGINE'] = os.environ.get('SEARCH_ENGINE', 'index')
+
 # เปิดใช้ CSRF protection ทั้งแอป
 csrf = CSRFProtect(app)
 
@@ -74,6 +109,13 @@ app.register_blueprint(api_bp)
 app.register_blueprint(bookshelf_bp)
 app.register_blueprint(comment_bp)
 app.register_blueprint(search_bp)
+app.register_blueprint(stats_bp)
+app.register_blueprint(ranking_bp)
+app.register_blueprint(related_bp)
+app.register_blueprint(summary_bp)
+app.register_blueprint(prerender_bp)
+
+init_summary_workers(app)
 
 
 # ทำให้ใช้ {{ csrf_token() }} ในทุก template ได้
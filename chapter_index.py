@@ -0,0 +1,689 @@
+# chapter_index.py
+"""
+ดัชนีค้นหาข้อความในเนื้อหาตอน (chapters.content_html) แบบ positional บนดิสก์
+
+สร้าง (flask search build-chapter-index):
+  ไล่เฉพาะตอนที่เผยแพร่ของนิยายที่เผยแพร่ ตาม chapters_id ทีละชุด → ลอก HTML → ตัดคำ (textseg) → เก็บตำแหน่งคำ
+  postings สะสมในหน่วยความจำได้ไม่เกิน block_postings แล้ว flush เป็นไฟล์ block ที่เรียงตาม term
+  จบแล้ว merge แบบ stream: คัดลอก byte ของแต่ละ block ต่อกัน แก้แค่ Δchapters_id ตัวแรกของ block
+  → หน่วยความจำไม่โตตามขนาดเนื้อหา (ไม่ถอด posting list ของคำที่พบบ่อยทั้งก้อน)
+
+ไฟล์ในโฟลเดอร์ CHAPTER_INDEX_DIR:
+  postings.bin  ต่อ term ต่อตอน: varint(Δchapters_id) varint(tf) varint(Δตำแหน่ง)...
+  lexicon.pkl   {term: (offset, nbytes, df, skips)}
+                skips = (chapters_id ก่อนหน้า, offset) ทุก ~SKIP_INTERVAL ตอน (None ถ้า df ไม่เกินนั้น)
+                → ค้นหลายคำถอดเฉพาะช่วงที่มีตอนที่ยังเป็น candidate
+  docs.pkl      {chapters_id: (novels_id, จำนวนคำ)}
+  meta.pkl      format / built_at / last_change_id / last_novel_change_id / avg_len
+
+อัปเดตระหว่างรอบ build: writingform.save_chapter ฯลฯ เรียก mark_chapter_changed → chapter_changes
+แต่ละ worker ดึงตอนที่เปลี่ยนมาทำ delta ในหน่วยความจำ (ตอนเดิมในไฟล์ถูก tombstone)
+ตอนที่ถูกลบ / กลับเป็นฉบับร่าง / นิยายเลิกเผยแพร่ (search_changes) ถูกเอาออกจากดัชนี
+"""
+from __future__ import annotations
+
+import heapq
+import math
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from contextlib import closing
+from datetime import datetime
+from html import unescape
+from html.parser import HTMLParser
+
+from flask import current_app
+from MySQLdb.cursors import DictCursor
+
+import textseg
+from db import get_db_connection
+
+BUILD_CHUNK = 200
+BLOCK_POSTINGS = 2_000_000     # จำนวนตำแหน่งคำสูงสุดที่ถือไว้ในหน่วยความจำก่อน flush
+SYNC_BATCH = 200
+SKIP_INTERVAL = 128            # จุด skip ทุกกี่ตอนใน posting list
+MAX_QUERY_DF = 50_000          # คีย์เวิร์ดที่ทุกคำพบในตอนมากกว่านี้ถือเป็นคำทั่วไป (ไม่ถอดทั้ง corpus)
+INDEX_FORMAT = 2
+PUBLISHED_STATUSES = ("เผยแพร่", "จบแล้ว")
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_BLOCK_TAGS = {"p", "div", "br", "li", "h1", "h2", "h3", "h4", "h5", "h6", "tr", "blockquote"}
+_SKIP_TAGS = {"script", "style"}
+
+
+# ---------- HTML → text ----------
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: list[str] = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS and self._skip:
+            self._skip -= 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def html_to_text(content) -> str:
+    """ลอกแท็ก HTML ออกเหลือข้อความ (ขึ้นบรรทัดใหม่ตามแท็ก block)"""
+    if not content:
+        return ""
+    content = str(content)
+    if "<" not in content:
+        return unescape(content)
+    p = _TextExtractor()
+    try:
+        p.feed(content)
+        p.close()
+    except Exception:
+        pass
+    return "".join(p.parts)
+
+
+def tokenize(text) -> list[str]:
+    return textseg.words(text)
+
+
+# ---------- varint ----------
+def _put_varint(out: bytearray, n: int) -> None:
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _get_varint(buf, pos: int) -> tuple[int, int]:
+    n = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _varint_len(n: int) -> int:
+    size = 1
+    while n >= 0x80:
+        n >>= 7
+        size += 1
+    return size
+
+
+def encode_postings(items, prev_id: int = 0) -> tuple[bytes, list[tuple[int, int]]]:
+    """
+    items = [(chapters_id, positions)] เรียงตาม chapters_id → (bytes, skips)
+    skips = [(chapters_id ก่อนหน้า, offset)] ทุก SKIP_INTERVAL ตอน (ไม่รวมตอนแรก)
+    """
+    out = bytearray()
+    skips = []
+    for k, (cid, positions) in enumerate(items):
+        if k and k % SKIP_INTERVAL == 0:
+            skips.append((prev_id, len(out)))
+        _put_varint(out, cid - prev_id)
+        prev_id = cid
+        _put_varint(out, len(positions))
+        prev = 0
+        for p in positions:
+            _put_varint(out, p - prev)
+            prev = p
+    return bytes(out), skips
+
+
+def decode_postings(buf, cid: int = 0, wanted=None) -> list[tuple[int, array]]:
+    """
+    ถอดตอนที่ต่อกันใน buf (cid = chapters_id ก่อนหน้าตอนแรก)
+    wanted = set ของ chapters_id ที่ต้องการ → ตอนอื่นข้ามตำแหน่งไปโดยไม่สร้าง array และหยุดเมื่อเลยตัวมากสุด
+    """
+    if wanted is not None and not wanted:
+        return []
+    stop = max(wanted) if wanted is not None else None
+    out = []
+    pos, end = 0, len(buf)
+    while pos < end:
+        delta, pos = _get_varint(buf, pos)
+        cid += delta
+        if stop is not None and cid > stop:
+            break
+        tf, pos = _get_varint(buf, pos)
+        if wanted is not None and cid not in wanted:
+            for _ in range(tf):
+                while buf[pos] & 0x80:
+                    pos += 1
+                pos += 1
+            continue
+        positions = array("I")
+        p = 0
+        for _ in range(tf):
+            d, pos = _get_varint(buf, pos)
+            p += d
+            positions.append(p)
+        out.append((cid, positions))
+    return out
+
+
+def _positions_by_term(words) -> dict[str, array]:
+    by_term: dict[str, array] = {}
+    for i, w in enumerate(words):
+        by_term.setdefault(w, array("I")).append(i)
+    return by_term
+
+
+# ---------- build ----------
+class ChapterIndexBuilder:
+    """สร้างดัชนีแบบ SPIMI: สะสม → flush เป็น block เรียงตาม term → merge ตอนจบ"""
+
+    def __init__(self, work_dir: str, block_postings: int = BLOCK_POSTINGS):
+        self.work_dir = work_dir
+        self.block_postings = block_postings
+        self._block: dict[str, list] = {}
+        self._block_size = 0
+        self.blocks: list[str] = []
+        self.docs: dict[int, tuple[int, int]] = {}
+        self.total_len = 0
+
+    def add(self, chapters_id: int, novels_id: int, text: str) -> None:
+        # ต้องเรียก add ตามลำดับ chapters_id จากน้อยไปมาก (ใช้ตอน merge/encode Δ)
+        words = tokenize(text)
+        for term, positions in _positions_by_term(words).items():
+            self._block.setdefault(term, []).append((chapters_id, positions))
+            self._block_size += len(positions)
+        self.docs[chapters_id] = (novels_id, len(words))
+        self.total_len += len(words)
+        if self._block_size >= self.block_postings:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._block:
+            return
+        path = os.path.join(self.work_dir, f"block{len(self.blocks):04d}.tmp")
+        with open(path, "wb") as f:
+            for term in sorted(self._block):
+                items = self._block[term]
+                data, skips = encode_postings(items)
+                # Δ ตัวแรกของ block นับจาก 0 (= chapters_id เต็ม) ตอน merge จะแก้ให้ต่อจาก block ก่อนหน้า
+                record = (term, items[0][0], items[-1][0], len(items), data, skips)
+                pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.blocks.append(path)
+        self._block = {}
+        self._block_size = 0
+
+    @staticmethod
+    def _read_block(path: str, block_no: int):
+        with open(path, "rb") as f:
+            while True:
+                try:
+                    term, *rest = pickle.load(f)
+                except EOFError:
+                    return
+                yield term, block_no, rest
+
+    def finish(self, out_dir: str, last_change_id: int, last_novel_change_id: int = 0) -> None:
+        """merge block ทั้งหมดเป็นไฟล์ดัชนีใน out_dir (ถือในหน่วยความจำแค่ segment ของ block เดียว)"""
+        self._flush()
+        lexicon: dict[str, tuple] = {}
+        streams = [self._read_block(p, i) for i, p in enumerate(self.blocks)]
+        with open(os.path.join(out_dir, "postings.bin"), "wb") as out:
+            offset = 0
+            current = None
+            start = df = prev_last = 0
+            skips: list[tuple[int, int]] = []
+
+            def close_term():
+                if df > SKIP_INTERVAL:
+                    entry_skips = (array("I", [c for c, _ in skips]), array("Q", [o for _, o in skips]))
+                else:
+                    entry_skips = None
+                lexicon[current] = (start, offset - start, df, entry_skips)
+
+            # block เรียงตาม term และ block ก่อนมี chapters_id น้อยกว่าเสมอ → ต่อกันได้เลย
+            for term, _, (first_cid, last_cid, count, data, inner) in heapq.merge(
+                *streams, key=lambda r: (r[0], r[1])
+            ):
+                if term != current:
+                    if current is not None:
+                        close_term()
+                    current, start, df, prev_last, skips = term, offset, 0, 0, []
+                head = bytearray()
+                _put_varint(head, first_cid - prev_last)
+                old_len = _varint_len(first_cid)
+                shift = len(head) - old_len
+                seg = offset - start
+                skips.append((prev_last, seg))
+                skips.extend((pc, seg + rel + shift) for pc, rel in inner)
+                out.write(head)
+                out.write(memoryview(data)[old_len:])
+                offset += len(head) + len(data) - old_len
+                df += count
+                prev_last = last_cid
+            if current is not None:
+                close_term()
+
+        n = len(self.docs) or 1
+        meta = {
+            "format": INDEX_FORMAT,
+            "built_at": datetime.now(),
+            "last_change_id": last_change_id,
+            "last_novel_change_id": last_novel_change_id,
+            "avg_len": self.total_len / n,
+        }
+        for name, obj in (("lexicon.pkl", lexicon), ("docs.pkl", self.docs), ("meta.pkl", meta)):
+            with open(os.path.join(out_dir, name), "wb") as f:
+                pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        for p in self.blocks:
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+
+_PUBLISHED_SQL = f"""
+    c.status = 'published'
+    AND n.status IN ({", ".join(["%s"] * len(PUBLISHED_STATUSES))})
+"""
+
+
+def _load_chapters(cur, ids) -> list[dict]:
+    """เนื้อหาของตอนใน ids เฉพาะที่เผยแพร่แล้วของนิยายที่เผยแพร่ (ตอนที่ไม่ได้คืนมาต้องไม่อยู่ในดัชนี)"""
+    if not ids:
+        return []
+    cur.execute(
+        f"""
+        SELECT c.chapters_id, c.novels_id, c.content_html
+        FROM chapters c
+        JOIN novels n ON n.novels_id = c.novels_id
+        WHERE c.chapters_id IN ({", ".join(["%s"] * len(ids))})
+          AND {_PUBLISHED_SQL}
+        """,
+        [*ids, *PUBLISHED_STATUSES],
+    )
+    return list(cur.fetchall())
+
+
+def build_chapter_index(conn, index_dir: str, chunk: int = BUILD_CHUNK,
+                        block_postings: int = BLOCK_POSTINGS) -> dict:
+    """สร้างดัชนีใหม่ในโฟลเดอร์ชั่วคราวแล้วสลับเข้าที่ index_dir"""
+    parent = os.path.dirname(os.path.abspath(index_dir))
+    os.makedirs(parent, exist_ok=True)
+    work = tempfile.mkdtemp(prefix="chapter_index.", dir=parent)
+    try:
+        builder = ChapterIndexBuilder(work, block_postings)
+        with conn.cursor(DictCursor) as cur:
+            cur.execute("SELECT COALESCE(MAX(change_id), 0) AS m FROM chapter_changes")
+            last_change_id = int((cur.fetchone() or {}).get("m") or 0)
+            cur.execute("SELECT COALESCE(MAX(change_id), 0) AS m FROM search_changes")
+            last_novel_change_id = int((cur.fetchone() or {}).get("m") or 0)
+            last_id = 0
+            while True:
+                cur.execute(
+                    f"""
+                    SELECT c.chapters_id
+                    FROM chapters c
+                    JOIN novels n ON n.novels_id = c.novels_id
+                    WHERE c.chapters_id > %s AND {_PUBLISHED_SQL}
+                    ORDER BY c.chapters_id
+                    LIMIT %s
+                    """,
+                    (last_id, *PUBLISHED_STATUSES, chunk),
+                )
+                ids = [r["chapters_id"] for r in cur.fetchall()]
+                if not ids:
+                    break
+                for r in sorted(_load_chapters(cur, ids), key=lambda r: r["chapters_id"]):
+                    builder.add(int(r["chapters_id"]), int(r["novels_id"]), html_to_text(r["content_html"]))
+                last_id = ids[-1]
+        builder.finish(work, last_change_id, last_novel_change_id)
+
+        # สลับโฟลเดอร์: ของเดิม → .old, ของใหม่ → index_dir
+        old = f"{index_dir}.old"
+        if os.path.exists(old):
+            shutil.rmtree(old, ignore_errors=True)
+        if os.path.exists(index_dir):
+            os.replace(index_dir, old)
+        os.replace(work, index_dir)
+        shutil.rmtree(old, ignore_errors=True)
+        return {"chapters": len(builder.docs), "blocks": len(builder.blocks), "change_id": last_change_id}
+    except Exception:
+        shutil.rmtree(work, ignore_errors=True)
+        raise
+
+
+# ---------- read ----------
+class ChapterIndex:
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, "meta.pkl"), "rb") as f:
+            self.meta = pickle.load(f)
+        if self.meta.get("format") != INDEX_FORMAT:
+            raise ValueError("ดัชนีเนื้อหาตอนเป็นรูปแบบเก่า ต้องรัน flask search build-chapter-index ใหม่")
+        with open(os.path.join(index_dir, "lexicon.pkl"), "rb") as f:
+            self.lexicon = pickle.load(f)
+        with open(os.path.join(index_dir, "docs.pkl"), "rb") as f:
+            self.docs = pickle.load(f)
+        self.meta_mtime = os.path.getmtime(os.path.join(index_dir, "meta.pkl"))
+        self._file = open(os.path.join(index_dir, "postings.bin"), "rb")
+        self._lock = threading.RLock()
+        self.last_change_id = int(self.meta.get("last_change_id") or 0)
+        self.last_novel_change_id = int(self.meta.get("last_novel_change_id") or 0)
+        self._by_novel: dict[int, set[int]] | None = None   # novels_id → chapters_id (สร้างเมื่อใช้ครั้งแรก)
+        # delta ของตอนที่แก้ไขหลัง build
+        self.tombstones: set[int] = set()
+        self.delta: dict[str, dict[int, array]] = {}
+        self.delta_terms: dict[int, list[str]] = {}
+        self.delta_docs: dict[int, tuple[int, int]] = {}
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+    def __len__(self) -> int:
+        return len(self.docs) - len(self.tombstones & self.docs.keys()) + len(self.delta_docs)
+
+    def apply(self, chapters_id: int, novels_id: int | None, text: str | None) -> None:
+        """แทนเนื้อหาตอนนี้ด้วย text (None = ตอนถูกลบ)"""
+        with self._lock:
+            self.tombstones.add(chapters_id)
+            for term in self.delta_terms.pop(chapters_id, ()):
+                postings = self.delta.get(term)
+                if postings is not None:
+                    postings.pop(chapters_id, None)
+                    if not postings:
+                        del self.delta[term]
+            self.delta_docs.pop(chapters_id, None)
+            if text is None:
+                return
+            words = tokenize(text)
+            by_term = _positions_by_term(words)
+            for term, positions in by_term.items():
+                self.delta.setdefault(term, {})[chapters_id] = positions
+            self.delta_terms[chapters_id] = list(by_term)
+            self.delta_docs[chapters_id] = (novels_id, len(words))
+            if self._by_novel is not None:
+                self._by_novel.setdefault(novels_id, set()).add(chapters_id)
+
+    def _doc(self, cid: int):
+        d = self.delta_docs.get(cid)
+        if d is not None:
+            return d
+        return None if cid in self.tombstones else self.docs.get(cid)
+
+    def chapters_of(self, novels_id: int) -> list[int]:
+        """ตอนของเรื่องนี้ที่ยังอยู่ในดัชนี"""
+        with self._lock:
+            if self._by_novel is None:
+                by_novel: dict[int, set[int]] = {}
+                for docs in (self.docs, self.delta_docs):
+                    for cid, (nid, _) in docs.items():
+                        by_novel.setdefault(nid, set()).add(cid)
+                self._by_novel = by_novel
+            return [cid for cid in self._by_novel.get(novels_id, ()) if self._doc(cid) is not None]
+
+    def df(self, term: str) -> int:
+        """จำนวนตอนที่มีคำนี้ (ค่าสูงสุด ไม่หัก tombstone)"""
+        entry = self.lexicon.get(term)
+        return (entry[2] if entry is not None else 0) + len(self.delta.get(term, ()))
+
+    def _read(self, offset: int, nbytes: int) -> bytes:
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(nbytes)
+
+    def postings(self, term: str, cids=None) -> dict[int, array]:
+        """
+        ตำแหน่งคำของทุกตอน (cids=None) หรือเฉพาะตอนใน cids
+        อย่างหลังใช้ skips อ่านและถอดเฉพาะช่วงของ posting list ที่อาจมีตอนเหล่านั้น
+        """
+        out: dict[int, array] = {}
+        wanted = None if cids is None else set(cids)
+        entry = self.lexicon.get(term)
+        if entry is not None and (wanted is None or wanted):
+            offset, nbytes, _, skips = entry
+            if wanted is None or skips is None:
+                items = decode_postings(self._read(offset, nbytes), wanted=wanted)
+            else:
+                prev_cids, offsets = skips
+                items = []
+                for i in sorted({bisect_left(prev_cids, c) - 1 for c in wanted}):
+                    lo = offsets[i]
+                    hi = offsets[i + 1] if i + 1 < len(offsets) else nbytes
+                    items.extend(decode_postings(self._read(offset + lo, hi - lo), prev_cids[i], wanted))
+            tomb = self.tombstones
+            out = {cid: pos for cid, pos in items if cid not in tomb}
+        with self._lock:
+            delta = self.delta.get(term, {})
+            if wanted is None:
+                out.update(delta)
+            else:
+                out.update((cid, delta[cid]) for cid in wanted if cid in delta)
+        return out
+
+    def _phrase(self, words, restrict=None) -> dict[int, list[int]] | None:
+        """
+        ตอนที่มีคำเรียงติดกันตาม words → {chapters_id: [ตำแหน่งเริ่มของวลี]} (restrict = จำกัดเฉพาะตอนเหล่านี้)
+        ถอดเต็มแค่คำที่ df น้อยที่สุด คำอื่นถอดเฉพาะตอนที่ยังเหลือ
+        None = ไม่มี restrict และทุกคำพบเกิน MAX_QUERY_DF ตอน (คำทั่วไป ไม่ถอดทั้ง corpus)
+        """
+        order = sorted(dict.fromkeys(words), key=self.df)
+        if restrict is None and self.df(order[0]) > MAX_QUERY_DF:
+            return None
+        cand = None if restrict is None else set(restrict)
+        lists = {}
+        for w in order:
+            p = self.postings(w, cand)
+            if not p:
+                return {}
+            lists[w] = p
+            cand = set(p) if cand is None else cand & p.keys()
+            if not cand:
+                return {}
+        out = {}
+        for cid in cand:
+            starts = set(lists[words[0]][cid])
+            for i, w in enumerate(words[1:], start=1):
+                starts &= {x - i for x in lists[w][cid]}
+                if not starts:
+                    break
+            if starts:
+                out[cid] = sorted(starts)
+        return out
+
+    def search(self, keywords, limit: int = 50) -> list[tuple[int, float, int]]:
+        """
+        AND ระหว่างคีย์เวิร์ด, คีย์เวิร์ดเดียวที่ตัดได้หลายคำต้องเจอเป็นวลีติดกัน
+        คืน [(chapters_id, score, ตำแหน่งคำแรกที่เจอ)] เรียงตามคะแนน BM25 ของความถี่วลี
+        คีย์เวิร์ดที่พบน้อยที่สุดหา candidate ก่อน คีย์เวิร์ดถัดไปตรวจเฉพาะ candidate ที่เหลือ
+        """
+        n_docs = max(len(self), 1)
+        avg_len = float(self.meta.get("avg_len") or 1.0) or 1.0
+        prepared = [words for words in (tokenize(kw) for kw in keywords) if words]
+        prepared.sort(key=lambda words: min(self.df(w) for w in words))
+        scores: dict[int, float] | None = None
+        first: dict[int, int] = {}
+        for words in prepared:
+            hits = self._phrase(words, None if scores is None else scores.keys())
+            if not hits:
+                return []
+            # คีย์เวิร์ดที่ตรวจเฉพาะ candidate ไม่รู้ df จริง → ใช้ df ของคำที่พบน้อยสุดแทน
+            df = len(hits) if scores is None else min(self.df(w) for w in words)
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            kw_scores = {}
+            for cid, starts in hits.items():
+                doc = self._doc(cid)
+                if doc is None:
+                    continue
+                tf = len(starts)
+                dl = doc[1] or 1
+                kw_scores[cid] = idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * dl / avg_len))
+                first[cid] = min(first.get(cid, starts[0]), starts[0])
+            if scores is None:
+                scores = kw_scores
+            else:
+                scores = {c: s + kw_scores[c] for c, s in scores.items() if c in kw_scores}
+            if not scores:
+                return []
+        ranked = sorted((scores or {}).items(), key=lambda kv: (-kv[1], kv[0]))[:limit]
+        return [(cid, score, first.get(cid, 0)) for cid, score in ranked]
+
+
+def make_snippet(text: str, keywords, width: int = 80) -> tuple[str, str, str]:
+    """คืน (ก่อน, คำที่เจอ, หลัง) รอบคีย์เวิร์ดแรกที่พบ ให้ template ใส่ <mark> เองแบบ escape"""
+    flat = " ".join(text.split())
+    low = textseg.normalize(flat)
+    for kw in keywords:
+        k = textseg.normalize(kw)
+        i = low.find(k)
+        if i >= 0:
+            start = max(0, i - width)
+            end = min(len(flat), i + len(k) + width)
+            before = ("…" if start > 0 else "") + flat[start:i]
+            after = flat[i + len(k):end] + ("…" if end < len(flat) else "")
+            return before, flat[i:i + len(k)], after
+    return flat[:width * 2] + ("…" if len(flat) > width * 2 else ""), "", ""
+
+
+# ---------- change log ----------
+def mark_chapter_changed(cur, chapters_id) -> None:
+    """บันทึกว่าตอนนี้เปลี่ยน (สร้าง/แก้ไข/ลบ/เปลี่ยนสถานะ) ให้ดัชนีเนื้อหาตอนของทุก worker อัปเดต"""
+    global _last_sync
+    if not chapters_id:
+        return
+    try:
+        cur.execute("INSERT INTO chapter_changes (chapters_id) VALUES (%s)", (chapters_id,))
+        _last_sync = 0.0
+    except Exception as e:
+        print(f"[chapter_index.mark_chapter_changed] chapters_id={chapters_id} error: {e}")
+
+
+def _sync_novels(idx: ChapterIndex, cur) -> int:
+    """
+    นิยายที่เปลี่ยน (search_changes) → เลิกเผยแพร่/ถูกลบ: เอาตอนออก, เพิ่งเผยแพร่: เพิ่มตอนที่เผยแพร่แล้ว
+    นิยายที่ยังเผยแพร่และมีตอนในดัชนีอยู่แล้วไม่ต้องทำอะไร (เนื้อหาตอนตามทางด้วย chapter_changes)
+    """
+    updated = 0
+    while True:
+        cur.execute(
+            """
+            SELECT change_id, novels_id FROM search_changes
+            WHERE change_id > %s ORDER BY change_id LIMIT %s
+            """,
+            (idx.last_novel_change_id, SYNC_BATCH),
+        )
+        rows = cur.fetchall()
+        if not rows:
+            break
+        nids = sorted({int(r["novels_id"]) for r in rows})
+        cur.execute(
+            f"SELECT novels_id, status FROM novels WHERE novels_id IN ({', '.join(['%s'] * len(nids))})",
+            nids,
+        )
+        live = {int(r["novels_id"]) for r in cur.fetchall() if (r["status"] or "").strip() in PUBLISHED_STATUSES}
+        for nid in nids:
+            indexed = idx.chapters_of(nid)
+            if nid not in live:
+                for cid in indexed:
+                    idx.apply(cid, None, None)
+                updated += len(indexed)
+            elif not indexed:
+                cur.execute(
+                    "SELECT chapters_id FROM chapters WHERE novels_id = %s AND status = 'published'",
+                    (nid,),
+                )
+                cids = [int(r["chapters_id"]) for r in cur.fetchall()]
+                for i in range(0, len(cids), SYNC_BATCH):
+                    for r in _load_chapters(cur, cids[i:i + SYNC_BATCH]):
+                        idx.apply(int(r["chapters_id"]), nid, html_to_text(r["content_html"]))
+                updated += len(cids)
+        idx.last_novel_change_id = int(rows[-1]["change_id"])
+    return updated
+
+
+def sync_changes(idx: ChapterIndex, conn) -> int:
+    updated = 0
+    with conn.cursor(DictCursor) as cur:
+        while True:
+            cur.execute(
+                """
+                SELECT change_id, chapters_id FROM chapter_changes
+                WHERE change_id > %s ORDER BY change_id LIMIT %s
+                """,
+                (idx.last_change_id, SYNC_BATCH),
+            )
+            rows = cur.fetchall()
+            if not rows:
+                break
+            ids = sorted({int(r["chapters_id"]) for r in rows})
+            found = {int(r["chapters_id"]): r for r in _load_chapters(cur, ids)}
+            for cid in ids:
+                r = found.get(cid)
+                if r is None:
+                    idx.apply(cid, None, None)
+                else:
+                    idx.apply(cid, int(r["novels_id"]), html_to_text(r["content_html"]))
+            idx.last_change_id = int(rows[-1]["change_id"])
+            updated += len(ids)
+        updated += _sync_novels(idx, cur)
+    return updated
+
+
+def prune_changes(conn, before_change_id: int) -> int:
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM chapter_changes WHERE change_id <= %s", (before_change_id,))
+        removed = cur.rowcount
+    conn.commit()
+    return removed
+
+
+# ---------- per-worker instance ----------
+_index: ChapterIndex | None = None
+_index_lock = threading.Lock()
+_last_sync = 0.0
+
+
+def index_dir() -> str:
+    path = current_app.config.get("CHAPTER_INDEX_DIR")
+    return path or os.path.join(current_app.instance_path, "chapter_index")
+
+
+def get_chapter_index() -> ChapterIndex | None:
+    """ดัชนีเนื้อหาตอนของ worker นี้ (None ถ้ายังไม่เคย build)"""
+    global _index, _last_sync
+    path = index_dir()
+    meta_path = os.path.join(path, "meta.pkl")
+    try:
+        if not os.path.exists(meta_path):
+            return None
+        with _index_lock:
+            if _index is None or os.path.getmtime(meta_path) != _index.meta_mtime:
+                # build รอบใหม่เสร็จแล้ว → โหลดไฟล์ใหม่ (delta เก่าไม่ต้องใช้แล้ว)
+                old, _index = _index, ChapterIndex(path)
+                _last_sync = 0.0
+                if old is not None:
+                    old.close()
+        idx = _index
+        now = time.monotonic()
+        if now - _last_sync >= float(current_app.config.get("SEARCH_SYNC_INTERVAL", 2.0)):
+            _last_sync = now
+            with closing(get_db_connection()) as conn:
+                sync_changes(idx, conn)
+        return idx
+    except Exception as e:
+        print(f"[chapter_index.get_chapter_index] error: {e!r}")
+        return None
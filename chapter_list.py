@@ -0,0 +1,147 @@
+# chapter_list.py
+"""
+ดัชนีรายการตอนต่อเรื่อง (ต่อ worker) สำหรับหน้า novel cover และหน้าแก้ไขนิยาย
+
+- โหลดครั้งเดียวต่อเรื่อง: (chapter_no, chapters_id, title, created_at, updated_at, status) เรียงตาม chapter_no
+  ไม่ดึง content_html และไม่ GROUP BY หัวใจ (นับหัวใจเฉพาะตอนในหน้าที่แสดงทีหลัง)
+- หน้าเว็บแบ่งเป็นกลุ่มละ GROUP_SIZE ตอน: render แถวเฉพาะกลุ่มแรก กลุ่มอื่นโหลดเป็น JSON ตอนกดเปิด
+  ด้วย cursor แบบ keyset (chapter_no:chapters_id ของแถวก่อนหน้ากลุ่ม)
+- กระโดดไปตอนที่ N ใช้ binary search บนดัชนี แล้วคืนทั้งกลุ่มที่มีตอนนั้น
+- หมดอายุทุก CHAPTER_LIST_TTL วินาที และถูกล้างทันทีใน worker ที่แก้ไขตอน (invalidate)
+  หน้าแก้ไขของผู้เขียนโหลดสดเสมอ (fresh=True) เพราะเพิ่งแก้ผ่าน worker อื่นได้
+"""
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+GROUP_SIZE = 50
+CHAPTER_LIST_TTL = 30.0
+MAX_NOVELS = 2000
+
+
+def encode_key(key) -> str:
+    return f"{key[0]}:{key[1]}"
+
+
+def decode_key(raw: str | None):
+    """'chapter_no:chapters_id' → tuple หรือ None ถ้ารูปแบบไม่ถูก"""
+    if not raw:
+        return None
+    try:
+        no, cid = raw.split(":", 1)
+        return (int(no), int(cid))
+    except (TypeError, ValueError):
+        return None
+
+
+class ChapterList:
+    def __init__(self, novels_id: int, rows):
+        self.novels_id = novels_id
+        self.rows: list[dict] = sorted(rows, key=lambda r: (int(r["chapter_no"]), int(r["chapters_id"])))
+        self.keys: list[tuple] = [(int(r["chapter_no"]), int(r["chapters_id"])) for r in self.rows]
+        self.nos: list[int] = [k[0] for k in self.keys]
+        self.loaded_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    # ---------- ตำแหน่งตามทิศการเรียง ----------
+    def _ordered(self, sort: str) -> list[int]:
+        n = len(self.rows)
+        return list(range(n)) if sort == "asc" else list(range(n - 1, -1, -1))
+
+    def _position(self, sort: str, after) -> int:
+        """ตำแหน่ง (ในลำดับของ sort) ของแถวแรกที่อยู่ถัดจาก key after"""
+        if after is None:
+            return 0
+        if sort == "asc":
+            return bisect_right(self.keys, tuple(after))
+        return len(self.keys) - bisect_left(self.keys, tuple(after))
+
+    def _row_at(self, sort: str, pos: int) -> dict:
+        return self.rows[pos] if sort == "asc" else self.rows[len(self.rows) - 1 - pos]
+
+    def _key_at(self, sort: str, pos: int) -> tuple:
+        return self.keys[pos] if sort == "asc" else self.keys[len(self.keys) - 1 - pos]
+
+    # ---------- อ่าน ----------
+    def window(self, sort: str = "asc", after=None, limit: int = GROUP_SIZE):
+        """แถวถัดจาก after ไม่เกิน limit แถว + cursor ของหน้าถัดไป (None ถ้าหมด)"""
+        start = self._position(sort, after)
+        end = min(start + limit, len(self.rows))
+        rows = [self._row_at(sort, p) for p in range(start, end)]
+        next_after = encode_key(self._key_at(sort, end - 1)) if end < len(self.rows) and rows else None
+        return rows, next_after
+
+    def groups(self, sort: str = "asc", size: int = GROUP_SIZE) -> list[dict]:
+        """หัวกลุ่มทั้งหมด: ช่วงเลขตอน, จำนวน และ cursor สำหรับโหลดแถวของกลุ่มนั้น"""
+        out = []
+        n = len(self.rows)
+        for g, start in enumerate(range(0, n, size)):
+            end = min(start + size, n) - 1
+            out.append({
+                "index": g,
+                "first_no": self._key_at(sort, start)[0],
+                "last_no": self._key_at(sort, end)[0],
+                "count": end - start + 1,
+                "after": encode_key(self._key_at(sort, start - 1)) if start else "",
+            })
+        return out
+
+    def locate(self, chapter_no: int, sort: str = "asc", size: int = GROUP_SIZE):
+        """binary search หาตอนที่ chapter_no → (index ของกลุ่ม, cursor ของกลุ่ม) หรือ None ถ้าไม่มีตอนนี้"""
+        i = bisect_left(self.nos, int(chapter_no))
+        if i >= len(self.nos) or self.nos[i] != int(chapter_no):
+            return None
+        pos = i if sort == "asc" else len(self.rows) - 1 - i
+        g = pos // size
+        start = g * size
+        return g, (encode_key(self._key_at(sort, start - 1)) if start else None)
+
+
+# ---------- per-worker cache ----------
+_lock = threading.Lock()
+_lists: OrderedDict[tuple, ChapterList] = OrderedDict()
+
+
+def _load(cur, novels_id: int, published_only: bool) -> ChapterList:
+    sql = """
+        SELECT chapters_id, chapter_no, title, status, created_at, updated_at
+        FROM chapters
+        WHERE novels_id = %s
+    """
+    if published_only:
+        sql += " AND status = 'published'"
+    cur.execute(sql, (novels_id,))
+    rows = cur.fetchall()
+    if rows and not isinstance(rows[0], dict):
+        cols = [d[0] for d in cur.description]
+        rows = [dict(zip(cols, r)) for r in rows]
+    return ChapterList(novels_id, rows)
+
+
+def get_chapter_list(cur, novels_id: int, published_only: bool = True, fresh: bool = False) -> ChapterList:
+    """fresh=True = ไม่ใช้ cache (โหลดใหม่แล้วเก็บแทนของเดิม) สำหรับผู้เขียนที่ต้องเห็นสิ่งที่เพิ่งแก้"""
+    key = (int(novels_id), bool(published_only))
+    with _lock:
+        cl = None if fresh else _lists.get(key)
+        if cl is not None and time.monotonic() - cl.loaded_at < CHAPTER_LIST_TTL:
+            _lists.move_to_end(key)
+            return cl
+    cl = _load(cur, novels_id, published_only)
+    with _lock:
+        _lists[key] = cl
+        _lists.move_to_end(key)
+        while len(_lists) > MAX_NOVELS:
+            _lists.popitem(last=False)
+    return cl
+
+
+def invalidate(novels_id: int) -> None:
+    """เรียกหลังเพิ่ม/แก้/ลบ/เปลี่ยนสถานะตอน (worker อื่นรอ TTL)"""
+    with _lock:
+        _lists.pop((int(novels_id), True), None)
+        _lists.pop((int(novels_id), False), None)
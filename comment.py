@@ -8,10 +8,11 @@ comment_bp = Blueprint(
     template_folder="templates"   # ใช้โฟลเดอร์ templates เดิมของโปรเจกต์
 )
 
-def _fetch_comments(novels_id=None, limit=20):
+def _fetch_comments(novels_id=None, limit=20, before=None):
     """
-    ดึงคอมเมนต์จากตาราง comments
+    ดึงคอมเมนต์จากตาราง comments (ใหม่→เก่า)
     - ถ้าระบุ novels_id จะ filter ตามเรื่อง
+    - ถ้าระบุ before (cm_id) จะดึงเฉพาะที่เก่ากว่านั้น (keyset แทน OFFSET)
     - แปลงผลลัพธ์เป็น list[dict] พร้อมชื่อคอลัมน์
     """
     conn = get_db_connection()
@@ -26,12 +27,18 @@ def _fetch_comments(novels_id=None, limit=20):
                     created_at
                 FROM comments
             """
+            where = []
             params = []
             if novels_id:
-                sql += " WHERE novels_id = %s"
+                where.append("novels_id = %s")
                 params.append(novels_id)
+            if before:
+                where.append("cm_id < %s")
+                params.append(before)
+            if where:
+                sql += " WHERE " + " AND ".join(where)
 
-            sql += " ORDER BY created_at DESC LIMIT %s"
+            sql += " ORDER BY cm_id DESC LIMIT %s"
             params.append(limit)
 
             cur.execute(sql, params)
@@ -61,8 +68,10 @@ def comments_page():
 
 
 # -------- Endpoint แบบ JSON (เผื่ออนาคตจะดึงด้วย JS) --------
+# หน้าถัดไป: ส่ง before = cm_id ของรายการสุดท้ายที่ได้รับ
 @comment_bp.route("/api/comments")
 def comments_api():
     novels_id = request.args.get("novels_id", type=int)
-    comments = _fetch_comments(novels_id=novels_id, limit=50)
+    before = request.args.get("before", type=int)
+    comments = _fetch_comments(novels_id=novels_id, limit=50, before=before)
     return jsonify(comments)
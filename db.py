@@ -5,6 +5,8 @@ from flask import current_app
 import os
 import MySQLdb, MySQLdb.cursors
 
+ER_DUP_KEYNAME = 1061
+
 # ---------------- Defaults & Config ----------------
 DEFAULTS = {
     "MYSQL_HOST": "127.0.0.1",
@@ -93,7 +95,13 @@ def init_db(app=None, schema_path="schema.sql", run_schema_if_exists=True):
                 statements = [s.strip() for s in sql.split(";") if s.strip()]
                 with conn.cursor() as cur:
                     for stmt in statements:
-                        cur.execute(stmt)
+                        try:
+                            cur.execute(stmt)
+                        except MySQLdb.OperationalError as e:
+                            # CREATE INDEX ของตารางเดิม (MySQL ไม่มี IF NOT EXISTS) → มี index นี้แล้ว ข้ามได้
+                            if e.args and e.args[0] == ER_DUP_KEYNAME:
+                                continue
+                            raise
                 conn.commit()
     return True
 
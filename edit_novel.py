@@ -10,6 +10,11 @@ from pathlib import Path
 import MySQLdb  # สำหรับ conn.ping(True)
 
 from db import get_db_connection
+from stats import bump_novel_counter, refresh_novel_and_writer
+from search_index import mark_novel_changed
+from chapter_index import mark_chapter_changed
+import chapter_list
+import prerender
 
 # ---------- CONFIG ----------
 ALLOWED_IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
@@ -128,17 +133,12 @@ def edit_novel(novels_id):
             cur.execute("SELECT tag_id, name FROM tags ORDER BY name")
             all_tags = dictfetchall(cur)
 
-            # ตอนทั้งหมด — ไม่ดึง content_html เพื่อลด payload
-            cur.execute(
-                """
-                SELECT chapters_id, title, chapter_no, status, created_at, updated_at
-                  FROM chapters
-                 WHERE novels_id = %s
-                 ORDER BY chapter_no ASC
-                """,
-                (novels_id,),
-            )
-            chapters = dictfetchall(cur)
+            # ตอน (ทุกสถานะ) โหลดสด (ผู้เขียนอาจเพิ่งแก้ผ่าน worker อื่น) — render แถวเฉพาะกลุ่มแรก
+            sort = request.args.get("sort", "asc")
+            if sort not in ("asc", "desc"):
+                sort = "asc"
+            chapters = chapter_list.get_chapter_list(cur, novels_id, published_only=False, fresh=True)
+            rows, _ = chapters.window(sort)
 
     return render_template(
         "edit_novel.html",
@@ -146,10 +146,29 @@ def edit_novel(novels_id):
         categories=categories,
         tags=tags,
         all_tags=all_tags,
-        chapters=chapters,
+        chapters=rows,
+        chapter_groups=chapters.groups(sort),
+        sort=sort,
     )
 
 
+@editnovel_bp.get("/<int:novels_id>/chapters/window")
+def chapters_window(novels_id):
+    """แถวตอนหนึ่งกลุ่ม (ถัดจาก cursor after) สำหรับ accordion ในหน้าแก้ไข"""
+    sort = request.args.get("sort", "asc")
+    if sort not in ("asc", "desc"):
+        sort = "asc"
+    with closing(_conn_alive()) as conn:
+        with conn.cursor() as cur:
+            chapters = chapter_list.get_chapter_list(cur, novels_id, published_only=False, fresh=True)
+    rows, next_after = chapters.window(sort, chapter_list.decode_key(request.args.get("after")))
+    return jsonify({
+        "ok": True,
+        "html": render_template("edit_chapter_rows.html", chapters=rows, novels_id=novels_id),
+        "next_after": next_after,
+    })
+
+
 @editnovel_bp.route("/<int:novels_id>", methods=["POST"])
 def update_novel(novels_id):
     """
@@ -216,6 +235,7 @@ def update_novel(novels_id):
                     """,
                     (title, description or None, cate_id, novels_id),
                 )
+            mark_novel_changed(cur, novels_id)
         conn.commit()
 
         # ลบไฟล์ปกเก่าหลัง commit สำเร็จ (ถ้ามีและอัปโหลดใหม่จริง)
@@ -251,7 +271,11 @@ def update_chapter_status(novels_id, chapter_id):
                 """,
                 (new_status, chapter_id, novels_id),
             )
+            if cur.rowcount:
+                mark_chapter_changed(cur, chapter_id)
         conn.commit()
+    chapter_list.invalidate(novels_id)
+    prerender.invalidate(novels_id)
 
     flash("อัปเดตสถานะตอนเรียบร้อยแล้ว", "success")
     return redirect(url_for("editnovel.edit_novel", novels_id=novels_id))
@@ -263,7 +287,7 @@ def delete_novel_page(novels_id):
     with closing(_conn_alive()) as conn:
         # เอาไว้ลบไฟล์ปกด้วย
         with conn.cursor() as cur:
-            cur.execute("SELECT cover FROM novels WHERE novels_id=%s", (novels_id,))
+            cur.execute("SELECT cover, users_id FROM novels WHERE novels_id=%s", (novels_id,))
             row = dictfetchone(cur)
             if not row:
                 abort(404)
@@ -271,6 +295,8 @@ def delete_novel_page(novels_id):
 
             # ถ้า schema ตั้ง FK ON DELETE CASCADE ตารางลูกจะถูกลบให้อัตโนมัติ
             cur.execute("DELETE FROM novels WHERE novels_id=%s", (novels_id,))
+            refresh_novel_and_writer(cur, novels_id, row.get("users_id"))
+            mark_novel_changed(cur, novels_id)
         conn.commit()
 
     # ลบไฟล์ปกถ้ามี
@@ -304,7 +330,12 @@ def delete_chapter_page(novels_id, chapter_id):
                 "DELETE FROM chapters WHERE chapters_id=%s AND novels_id=%s",
                 (chapter_id, novels_id),
             )
+            # หัวใจของตอนถูกลบตามไปด้วย → คำนวณตัวนับของเรื่องนี้ใหม่
+            refresh_novel_and_writer(cur, novels_id)
+            mark_chapter_changed(cur, chapter_id)
         conn.commit()
+    chapter_list.invalidate(novels_id)
+    prerender.invalidate(novels_id)
 
     flash("ลบตอนเรียบร้อยแล้ว", "success")
     return redirect(url_for("editnovel.edit_novel", novels_id=novels_id))
@@ -347,6 +378,7 @@ def add_tag(novels_id):
 
             cur.execute("SELECT tag_id, name FROM tags WHERE tag_id=%s", (tag_id,))
             tag = dictfetchone(cur)
+            mark_novel_changed(cur, novels_id)
 
         conn.commit()
     # 200 (มีอยู่แล้ว) / 201 (เพิ่งผูกครั้งแรก) ก็ใช้งานได้เหมือนกัน; ส่ง 200 ไว้เรียบง่าย
@@ -362,6 +394,7 @@ def remove_tag(novels_id, tag_id):
                 "DELETE FROM novels_tags WHERE novels_id=%s AND tag_id=%s",
                 (novels_id, tag_id),
             )
+            mark_novel_changed(cur, novels_id)
         conn.commit()
     return jsonify({"ok": True}), 200
 
@@ -400,6 +433,8 @@ def create_chapter(novels_id):
                 (novels_id, title, content_html, next_no),
             )
             new_id = getattr(cur, "lastrowid", None)
+            bump_novel_counter(cur, novels_id, "chapters", 1)
+            mark_chapter_changed(cur, new_id)
 
             cur.execute(
                 """
@@ -412,6 +447,8 @@ def create_chapter(novels_id):
             row = dictfetchone(cur)
 
         conn.commit()
+    chapter_list.invalidate(novels_id)
+    prerender.invalidate(novels_id)
     return jsonify(row), 200
 
 
@@ -441,10 +478,11 @@ def update_chapter(chapter_id):
     with closing(_conn_alive()) as conn:
         with conn.cursor() as cur:
             cur.execute(
-                "SELECT chapters_id FROM chapters WHERE chapters_id=%s",
+                "SELECT chapters_id, novels_id FROM chapters WHERE chapters_id=%s",
                 (chapter_id,),
             )
-            if not dictfetchone(cur):
+            found = dictfetchone(cur)
+            if not found:
                 return _json_error("not found", 404)
 
             # แก้ไข title / content พร้อมบังคับกลับเป็น draft
@@ -458,7 +496,10 @@ def update_chapter(chapter_id):
                 """,
                 (title, content_html, chapter_id),
             )
+            mark_chapter_changed(cur, chapter_id)
         conn.commit()
+    chapter_list.invalidate(found["novels_id"])
+    prerender.invalidate(found["novels_id"])
 
     return jsonify({"ok": True}), 200
 
@@ -469,14 +510,19 @@ def delete_chapter(chapter_id):
     with closing(_conn_alive()) as conn:
         with conn.cursor() as cur:
             cur.execute(
-                "SELECT chapters_id FROM chapters WHERE chapters_id=%s",
+                "SELECT chapters_id, novels_id FROM chapters WHERE chapters_id=%s",
                 (chapter_id,),
             )
-            if not dictfetchone(cur):
+            row = dictfetchone(cur)
+            if not row:
                 return _json_error("not found", 404)
 
             cur.execute("DELETE FROM chapters WHERE chapters_id=%s", (chapter_id,))
+            refresh_novel_and_writer(cur, row["novels_id"])
+            mark_chapter_changed(cur, chapter_id)
         conn.commit()
+    chapter_list.invalidate(row["novels_id"])
+    prerender.invalidate(row["novels_id"])
     return jsonify({"ok": True}), 200
 
 
@@ -485,12 +531,14 @@ def delete_novel(novels_id):
     with closing(_conn_alive()) as conn:
         # มี/ไม่มีนิยายนี้?
         with conn.cursor() as cur:
-            cur.execute("SELECT novels_id FROM novels WHERE novels_id=%s", (novels_id,))
+            cur.execute("SELECT novels_id, users_id FROM novels WHERE novels_id=%s", (novels_id,))
             row = dictfetchone(cur)
             if not row:
                 return _json_error("not found", 404)
 
             # ถ้า schema ตั้ง FK ON DELETE CASCADE ตารางลูกจะถูกลบให้อัตโนมัติ
             cur.execute("DELETE FROM novels WHERE novels_id=%s", (novels_id,))
+            refresh_novel_and_writer(cur, novels_id, row.get("users_id"))
+            mark_novel_changed(cur, novels_id)
         conn.commit()
     return jsonify({"ok": True}), 200
@@ -0,0 +1,123 @@
+# extractive.py
+"""
+สรุปความคิดเห็นแบบ extractive (ไม่ต่อเน็ต ไม่เรียกโมเดล) — เลือกคอมเมนต์ตัวแทน 3-5 อันจากของจริง
+
+- ตัดคำด้วย textseg แล้วทำ TF-IDF ต่อคอมเมนต์ (MAX_FEATURES คำที่พบบ่อยที่สุด)
+- similarity = X · Xᵀ (NumPy) → centrality แบบ LexRank (power iteration บนกราฟ similarity)
+- เลือกทีละอันตาม centrality ข้ามอันที่ซ้ำกับที่เลือกไปแล้วเกิน MAX_OVERLAP (ได้หลายประเด็น)
+- ใช้แค่ MAX_COMMENTS อันล่าสุด → 500 คอมเมนต์ใช้เวลาหลักสิบมิลลิวินาที
+
+ผลขึ้นต้นด้วย HEADER เสมอ (summarizer.is_extractive ใช้แยกจากสรุปของโมเดล)
+"""
+from __future__ import annotations
+
+import textseg
+
+try:
+    import numpy as np
+except ImportError:  # ไม่มี numpy → เลือกคอมเมนต์ยาวที่ไม่ซ้ำกันแทน
+    np = None
+
+HEADER = "ความคิดเห็นเด่นจากผู้อ่าน:"
+MAX_COMMENTS = 500
+MIN_PICK = 3
+MAX_PICK = 5
+LINE_MAX_CHARS = 160
+MIN_CHARS = 8               # คอมเมนต์สั้นกว่านี้ ("สนุก", "รอ") ไม่ใช้เป็นตัวแทน
+MAX_OVERLAP = 0.5
+DAMPING = 0.85
+ITERATIONS = 30
+MAX_FEATURES = 2000
+FEATURE_CHARS = 300         # ใช้แค่ต้นคอมเมนต์ยาว ๆ ในการตัดคำ (ตัดคำเป็นส่วนที่ช้าที่สุด)
+
+
+def _features(text: str) -> list[str]:
+    return [w for w in textseg.words(text[:FEATURE_CHARS]) if len(w) > 1]
+
+
+def _tfidf(docs: list[list[str]]):
+    """TF-IDF แบบ dense แถวละคอมเมนต์ (เก็บแค่ MAX_FEATURES คำที่พบในหลายคอมเมนต์ที่สุด → matrix เล็กคงที่)"""
+    df: dict[str, int] = {}
+    for toks in docs:
+        for t in set(toks):
+            df[t] = df.get(t, 0) + 1
+    top = sorted(df, key=df.__getitem__, reverse=True)[:MAX_FEATURES]
+    vocab = {t: j for j, t in enumerate(top)}
+    pairs = [(i, vocab[t]) for i, toks in enumerate(docs) for t in toks if t in vocab]
+    x = np.zeros((len(docs), max(len(vocab), 1)), dtype=np.float32)
+    if pairs:
+        ij = np.asarray(pairs, dtype=np.int64)
+        np.add.at(x, (ij[:, 0], ij[:, 1]), 1.0)
+    dfv = (x > 0).sum(axis=0)
+    idf = np.log((1.0 + len(docs)) / (1.0 + dfv)) + 1.0
+    x = np.where(x > 0, 1.0 + np.log(np.maximum(x, 1.0)), 0.0) * idf
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (x / norms).astype(np.float32)
+
+
+def _centrality(sim) -> "np.ndarray":
+    """LexRank แบบต่อเนื่อง: random walk บนกราฟที่น้ำหนัก = cosine"""
+    n = sim.shape[0]
+    w = sim.copy()
+    np.fill_diagonal(w, 0.0)
+    deg = w.sum(axis=1, keepdims=True)
+    deg[deg == 0] = 1.0
+    p = w / deg
+    score = np.full(n, 1.0 / n, dtype=np.float32)
+    for _ in range(ITERATIONS):
+        score = (1.0 - DAMPING) / n + DAMPING * (p.T @ score)
+    return score
+
+
+def pick(texts: list[str], k: int) -> list[int]:
+    """index ของคอมเมนต์ตัวแทน k อัน (เรียงตามลำดับเดิม)"""
+    if np is None:
+        chosen: list[int] = []
+        seen: set[str] = set()
+        for i in sorted(range(len(texts)), key=lambda i: -len(texts[i])):
+            key = textseg.normalize(texts[i])[:40]
+            if key not in seen:
+                seen.add(key)
+                chosen.append(i)
+            if len(chosen) >= k:
+                break
+        return sorted(chosen)
+
+    x = _tfidf([_features(t) for t in texts])
+    sim = x @ x.T
+    order = np.argsort(-_centrality(sim), kind="stable")
+    chosen = []
+    for i in order:
+        if all(sim[i, j] < MAX_OVERLAP for j in chosen):
+            chosen.append(int(i))
+            if len(chosen) >= k:
+                break
+    # คอมเมนต์น้อย/คล้ายกันหมด → เติมตาม centrality ให้ครบอย่างน้อย MIN_PICK
+    for i in order:
+        if len(chosen) >= min(k, MIN_PICK):
+            break
+        if int(i) not in chosen:
+            chosen.append(int(i))
+    return sorted(chosen)
+
+
+def summarize(comments, max_comments: int = MAX_COMMENTS) -> str:
+    """
+    comments = list ของ dict ที่มี content (เรียงเก่า → ใหม่) คืนข้อความ HEADER + บรรทัดละคอมเมนต์
+    หรือ "" ถ้าไม่มีคอมเมนต์ที่ยาวพอ
+    """
+    texts = []
+    for c in list(comments)[-max_comments:]:
+        t = " ".join(str(c.get("content") or "").split())
+        if len(t) >= MIN_CHARS:
+            texts.append(t)
+    if not texts:
+        return ""
+    k = max(MIN_PICK, min(MAX_PICK, int(len(texts) ** 0.5)))
+    idx = pick(texts, min(k, len(texts)))
+    lines = []
+    for i in idx:
+        t = texts[i]
+        lines.append("- " + (t[:LINE_MAX_CHARS] + "..." if len(t) > LINE_MAX_CHARS else t))
+    return HEADER + "\n" + "\n".join(lines)
@@ -1,6 +1,8 @@
 from flask import Blueprint, render_template, abort, url_for, g, request, jsonify
 from MySQLdb.cursors import DictCursor
 from db import get_db_connection
+from stats import load_novel_counters
+from search_index import mark_novel_changed
 import os
 
 mywrite_bp = Blueprint('mywrite', __name__, template_folder='templates')
@@ -44,13 +46,7 @@ def mywrite_index():
                   n.novels_id, n.title, n.status, n.cover,
                   COALESCE(n.updated_at, n.created_at) AS edited_at,
                   c.name AS category_name,
-                  u.username AS author_username,
-
-                  (SELECT COUNT(*) FROM chapters ch WHERE ch.novels_id = n.novels_id) AS chapters_count,
-                  (SELECT COUNT(DISTINCT rh.users_id) FROM reading_history rh WHERE rh.novels_id = n.novels_id) AS readers_count,
-                  (SELECT COUNT(*) FROM comments cm WHERE cm.novels_id = n.novels_id) AS comments_count,
-                  (SELECT COUNT(*) FROM bookshelf b WHERE b.novels_id = n.novels_id) AS favorites_count
-
+                  u.username AS author_username
                 FROM novels n
                 LEFT JOIN categories c ON c.cate_id = n.cate_id
                 LEFT JOIN users u      ON u.users_id = n.users_id
@@ -62,8 +58,17 @@ def mywrite_index():
             cur.execute(sql, params)
             rows = cur.fetchall()
 
+            # ตัวเลขของทุกเรื่องโหลดรวดเดียว (novel_counters หรือ GROUP BY ต่อ metric)
+            # แทน subquery 4 ตัวต่อแถว
+            counts = load_novel_counters(
+                cur,
+                [r["novels_id"] for r in rows],
+                metrics=("chapters", "readers", "comments", "bookshelf"),
+            )
+
         works = []
         for r in rows:
+            cnt = counts.get(r["novels_id"], {})
             works.append({
                 "novels_id": r["novels_id"],
                 "title": r["title"] or "(ไม่มีชื่อเรื่อง)",
@@ -71,10 +76,10 @@ def mywrite_index():
                 "cover_url": _cover_url(r.get("cover")),
                 "category_name": r.get("category_name") or "ไม่ระบุหมวด",
                 "author_username": r.get("author_username") or "—",
-                "chapters": int(r.get("chapters_count") or 0),
-                "views": int(r.get("readers_count") or 0),
-                "comments": int(r.get("comments_count") or 0),
-                "favorites": int(r.get("favorites_count") or 0),
+                "chapters": cnt.get("chapters", 0),
+                "views": cnt.get("readers", 0),
+                "comments": cnt.get("comments", 0),
+                "favorites": cnt.get("bookshelf", 0),
                 "edited_at": r.get("edited_at"),
                 "detail_url": _detail_url(r["novels_id"]),
             })
@@ -112,6 +117,7 @@ def mywrite_update_status(novel_id: int):
             if cur.rowcount == 0:
                 # ไม่ใช่เจ้าของงานเขียนหรือไม่พบงานเขียน
                 return jsonify(ok=False, error="not_found_or_forbidden"), 404
+            mark_novel_changed(cur, novel_id)
         conn.commit()
 
         return jsonify(ok=True, status=new_status)
@@ -12,6 +12,8 @@ from datetime import datetime
 import MySQLdb  # สำหรับ conn.ping(True)
 
 from db import get_db_connection
+from stats import refresh_novel_and_writer
+from search_index import mark_novel_changed
 
 # ---------- CONFIG ----------
 ALLOWED_IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
@@ -240,6 +242,10 @@ def api_create_novel():
                         (novels_id, tag_id),
                     )
 
+                # สร้างแถวตัวนับของเรื่องใหม่ + อัปเดตจำนวนผลงานของผู้เขียน
+                refresh_novel_and_writer(cur, novels_id, users_id)
+                mark_novel_changed(cur, novels_id)
+
             conn.commit()
 
         except Exception as e:
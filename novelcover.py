@@ -1,9 +1,21 @@
 # novelcover.py
+from __future__ import annotations
+
+import json
+from contextlib import closing
+from dataclasses import dataclass, field
+from datetime import datetime
+
 from flask import Blueprint, render_template, abort, url_for, request, redirect, session, flash, g, jsonify
 from MySQLdb.cursors import DictCursor
 from db import get_db_connection
-from flask import current_app
-from openai import OpenAI
+from stats import bump_novel_counter, bump_novel_rating
+import chapter_list
+import prerender
+from ratelimit import rate_limited
+import user_state
+import summarizer
+import summary_jobs
 import os
 
 novel_bp = Blueprint("novel", __name__, template_folder="./templates")
@@ -83,22 +95,6 @@ def _normalize_status(raw: str | None) -> str:
     return "completed" if raw in {"completed", "จบแล้ว", "done", "finished", "finish"} else "ongoing"
 
 
-def _user_profile_parts(cur):
-    """
-    คืน select username + avatar (pfpic) + join users สำหรับ comments
-
-    โครง users:
-      users_id, username, pfpic, ...
-    """
-    if not _has_table(cur, "users"):
-        return ("NULL AS username", "NULL AS profile_image", "")
-
-    sel_username = "u.username AS username"
-    sel_avatar = "u.pfpic AS profile_image"
-    join_clause = "LEFT JOIN users u ON u.users_id = c.users_id"
-    return (sel_username, sel_avatar, join_clause)
-
-
 def _process_avatar_url(raw: str | None) -> str | None:
     """แปลงค่า pfpic ใน DB ให้เป็น URL ใช้แสดงรูปโปรไฟล์"""
     if not raw:
@@ -155,112 +151,258 @@ def _is_novel_owner(cur, users_id: int | None, novels_id: int) -> bool:
 
 
 
-def generate_comment_summary(base_summary, comments, novel_title: str = "") -> str:
-    """
-    เรียก OpenAI API เพื่อสรุปความคิดเห็นผู้อ่านของนิยายเรื่องหนึ่งจริง ๆ
-    - base_summary = สรุปเดิม (ถ้าเคยสรุปแล้ว)
-    - comments = list ของคอมเมนต์ใหม่ที่ยังไม่เคยถูกสรุป
-    - novel_title = ชื่อเรื่อง (เอาไว้ช่วยให้ model รู้ context)
-    """
-
-    # ถ้าไม่มีคอมเมนต์ใหม่เลย แต่มีสรุปเดิมอยู่แล้ว → ส่งสรุปเดิมกลับ
-    if (not comments) and base_summary:
-        return base_summary
-
-    # ดึง client จาก app.config (เราตั้งไว้ใน app.py แล้ว)
-    client: OpenAI = current_app.config.get("OPENAI_CLIENT")
-    if client is None:
-        fallback = "ไม่สามารถเรียกใช้โมเดล AI ได้ (ยังไม่ได้ตั้งค่า OPENAI_CLIENT ใน app.py)"
-        return base_summary + "\n\n" + fallback if base_summary else fallback
-
-    # รวมข้อความคอมเมนต์ใหม่เป็น list
-    comment_items = []
-    for c in comments:
-        text = str(c.get("content") or "").strip()
-        if not text:
-            continue
-        # กันคอมเมนต์ยาวเกินไป
-        if len(text) > 400:
-            text = text[:400] + "..."
-        comment_items.append(f"- {text}")
-
-    if not comment_items and base_summary:
-        return base_summary
-    elif not comment_items:
-        return base_summary or "ยังไม่มีความคิดเห็นจากผู้อ่านเพียงพอสำหรับการสรุป"
-
-    comments_block = "\n".join(comment_items)
-
-    # ใช้ instructions (ภาษาอังกฤษ) + input (มีไทยได้เต็ม ๆ)
-    # เพื่อลดโอกาสเจอ bug encoding แปลก ๆ
-    instructions = (
-        "You are an assistant that summarizes reader comments for an online novel. "
-        "You can read Thai and English comments and you must answer in Thai. "
-        "Summarize the key sentiments (what readers like, dislike, and suggestions) "
-        "into 3-5 concise bullet-style lines in Thai."
-    )
-
-    if novel_title:
-        title_part = f"นิยายเรื่อง: {novel_title}\n"
-    else:
-        title_part = ""
-
-    if base_summary:
-        user_prompt = (
-            f"{title_part}"
-            "นี่คือสรุปเดิมจากความคิดเห็นก่อนหน้า:\n"
-            f"{base_summary}\n\n"
-            "และนี่คือความคิดเห็นใหม่ที่เพิ่งเพิ่มเข้ามา:\n"
-            f"{comments_block}\n\n"
-            "โปรดสร้างสรุปฉบับอัปเดตที่รวมทั้งสรุปเดิมและความคิดเห็นใหม่ "
-            "ให้ตอบเป็นภาษาไทยเท่านั้น แบ่งบรรทัดให้อ่านง่าย"
-        )
-    else:
-        user_prompt = (
-            f"{title_part}"
-            "นี่คือความคิดเห็นจากผู้อ่านนิยายเรื่องนี้:\n"
-            f"{comments_block}\n\n"
-            "โปรดสรุปความคิดเห็นของผู้อ่านจากข้อความทั้งหมดด้านบน "
-            "ให้เป็นภาษาไทยสั้น ๆ แบ่งเป็นหลายบรรทัดอ่านง่าย"
-        )
+# ---------- detail loader (หน้า /novel/<novels_id>) ----------
+# cache ว่าง (cold) ใช้ 5 statement: หัวเรื่อง+แท็ก+ตัวเลข+เรื่องที่คล้ายกัน / สถานะของผู้ใช้ (user_state)
+# / ดัชนีรายการตอน (chapter_list) / หัวใจของตอนกลุ่มแรก / คอมเมนต์หน้าแรก
+# cache อุ่นแล้วเหลือ 3 (user_state กับ chapter_list มาจากหน่วยความจำ, ผู้ไม่ล็อกอินไม่มี user_state)
+# ตัวเลขอ่านจาก novel_counters (อัปเดตตอนมี event เขียนอยู่แล้ว) แทนการ COUNT สดทีละตาราง
+
+@dataclass
+class TagItem:
+    tag_id: int
+    tag_name: str
+
+
+@dataclass
+class ChapterItem:
+    chapters_id: int
+    chapter_no: int
+    title: str | None
+    created_at: datetime | None
+    like_count: int = 0
+    is_liked: bool = False
+
+
+@dataclass
+class CommentItem:
+    cm_id: int
+    users_id: int
+    content: str
+    created_at: datetime | None
+    username: str | None
+    avatar_url: str | None
+    can_delete: bool = False
+
+
+@dataclass
+class RelatedItem:
+    novels_id: int
+    title: str
+    cover_url: str
+
+
+@dataclass
+class NovelDetail:
+    novels_id: int
+    title: str
+    description: str | None
+    status: str                 # completed / ongoing
+    raw_status: str | None      # ค่าจริงใน novels.status (prerender ใช้เช็คว่าเผยแพร่แล้ว)
+    cover_url: str
+    updated_at: datetime | None
+    cate_id: int | None
+    category_name: str | None
+    writer_id: int | None
+    writer_name: str | None
+    in_bookshelf: bool = False
+    total_favorites: int = 0
+    avg_rating: float = 0.0
+    rating_count: int = 0
+    user_rating: int = 0
+    total_readers: int = 0
+    total_chapters: int = 0
+    tags: list[TagItem] = field(default_factory=list)
+    chapters: list[ChapterItem] = field(default_factory=list)
+    comments: list[CommentItem] = field(default_factory=list)
+    comments_before: int | None = None      # cm_id สำหรับโหลดคอมเมนต์เก่ากว่านี้ (None = หมดแล้ว)
+    chapter_groups: list[dict] = field(default_factory=list)    # หัวกลุ่มทั้งหมด (chapter_list.groups)
+    chapters_next: str | None = None        # cursor ของกลุ่มถัดจากกลุ่มแรก
+    related: list[RelatedItem] = field(default_factory=list)
+
+
+NOVEL_DETAIL_SQL = """
+    SELECT
+        n.novels_id, n.title, n.description, n.status, n.cover, n.updated_at, n.cate_id,
+        c.name     AS category_name,
+        u.users_id AS writer_id,
+        u.username AS writer_name,
+        COALESCE(nc.bookshelf, 0)    AS total_favorites,
+        COALESCE(nc.readers, 0)      AS total_readers,
+        COALESCE(nc.rating_count, 0) AS rating_count,
+        COALESCE(nc.rating_sum, 0)   AS rating_sum,
+        (
+            SELECT JSON_ARRAYAGG(JSON_OBJECT('tag_id', nt.tag_id, 'tag_name', t.name))
+            FROM novels_tags nt
+            JOIN tags t ON t.tag_id = nt.tag_id
+            WHERE nt.novels_id = n.novels_id
+        ) AS tags_json,
+        (
+            SELECT JSON_ARRAYAGG(JSON_OBJECT(
+                       'rank_no', r.rank_no, 'novels_id', rn.novels_id,
+                       'title', rn.title, 'cover', rn.cover))
+            FROM novel_related r
+            JOIN novels rn ON rn.novels_id = r.related_id
+            WHERE r.novels_id = n.novels_id
+              AND rn.status IN ('เผยแพร่', 'จบแล้ว')
+        ) AS related_json
+    FROM novels n
+    LEFT JOIN categories c      ON c.cate_id = n.cate_id
+    LEFT JOIN users u           ON u.users_id = n.users_id
+    LEFT JOIN novel_counters nc ON nc.novels_id = n.novels_id
+    WHERE n.novels_id = %s
+"""
+
+
+def _json_list(raw) -> list:
+    if not raw:
+        return []
+    if isinstance(raw, (bytes, bytearray)):
+        raw = raw.decode("utf-8")
+    return json.loads(raw) if isinstance(raw, str) else list(raw)
 
-    try:
-        # ใช้รูปแบบเรียกตาม docs: instructions + input (string เดียว)
-        # ตัวอย่างจากเอกสาร:
-        #   client.responses.create(model="gpt-4o-mini", instructions="...", input="...")
-        # อ้างอิง: GitHub openai-python :contentReference[oaicite:0]{index=0}
-        response = client.responses.create(
-            model="gpt-4o-mini",  # หรือรุ่นอื่นที่คุณมีสิทธิ์ใช้ เช่น gpt-4.1-mini
-            instructions=instructions,
-            input=user_prompt,
-        )
 
-        # ไลบรารีใหม่จะมี helper ชื่อ output_text สำหรับ text ล้วน
-        summary_text = (getattr(response, "output_text", None) or "").strip()
+COMMENTS_PAGE_SIZE = 20
+COMMENTS_MAX_PAGE_SIZE = 50
 
-        # กันเคสที่ output_text ไม่มี (เผื่อใช้เวอร์ชันอื่น)
-        if not summary_text and hasattr(response, "output"):
-            try:
-                summary_text = response.output[0].content[0].text.strip()
-            except Exception:
-                pass
 
-        if not summary_text:
-            return base_summary or "ไม่สามารถสร้างสรุปความคิดเห็นได้ในขณะนี้"
+def load_comments(cur, novels_id: int, uid: int | None, writer_id: int | None,
+                  before: int | None = None, limit: int = COMMENTS_PAGE_SIZE):
+    """
+    คอมเมนต์ใหม่→เก่าทีละหน้าแบบ keyset (cm_id < before แทน OFFSET)
+    ใช้ index ของ comments.novels_id (InnoDB ต่อ cm_id ท้าย index ให้อยู่แล้ว)
+    คืน (list[CommentItem], cm_id สำหรับหน้าถัดไป หรือ None ถ้าหมดแล้ว)
+    """
+    sql = """
+        SELECT c.cm_id, c.users_id, c.content, c.created_at,
+               u.username, u.pfpic AS profile_image
+        FROM comments c
+        LEFT JOIN users u ON u.users_id = c.users_id
+        WHERE c.novels_id = %s
+    """
+    params: list = [novels_id]
+    if before:
+        sql += " AND c.cm_id < %s"
+        params.append(before)
+    sql += " ORDER BY c.cm_id DESC LIMIT %s"
+    params.append(limit + 1)
+    cur.execute(sql, params)
+    rows = list(cur.fetchall())
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    is_owner = bool(uid and writer_id and int(writer_id) == int(uid))
+    items = [
+        CommentItem(
+            cm_id=cm["cm_id"],
+            users_id=cm["users_id"],
+            content=cm["content"],
+            created_at=cm["created_at"],
+            username=cm["username"],
+            avatar_url=_process_avatar_url(cm.get("profile_image")),
+            can_delete=bool(uid and (uid == cm["users_id"] or is_owner)),
+        )
+        for cm in rows
+    ]
+    return items, (items[-1].cm_id if has_more else None)
+
+
+def chapter_items(cur, rows, state) -> list[ChapterItem]:
+    """แถวจาก chapter_list → ChapterItem พร้อมจำนวนหัวใจ (นับเฉพาะตอนในหน้านี้ด้วย query เดียว)"""
+    if not rows:
+        return []
+    ids = [r["chapters_id"] for r in rows]
+    cur.execute(
+        f"""
+        SELECT chapters_id, COUNT(*) AS c
+        FROM chapter_likes
+        WHERE chapters_id IN ({', '.join(['%s'] * len(ids))})
+        GROUP BY chapters_id
+        """,
+        ids,
+    )
+    likes = {r["chapters_id"]: int(r["c"] or 0) for r in cur.fetchall()}
+    return [
+        ChapterItem(
+            chapters_id=r["chapters_id"],
+            chapter_no=r["chapter_no"],
+            title=r["title"],
+            created_at=r["created_at"],
+            like_count=likes.get(r["chapters_id"], 0),
+            is_liked=state.is_liked(r["chapters_id"]),
+        )
+        for r in rows
+    ]
 
-        return summary_text
 
-    except Exception as e:
-        # log แบบไม่ไปชน encoding error (ใช้ repr)
-        print("[generate_comment_summary] OpenAI error type:", type(e), "detail:", repr(e))
-        fallback = "ไม่สามารถติดต่อบริการสรุปด้วย AI ได้ในขณะนี้ โปรดลองใหม่อีกครั้งภายหลัง"
-        return base_summary + "\n\n" + fallback if base_summary else fallback
+def load_novel_detail(cur, novels_id: int, uid: int | None, sort: str = "asc") -> NovelDetail | None:
+    """โหลดข้อมูลทั้งหมดของหน้า novel cover (None ถ้าไม่มีนิยายเรื่องนี้)"""
+    cur.execute(NOVEL_DETAIL_SQL, (novels_id,))
+    row = cur.fetchone()
+    if not row:
+        return None
 
+    rating_count = int(row["rating_count"] or 0)
+    state = user_state.get_novel_state(cur, uid, novels_id)
+    detail = NovelDetail(
+        novels_id=row["novels_id"],
+        title=row["title"],
+        description=row["description"],
+        status=_normalize_status(row.get("status")),
+        raw_status=row.get("status"),
+        cover_url=_process_cover_url(row.get("cover")),
+        updated_at=row["updated_at"],
+        cate_id=row["cate_id"],
+        category_name=row["category_name"],
+        writer_id=row["writer_id"],
+        writer_name=row["writer_name"],
+        in_bookshelf=state.in_bookshelf,
+        total_favorites=int(row["total_favorites"] or 0),
+        avg_rating=float(row["rating_sum"] or 0) / rating_count if rating_count else 0.0,
+        rating_count=rating_count,
+        user_rating=state.rating,
+        total_readers=int(row["total_readers"] or 0),
+    )
+    detail.tags = sorted(
+        (TagItem(int(t["tag_id"]), t.get("tag_name") or f"แท็ก {t['tag_id']}") for t in _json_list(row["tags_json"])),
+        key=lambda t: t.tag_name,
+    )
+    detail.related = [
+        RelatedItem(int(r["novels_id"]), r["title"], _process_cover_url(r.get("cover")))
+        for r in sorted(_json_list(row["related_json"]), key=lambda r: r["rank_no"])
+    ]
+
+    # ---------- chapters: กลุ่มแรกจากดัชนีรายการตอน (กลุ่มอื่นโหลดผ่าน novel.chapters_page) ----------
+    chapters = chapter_list.get_chapter_list(cur, novels_id)
+    rows, detail.chapters_next = chapters.window(sort)
+    detail.chapters = chapter_items(cur, rows, state)
+    detail.chapter_groups = chapters.groups(sort)
+    detail.total_chapters = len(chapters)
+
+    # ---------- comments หน้าแรก (ที่เหลือโหลดตอนเลื่อนผ่าน novel.comments_page) ----------
+    detail.comments, detail.comments_before = load_comments(
+        cur, novels_id, uid, detail.writer_id, limit=COMMENTS_PAGE_SIZE
+    )
+    return detail
+
+
+def render_detail_page(detail: NovelDetail, sort: str = "asc", **ctx) -> str:
+    """render novelcover.html (ctx เพิ่มเติม เช่น csrf_token / prerendered ใช้ตอนสร้างหน้าสำเร็จรูป)"""
+    return render_template(
+        "novelcover.html",
+        novel=detail,
+        chapters=detail.chapters,
+        novel_tags=detail.tags,
+        comments=detail.comments,
+        related=detail.related,
+        sort=sort,
+        **ctx,
+    )
 
 
 # ---------- route main: /novel/<novels_id> ----------
 
 @novel_bp.route("/novel/<int:novels_id>", methods=["GET", "POST"])
+@rate_limited("comment")
 def detail(novels_id: int):
     # เช็คว่าเป็น AJAX comment หรือไม่ (ใช้กับ JS fetch)
     is_ajax_comment = (
@@ -268,6 +410,12 @@ def detail(novels_id: int):
         and request.headers.get("X-Requested-With", "").lower() == "xmlhttprequest"
     )
 
+    # ผู้ไม่ล็อกอิน → หน้าสำเร็จรูปบนดิสก์ (ไม่แตะ DB)
+    if prerender.can_serve():
+        resp = prerender.serve(novels_id)
+        if resp is not None:
+            return resp
+
     try:
         conn = get_db_connection()
         with conn.cursor(DictCursor) as cur:
@@ -297,13 +445,6 @@ def detail(novels_id: int):
                     flash(msg, "error")
                     return redirect(url_for("novel.detail", novels_id=novels_id))
 
-                if not _has_table(cur, "comments"):
-                    msg = "ไม่พบตาราง comments ในฐานข้อมูล"
-                    if is_ajax_comment:
-                        return jsonify({"ok": False, "error": msg}), 500
-                    flash(msg, "error")
-                    return redirect(url_for("novel.detail", novels_id=novels_id))
-
                 # บันทึก comment
                 cur.execute(
                     """
@@ -313,34 +454,37 @@ def detail(novels_id: int):
                     (users_id, novels_id, content),
                 )
                 new_cm_id = cur.lastrowid
+                bump_novel_counter(cur, novels_id, "comments", 1)
 
-                # ทำให้ summary เป็น dirty (ให้ไปสรุปใหม่)
-                if _has_table(cur, "comment_summaries"):
-                    cur.execute(
-                        """
-                        INSERT INTO comment_summaries (novels_id, summary_text, last_cm_id, dirty)
-                        VALUES (%s, NULL, NULL, 1)
-                        ON DUPLICATE KEY UPDATE dirty = 1
-                        """,
-                        (novels_id,),
-                    )
+                # ทำให้ summary เป็น dirty (ให้ไปสรุปใหม่) — ตารางสร้างจาก schema.sql แล้ว
+                cur.execute(
+                    """
+                    INSERT INTO comment_summaries (novels_id, summary_text, last_cm_id, dirty)
+                    VALUES (%s, NULL, NULL, 1)
+                    ON DUPLICATE KEY UPDATE dirty = 1
+                    """,
+                    (novels_id,),
+                )
 
                 conn.commit()
+                prerender.invalidate(novels_id)
 
                 # ----- ถ้าเป็น AJAX → ส่ง JSON กลับ -----
                 if is_ajax_comment:
-                    sel_username, sel_avatar, join_users = _user_profile_parts(cur)
+                    # join เดียวกับ load_comments + เจ้าของเรื่องจาก novels (ไม่ต้อง DESCRIBE ตาราง)
                     cur.execute(
-                        f"""
+                        """
                         SELECT c.cm_id,
                                c.users_id,
                                c.novels_id,
                                c.content,
                                c.created_at,
-                               {sel_username},
-                               {sel_avatar}
+                               u.username,
+                               u.pfpic AS profile_image,
+                               n.users_id AS writer_id
                         FROM comments c
-                        {join_users}
+                        LEFT JOIN users u ON u.users_id = c.users_id
+                        LEFT JOIN novels n ON n.novels_id = c.novels_id
                         WHERE c.cm_id = %s
                         LIMIT 1
                         """,
@@ -358,7 +502,8 @@ def detail(novels_id: int):
 
                     cm["avatar_url"] = _process_avatar_url(cm.get("profile_image"))
                     current_uid = users_id
-                    is_owner = _is_novel_owner(cur, current_uid, novels_id)
+                    writer_id = cm.get("writer_id")
+                    is_owner = bool(writer_id and int(writer_id) == int(current_uid))
                     can_delete = bool(
                         current_uid
                         and (current_uid == cm.get("users_id") or is_owner)
@@ -396,296 +541,113 @@ def detail(novels_id: int):
             sort = request.args.get("sort", "asc")
             if sort not in ("asc", "desc"):
                 sort = "asc"
-            order_dir = "ASC" if sort == "asc" else "DESC"
-
-            novel_tags = []
-
-            # ---------- โหลดข้อมูลนิยาย ----------
-            sel_writer, join_writer = _writer_sql_parts(cur)
-            cur.execute(
-                f"""
-                SELECT
-                    n.novels_id,
-                    n.title,
-                    n.description,
-                    n.status,
-                    n.cover,
-                    n.updated_at,
-                    n.cate_id,
-                    c.name AS category_name,
-                    {sel_writer}
-                FROM novels n
-                LEFT JOIN categories c ON c.cate_id = n.cate_id
-                {join_writer}
-                WHERE n.novels_id = %s
-                """,
-                (novels_id,),
-            )
 
-            novel = cur.fetchone()
-            if not novel:
+            # ไฟล์ไม่มี / หมดอายุ → render แบบผู้ไม่ล็อกอินแล้วเขียนไฟล์ใหม่
+            # (เรื่องที่ไม่มี / ยังไม่เผยแพร่ใช้ detail ที่โหลดมาแล้วต่อ ไม่โหลดซ้ำ)
+            if prerender.can_serve():
+                started = prerender.render_started()
+                detail, html = prerender.render_anonymous(cur, novels_id)
+                if html is not None:
+                    prerender.write_page(novels_id, html, started)
+                    return html
+            else:
+                detail = load_novel_detail(cur, novels_id, _current_user_id(), sort)
+            if detail is None:
                 abort(404, description="ไม่พบนิยายที่ระบุ")
 
-            novel["status"] = _normalize_status(novel.get("status"))
-            novel["cover_url"] = _process_cover_url(novel.get("cover"))
-
-            uid = _current_user_id()
-
-                        # --- bookshelf state ของผู้ใช้ปัจจุบัน ---
-            novel["in_bookshelf"] = False
-            uid = _current_user_id()
-            if uid and _has_table(cur, "bookshelf"):
-                cur.execute(
-                    """
-                    SELECT 1
-                    FROM bookshelf
-                    WHERE users_id = %s AND novels_id = %s
-                    LIMIT 1
-                    """,
-                    (uid, novels_id),
-                )
-                novel["in_bookshelf"] = cur.fetchone() is not None
-
-            # --- จำนวน favorite / bookmark ทั้งหมดของเรื่อง ---
-            novel["total_favorites"] = 0
-            if _has_table(cur, "favorites"):
-                cur.execute(
-                    "SELECT COUNT(*) AS c FROM favorites WHERE novels_id = %s",
-                    (novels_id,),
-                )
-                novel["total_favorites"] = int((cur.fetchone() or {}).get("c") or 0)
-            elif _has_table(cur, "bookmarks"):
-                cur.execute(
-                    "SELECT COUNT(*) AS c FROM bookmarks WHERE novels_id = %s",
-                    (novels_id,),
-                )
-                novel["total_favorites"] = int((cur.fetchone() or {}).get("c") or 0)
+        return render_detail_page(detail, sort)
 
-            # --- แท็กของนิยายเรื่องนี้ ---
-            if _has_table(cur, "novels_tags"):
-                if _has_table(cur, "tags"):
-                    # ถ้าตาราง tags ของคุณใช้ชื่อคอลัมน์อื่น (เช่น tag_name)
-                    # ให้เปลี่ยน t.name ใน SELECT ด้านล่างให้ตรงกับคอลัมน์จริง
-                    cur.execute(
-                        """
-                        SELECT nt.tag_id,
-                               COALESCE(t.name, CONCAT('แท็ก ', nt.tag_id)) AS tag_name
-                        FROM novels_tags nt
-                        JOIN tags t ON t.tag_id = nt.tag_id
-                        WHERE nt.novels_id = %s
-                        ORDER BY t.name
-                        """,
-                        (novels_id,),
-                    )
-                    novel_tags = cur.fetchall()
-                else:
-                    # fallback ถ้าไม่มีตาราง tags แยก ใช้ tag_id เป็นชื่อชั่วคราว
-                    cur.execute(
-                        """
-                        SELECT tag_id,
-                               CONCAT('แท็ก ', tag_id) AS tag_name
-                        FROM novels_tags
-                        WHERE novels_id = %s
-                        ORDER BY tag_id
-                        """,
-                        (novels_id,),
-                    )
-                    novel_tags = cur.fetchall()
+    except Exception as e:
+        print(f"[novel.detail] error: {e}")
+        abort(500)
 
-            # --- ratings (ถ้ามีตาราง ratings) ---
-            novel["avg_rating"] = 0.0
-            novel["rating_count"] = 0
-            novel["user_rating"] = 0
 
-            if _has_table(cur, "ratings"):
-                cur.execute(
-                    """
-                    SELECT AVG(rating) AS avg_rating,
-                           COUNT(*)    AS rating_count
-                    FROM ratings
-                    WHERE novels_id = %s
-                    """,
-                    (novels_id,),
-                )
-                row = cur.fetchone() or {}
-                try:
-                    novel["avg_rating"] = float(row.get("avg_rating") or 0.0)
-                except (TypeError, ValueError):
-                    novel["avg_rating"] = 0.0
-                try:
-                    novel["rating_count"] = int(row.get("rating_count") or 0)
-                except (TypeError, ValueError):
-                    novel["rating_count"] = 0
-
-                if uid:
-                    cur.execute(
-                        """
-                        SELECT rating
-                        FROM ratings
-                        WHERE novels_id = %s AND users_id = %s
-                        LIMIT 1
-                        """,
-                        (novels_id, uid),
-                    )
-                    r = cur.fetchone()
-                    try:
-                        novel["user_rating"] = (
-                            int(r["rating"])
-                            if r and r.get("rating") is not None
-                            else 0
-                        )
-                    except (TypeError, ValueError):
-                        novel["user_rating"] = 0
-
-            # ---------- readers ----------
-            novel["total_readers"] = 0
-            if _has_table(cur, "reading_history") and _has_column(
-                cur, "reading_history", "users_id"
-            ):
-                cur.execute(
-                    """
-                    SELECT COUNT(DISTINCT users_id) AS c
-                    FROM reading_history
-                    WHERE novels_id = %s
-                    """,
-                    (novels_id,),
-                )
-                novel["total_readers"] = int((cur.fetchone() or {}).get("c") or 0)
-            elif _has_table(cur, "novel_reads"):
-                if _has_column(cur, "novel_reads", "users_id"):
-                    cur.execute(
-                        """
-                        SELECT COUNT(DISTINCT users_id) AS c
-                        FROM novel_reads
-                        WHERE novels_id = %s
-                        """,
-                        (novels_id,),
-                    )
-                else:
-                    cur.execute(
-                        "SELECT COUNT(*) AS c FROM novel_reads WHERE novels_id = %s",
-                        (novels_id,),
-                    )
-                novel["total_readers"] = int((cur.fetchone() or {}).get("c") or 0)
-
-            # ---------- chapters + like count ----------
-            chap_pk = "chapters_id"
-            try:
-                cur.execute("DESCRIBE chapters")
-                ccols = {r["Field"] for r in cur.fetchall()}
-                if "chapters_id" in ccols:
-                    chap_pk = "chapters_id"
-                elif "chapter_id" in ccols:
-                    chap_pk = "chapter_id"
-            except Exception:
-                pass
-
-            like_sel = "0 AS like_count"
-            like_join = ""
-            group_by = ""
-
-            if _has_column(cur, "chapters", "like_count"):
-                like_sel = "COALESCE(c.like_count, 0) AS like_count"
-            elif _has_table(cur, "chapter_likes"):
-                fk = None
-                try:
-                    cur.execute("DESCRIBE chapter_likes")
-                    lcols = {r["Field"] for r in cur.fetchall()}
-                    if "chapters_id" in lcols:
-                        fk = "chapters_id"
-                    elif "chapter_id" in lcols:
-                        fk = "chapter_id"
-                except Exception:
-                    fk = None
-
-                if fk:
-                    like_sel = f"COUNT(cl.{fk}) AS like_count"
-                    like_join = f"LEFT JOIN chapter_likes cl ON cl.{fk} = c.{chap_pk}"
-                    group_by = f"GROUP BY c.{chap_pk}"
-
-            cur.execute(
-                f"""
-                SELECT
-                    c.{chap_pk} AS chapters_id,
-                    c.chapter_no,
-                    c.title,
-                    c.created_at,
-                    {like_sel}
-                FROM chapters c
-                {like_join}
-                WHERE c.novels_id = %s
-                  AND c.status = 'published'
-                {group_by}
-                ORDER BY c.chapter_no {order_dir}, c.{chap_pk} {order_dir}
-                """,
-                (novels_id,),
-            )
-            chapters = cur.fetchall()
-            novel["total_chapters"] = len(chapters)
+@novel_bp.route("/novel/<int:novels_id>/chapters")
+def chapters_page(novels_id: int):
+    """
+    รายการตอนทีละกลุ่มสำหรับ accordion ในหน้า novel cover
+      ?after=<cursor>&sort=asc|desc  → กลุ่มถัดจาก cursor (จาก data-after ของหัวกลุ่ม)
+      ?jump=<chapter_no>&sort=...    → กลุ่มที่มีตอนนั้น (binary search บนดัชนี)
+    """
+    sort = request.args.get("sort", "asc")
+    if sort not in ("asc", "desc"):
+        sort = "asc"
+    jump = request.args.get("jump", type=int)
 
-            liked_set = set()
-            if uid and _has_table(cur, "chapter_likes") and chapters:
-                cur.execute(
-                    """
-                    SELECT chapters_id
-                    FROM chapter_likes
-                    WHERE users_id = %s
-                    """,
-                    (uid,),
-                )
-                for r in cur.fetchall():
-                    cid = r.get("chapters_id")
-                    if cid is not None:
-                        liked_set.add(cid)
-
-            for ch in chapters:
-                ch["like_count"] = int(ch.get("like_count") or 0)
-                ch["is_liked"] = ch.get("chapters_id") in liked_set
-
-            # ---------- comments + can_delete ----------
-            comments = []
-            if _has_table(cur, "comments"):
-                sel_username, sel_avatar, join_users = _user_profile_parts(cur)
-                cur.execute(
-                    f"""
-                    SELECT
-                        c.cm_id,
-                        c.users_id,
-                        c.novels_id,
-                        c.content,
-                        c.created_at,
-                        {sel_username},
-                        {sel_avatar}
-                    FROM comments c
-                    {join_users}
-                    WHERE c.novels_id = %s
-                    ORDER BY c.created_at DESC
-                    """,
-                    (novels_id,),
-                )
-                comments = cur.fetchall()
+    try:
+        with closing(get_db_connection()) as conn, conn.cursor(DictCursor) as cur:
+            chapters = chapter_list.get_chapter_list(cur, novels_id)
+            group = None
+            if jump is not None:
+                found = chapters.locate(jump, sort)
+                if found is None:
+                    return jsonify({"ok": False, "error": f"ไม่พบตอนที่ {jump}"}), 404
+                group, after = found
+            else:
+                after = request.args.get("after")
+            rows, next_after = chapters.window(sort, chapter_list.decode_key(after))
+            items = chapter_items(cur, rows, user_state.get_novel_state(cur, _current_user_id(), novels_id))
+    except Exception as e:
+        print(f"[novel.chapters_page] error: {e}")
+        return jsonify({"ok": False, "error": "โหลดรายการตอนไม่สำเร็จ"}), 500
 
-                current_uid = _current_user_id()
-                is_owner = _is_novel_owner(cur, current_uid, novels_id)
+    return jsonify(
+        {
+            "ok": True,
+            "group": group,
+            "chapters": [
+                {
+                    "chapters_id": ch.chapters_id,
+                    "chapter_no": ch.chapter_no,
+                    "title": ch.title,
+                    "like_count": ch.like_count,
+                    "is_liked": ch.is_liked,
+                }
+                for ch in items
+            ],
+            "html": render_template("chapter_rows.html", chapters=items, novels_id=novels_id),
+            "next_after": next_after,
+        }
+    )
 
-                for cm in comments:
-                    cm["avatar_url"] = _process_avatar_url(cm.get("profile_image"))
-                    cm["can_delete"] = bool(
-                        current_uid
-                        and (current_uid == cm.get("users_id") or is_owner)
-                    )
 
-        return render_template(
-            "novelcover.html",
-            novel=novel,
-            chapters=chapters,
-            novel_tags=novel_tags,
-            comments=comments,
-        )
+@novel_bp.route("/novel/<int:novels_id>/comments")
+def comments_page(novels_id: int):
+    """คอมเมนต์ที่เก่ากว่า before (cm_id) สำหรับโหลดต่อตอนเลื่อน carousel ในหน้า novel cover"""
+    before = request.args.get("before", type=int)
+    limit = request.args.get("limit", COMMENTS_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, COMMENTS_MAX_PAGE_SIZE))
 
+    try:
+        with closing(get_db_connection()) as conn, conn.cursor(DictCursor) as cur:
+            cur.execute("SELECT users_id FROM novels WHERE novels_id = %s", (novels_id,))
+            row = cur.fetchone()
+            if not row:
+                return jsonify({"ok": False, "error": "ไม่พบนิยายที่ระบุ"}), 404
+            items, next_before = load_comments(
+                cur, novels_id, _current_user_id(), row["users_id"], before=before, limit=limit
+            )
     except Exception as e:
-        print(f"[novel.detail] error: {e}")
-        abort(500)
+        print(f"[novel.comments_page] error: {e}")
+        return jsonify({"ok": False, "error": "โหลดความคิดเห็นไม่สำเร็จ"}), 500
+
+    return jsonify(
+        {
+            "ok": True,
+            "comments": [
+                {
+                    "cm_id": cm.cm_id,
+                    "content": cm.content,
+                    "username": cm.username or f"ผู้ใช้ #{cm.users_id}",
+                    "avatar_url": cm.avatar_url,
+                    "created_at": cm.created_at.strftime("%d/%m/%Y") if cm.created_at else "ไม่ระบุวันที่",
+                    "can_delete": cm.can_delete,
+                }
+                for cm in items
+            ],
+            "next_before": next_before,
+        }
+    )
 
 
 @novel_bp.route("/writerwork")
@@ -694,6 +656,7 @@ def writerwork():
 
 
 @novel_bp.route("/novel/<int:novels_id>/bookshelf", methods=["POST"])
+@rate_limited("bookshelf")
 def toggle_bookshelf(novels_id: int):
     """กด/ยกเลิก เติมเข้าชั้นหนังสือ สำหรับนิยายทั้งเรื่อง"""
     sort = request.form.get("next_sort") or request.args.get("sort", "asc")
@@ -736,6 +699,7 @@ def toggle_bookshelf(novels_id: int):
                     "DELETE FROM bookshelf WHERE bookshelf_id = %s",
                     (row["bookshelf_id"],),
                 )
+                bump_novel_counter(cur, novels_id, "bookshelf", -1)
                 in_bookshelf = False
                 message = "นำออกจากชั้นหนังสือแล้ว"
                 if not is_ajax:
@@ -748,12 +712,14 @@ def toggle_bookshelf(novels_id: int):
                     """,
                     (users_id, novels_id),
                 )
+                bump_novel_counter(cur, novels_id, "bookshelf", 1)
                 in_bookshelf = True
                 message = "เพิ่มนิยายเข้าชั้นหนังสือแล้ว"
                 if not is_ajax:
                     flash(message, "success")
 
             conn.commit()
+            user_state.note_bookshelf(users_id, novels_id, in_bookshelf)
 
     except Exception as e:
         print(f"[novel.toggle_bookshelf] error: {e}")
@@ -773,179 +739,33 @@ def toggle_bookshelf(novels_id: int):
 @novel_bp.route("/novel/<int:novels_id>/comment-summary", methods=["POST"])
 def comment_summary(novels_id: int):
     """
-    คืนสรุปความคิดเห็นของนิยายเรื่องหนึ่งในรูปแบบ JSON
+    คืนสรุปความคิดเห็นล่าสุดที่มีทันที (JSON) ไม่รอโมเดล
 
-    - ถ้ามีสรุปเก่าและ dirty = 0 → ส่งสรุปเก่าจาก DB เลย (from_cache = True)
-    - ถ้ายังไม่เคยสรุป หรือ dirty = 1 → ดึงคอมเมนต์ใหม่แล้วสร้างสรุปใหม่
-      และอัปเดตตาราง comment_summaries ให้ตรงกับสรุปล่าสุด
+    - ยังไม่มีสรุปเลย → สร้างสรุป extractive จากคอมเมนต์ล่าสุดให้ก่อน (หลักสิบ ms)
+    - dirty = 0 → status "done"
+    - dirty = 1 + engine llm → เข้าคิว summary_jobs แล้วคืน status "queued"/"running"
+      ให้ client poll ที่ comment_summary_status จนได้ "done" (หรือ "failed")
+    - dirty = 1 + engine อื่น (หรือ llm ใช้ไม่ได้) → สรุปใน request นี้เลย
     """
     try:
-        conn = get_db_connection()
-        with conn.cursor(DictCursor) as cur:
-            # ต้องมีตาราง comments ก่อนถึงจะสรุปได้
-            if not _has_table(cur, "comments"):
-                return jsonify({
-                    "ok": False,
-                    "error": "ยังไม่พบตาราง comments ในฐานข้อมูล"
-                }), 400
-
-            # อ่านชื่อเรื่อง (ใช้ช่วย context ให้โมเดล)
-            novel_title = ""
-            try:
-                cur.execute(
-                    "SELECT title FROM novels WHERE novels_id = %s LIMIT 1",
-                    (novels_id,),
-                )
-                row = cur.fetchone()
-                if row and row.get("title"):
-                    novel_title = str(row["title"])
-            except Exception:
-                novel_title = ""
-
-            has_summary_table = _has_table(cur, "comment_summaries")
-            summary_row = None
-            if has_summary_table:
-                cur.execute(
-                    """
-                    SELECT summary_text, last_cm_id, dirty
-                    FROM comment_summaries
-                    WHERE novels_id = %s
-                    LIMIT 1
-                    """,
-                    (novels_id,),
-                )
-                summary_row = cur.fetchone()
-
-            # คำขึ้นต้นของข้อความ fallback เวลาเรียก AI ไม่ได้
-            fallback_prefix = "ไม่สามารถติดต่อบริการสรุปด้วย AI ได้ในขณะนี้"
-
-            base_summary = None
-            last_cm_id = 0
-            dirty = 1  # ถ้าไม่มี row เลยให้ถือว่าสกปรก (ต้องสรุปใหม่)
-
-            if summary_row:
-                base_summary = summary_row.get("summary_text") or None
-                try:
-                    last_cm_id = int(summary_row.get("last_cm_id") or 0)
-                except (TypeError, ValueError):
-                    last_cm_id = 0
-                try:
-                    dirty = int(summary_row.get("dirty") or 1)
-                except (TypeError, ValueError):
-                    dirty = 1
-
-                # ถ้า summary เดิมเป็นข้อความ fallback ให้ถือว่าไม่มี base_summary
-                if base_summary and str(base_summary).strip().startswith(fallback_prefix):
-                    base_summary = None
-
-            # ถ้ามีสรุปเดิมและไม่ dirty → ส่ง cache ได้เลย
-            if base_summary and dirty == 0:
-                return jsonify({
-                    "ok": True,
-                    "summary": base_summary,
-                    "from_cache": True,
-                })
-
-            # ต้องสรุปใหม่ (ครั้งแรก หรือมีคอมเมนต์เปลี่ยน)
-            # ถ้ามี base_summary + last_cm_id → ดึงเฉพาะคอมเมนต์ใหม่
-            if base_summary and last_cm_id > 0:
-                cur.execute(
-                    """
-                    SELECT cm_id, content
-                    FROM comments
-                    WHERE novels_id = %s
-                      AND cm_id > %s
-                    ORDER BY cm_id ASC
-                    """,
-                    (novels_id, last_cm_id),
-                )
-            else:
-                # ยังไม่เคยสรุป → ดึงคอมเมนต์ทั้งหมดของนิยายเรื่องนี้
-                cur.execute(
-                    """
-                    SELECT cm_id, content
-                    FROM comments
-                    WHERE novels_id = %s
-                    ORDER BY cm_id ASC
-                    """,
-                    (novels_id,),
-                )
-            new_comments = cur.fetchall()
-
-            # ถ้าไม่มีคอมเมนต์ใหม่เลย แต่มี base_summary อยู่แล้ว
-            # ให้ mark dirty=0 แล้วส่งสรุปเดิมกลับ
-            if not new_comments and base_summary:
-                if has_summary_table:
-                    cur.execute(
-                        "UPDATE comment_summaries SET dirty = 0 WHERE novels_id = %s",
-                        (novels_id,),
-                    )
-                    conn.commit()
-                return jsonify({
-                    "ok": True,
-                    "summary": base_summary,
-                    "from_cache": True,
-                })
-
-            # เรียกฟังก์ชัน generate_comment_summary (เรียก AI ตามที่ตั้งค่าใน app.py)
-            new_summary = generate_comment_summary(base_summary, new_comments, novel_title=novel_title)
-
-            # หา cm_id สูงสุดที่จะถือว่าอยู่ในสรุปนี้
-            new_last_cm_id = last_cm_id
-            for row in new_comments:
-                try:
-                    cid = int(row.get("cm_id") or 0)
-                    if cid > new_last_cm_id:
-                        new_last_cm_id = cid
-                except (TypeError, ValueError):
-                    pass
-
-            # อัปเดต/สร้าง row ใน comment_summaries
-            if has_summary_table:
-                is_fallback = str(new_summary or "").strip().startswith(fallback_prefix)
-
-                if summary_row:
-                    if is_fallback:
-                        # อย่าเขียนทับสรุปเก่าด้วย fallback; แค่ mark ว่ายังต้องสรุปใหม่
-                        cur.execute(
-                            "UPDATE comment_summaries SET dirty = 1 WHERE novels_id = %s",
-                            (novels_id,),
-                        )
-                    else:
-                        cur.execute(
-                            """
-                            UPDATE comment_summaries
-                            SET summary_text = %s,
-                                last_cm_id   = %s,
-                                dirty        = 0
-                            WHERE novels_id = %s
-                            """,
-                            (new_summary, new_last_cm_id or None, novels_id),
-                        )
-                else:
-                    if is_fallback:
-                        cur.execute(
-                            """
-                            INSERT INTO comment_summaries (novels_id, summary_text, last_cm_id, dirty)
-                            VALUES (%s, NULL, NULL, 1)
-                            """,
-                            (novels_id,),
-                        )
+        with closing(get_db_connection()) as conn:
+            with conn.cursor(DictCursor) as cur:
+                payload = summary_jobs.summary_payload(cur, novels_id)
+                if payload["dirty"] and payload["status"] not in summary_jobs.PENDING_STATUSES:
+                    if summarizer.summary_engine() == "llm":
+                        if payload["summary"] is None:
+                            payload["summary"] = summary_jobs.instant_summary(cur, novels_id)
+                            payload["engine"] = "extractive"
+                        summary_jobs.enqueue(cur, novels_id)
+                        conn.commit()
+                        payload["status"] = summary_jobs.job_status(cur, novels_id) or "queued"
                     else:
-                        cur.execute(
-                            """
-                            INSERT INTO comment_summaries (novels_id, summary_text, last_cm_id, dirty)
-                            VALUES (%s, %s, %s, 0)
-                            """,
-                            (novels_id, new_summary, new_last_cm_id or None),
-                        )
-                conn.commit()
-
-            return jsonify({
-                "ok": True,
-                "summary": new_summary,
-                "from_cache": False,
-            })
+                        result = summary_jobs.refresh_summary(conn, novels_id)
+                        payload.update(summary=result["summary"], from_cache=False, dirty=False,
+                                       status="done", engine=summarizer.summary_engine())
+        if payload["status"] in summary_jobs.PENDING_STATUSES:
+            summary_jobs.kick_workers()
+        return jsonify(payload)
     except Exception as e:
         print(f"[novel.comment_summary] error: {e}")
         return jsonify({
@@ -954,10 +774,23 @@ def comment_summary(novels_id: int):
         }), 500
 
 
+@novel_bp.get("/novel/<int:novels_id>/comment-summary/status")
+def comment_summary_status(novels_id: int):
+    """สถานะงานสรุป + สรุปล่าสุด (ให้หน้าเว็บ poll หลังกดขอสรุป)"""
+    try:
+        with closing(get_db_connection()) as conn:
+            with conn.cursor(DictCursor) as cur:
+                return jsonify(summary_jobs.summary_payload(cur, novels_id))
+    except Exception as e:
+        print(f"[novel.comment_summary_status] error: {e}")
+        return jsonify({"ok": False, "error": "เกิดข้อผิดพลาดจากเซิร์ฟเวอร์"}), 500
+
+
 
 # ---------- route สำหรับให้ดาว / บันทึก rating ----------
 
 @novel_bp.route("/novel/<int:novels_id>/rate", methods=["POST"])
+@rate_limited("rate")
 def rate(novels_id: int):
     is_ajax = request.headers.get("X-Requested-With", "").lower() == "xmlhttprequest"
 
@@ -1013,6 +846,7 @@ def rate(novels_id: int):
                     """,
                     (rating, novels_id, users_id),
                 )
+                bump_novel_rating(cur, novels_id, rating - int(row["rating"] or 0))
             else:
                 cur.execute(
                     """
@@ -1021,6 +855,7 @@ def rate(novels_id: int):
                     """,
                     (users_id, novels_id, rating),
                 )
+                bump_novel_rating(cur, novels_id, rating, 1)
 
             # คำนวณค่าเฉลี่ยใหม่
             cur.execute(
@@ -1037,6 +872,7 @@ def rate(novels_id: int):
             rating_count = int(agg.get("rating_count") or 0)
 
             conn.commit()
+            user_state.note_rating(users_id, novels_id, rating)
 
             if is_ajax:
                 avg_text = "—" if rating_count == 0 else f"{avg_rating:.1f}"
@@ -1062,6 +898,7 @@ def rate(novels_id: int):
 
 
 @novel_bp.route("/novel/<int:novels_id>/chapter/<int:chapters_id>/like", methods=["POST"])
+@rate_limited("like")
 def toggle_chapter_like(novels_id: int, chapters_id: int):
     """กด/ยกเลิกหัวใจให้ตอน (toggle)"""
     sort = request.form.get("next_sort") or request.args.get("sort", "asc")
@@ -1118,6 +955,7 @@ def toggle_chapter_like(novels_id: int, chapters_id: int):
                     """,
                     (chapters_id, users_id),
                 )
+                bump_novel_counter(cur, novels_id, "likes", -1)
                 liked = False
                 if not is_ajax:
                     flash("ยกเลิกหัวใจตอนนี้แล้ว", "info")
@@ -1129,6 +967,7 @@ def toggle_chapter_like(novels_id: int, chapters_id: int):
                     """,
                     (chapters_id, users_id),
                 )
+                bump_novel_counter(cur, novels_id, "likes", 1)
                 liked = True
                 if not is_ajax:
                     flash("ขอบคุณที่กดหัวใจให้ตอนนี้", "success")
@@ -1141,6 +980,7 @@ def toggle_chapter_like(novels_id: int, chapters_id: int):
             like_count = int((cur.fetchone() or {}).get("c") or 0)
 
             conn.commit()
+            user_state.note_like(users_id, novels_id, chapters_id, liked)
 
     except Exception as e:
         print(f"[novel.toggle_chapter_like] error: {e}")
@@ -1217,6 +1057,7 @@ def delete_comment(novels_id: int, cm_id: int):
                 "DELETE FROM comments WHERE cm_id = %s",
                 (cm_id,),
             )
+            bump_novel_counter(cur, novels_id, "comments", -1)
 
             if _has_table(cur, "comment_summaries"):
                 cur.execute(
@@ -1227,8 +1068,10 @@ def delete_comment(novels_id: int, cm_id: int):
                     """,
                     (novels_id,),
                 )
+            summary_jobs.drop_chunks_from(cur, novels_id, cm_id)
 
             conn.commit()
+            prerender.invalidate(novels_id)
             if not is_ajax:
                 flash("ลบความคิดเห็นเรียบร้อยแล้ว", "success")
 
@@ -0,0 +1,246 @@
+# prerender.py
+"""
+หน้า novel cover แบบไฟล์ HTML สำเร็จรูปสำหรับผู้ที่ยังไม่ล็อกอิน (ส่วนใหญ่มาจาก search engine)
+
+- เก็บที่ PRERENDER_DIR/novel/<novels_id>.html (ค่าเริ่มต้น instance/prerendered) เฉพาะเรื่องที่เผยแพร่แล้ว
+- novel.detail ส่งไฟล์นี้ทันทีถ้า: GET ไม่มี query string, session ไม่มีผู้ใช้ และไม่มี flash ค้าง
+  ไม่มีไฟล์ / เก่าเกิน PRERENDER_MAX_AGE วินาที → render แบบผู้ไม่ล็อกอินแล้วเขียนไฟล์ใหม่ (render-on-miss)
+  ผู้ใช้ที่ล็อกอินใช้ทาง dynamic เหมือนเดิม
+- ลบไฟล์ (invalidate) เมื่อนิยาย / ตอน / คอมเมนต์เปลี่ยน — ไฟล์อยู่บนดิสก์จึงมีผลกับทุก worker บนเครื่องเดียวกัน
+  invalidate เขียนเวลาลงไฟล์ <novels_id>.inv ก่อนลบ → การ render ที่เริ่มอ่าน DB ก่อนเวลานั้นจะไม่ทิ้งไฟล์เก่าค้างไว้
+  ตัวเลขที่เปลี่ยนตลอด (ดาว, ชั้นหนังสือ, ผู้อ่าน) ตามทันภายใน PRERENDER_MAX_AGE
+- csrf_token ในไฟล์เป็น CSRF_PLACEHOLDER (ไฟล์ใช้ร่วมกันทุกคน) หน้าเว็บขอ token จริงจาก prerender.csrf ตอนโหลด
+- ให้ front proxy ส่งไฟล์เอง: ตั้ง PRERENDER_ACCEL_PREFIX แล้ว novel.detail ตอบแค่ header X-Accel-Redirect
+  (แอปยังเป็นคนตัดสินว่าเป็นผู้ไม่ล็อกอินหรือไม่ เพราะ cookie session มีทั้งของผู้ใช้และของผู้ไม่ล็อกอิน)
+
+    location /_prerendered/ { internal; alias /srv/novel/instance/prerendered/; }
+
+    flask --app app prerender build            # สร้างทุกเรื่องที่เผยแพร่ (หลัง deploy template ใหม่)
+    flask --app app prerender build --stale    # เฉพาะที่ไม่มีไฟล์ / หมดอายุ (ตั้ง cron ถ้าใช้ X-Accel-Redirect)
+    flask --app app prerender clear
+"""
+from __future__ import annotations
+
+import os
+import tempfile
+import time
+from contextlib import closing
+
+import click
+from flask import Blueprint, current_app, jsonify, make_response, request, send_file, session
+from flask_wtf.csrf import generate_csrf
+from MySQLdb.cursors import DictCursor
+
+from db import get_db_connection
+
+prerender_bp = Blueprint("prerender", __name__, cli_group="prerender")
+
+PRERENDER_MAX_AGE = 600.0
+PUBLISHED_STATUSES = ("เผยแพร่", "จบแล้ว")
+CSRF_PLACEHOLDER = "__prerender_csrf__"
+SESSION_USER_KEYS = ("users_id", "user_id", "uid")
+BUILD_CHUNK = 500
+
+
+def enabled() -> bool:
+    return bool(current_app.config.get("PRERENDER", True))
+
+
+def prerender_dir() -> str:
+    return current_app.config.get("PRERENDER_DIR") or os.path.join(current_app.instance_path, "prerendered")
+
+
+def page_path(novels_id: int) -> str:
+    return os.path.join(prerender_dir(), "novel", f"{int(novels_id)}.html")
+
+
+def max_age() -> float:
+    return float(current_app.config.get("PRERENDER_MAX_AGE", PRERENDER_MAX_AGE))
+
+
+def is_publishable(status: str | None) -> bool:
+    return (status or "").strip() in PUBLISHED_STATUSES
+
+
+def can_serve() -> bool:
+    """request นี้ใช้หน้าสำเร็จรูปได้หรือไม่ (GET ไม่มี query string ของผู้ไม่ล็อกอินที่ไม่มี flash ค้าง)"""
+    if not enabled() or request.method != "GET" or request.args:
+        return False
+    if any(session.get(k) for k in SESSION_USER_KEYS):
+        return False
+    return "_flashes" not in session
+
+
+def _fresh_path(novels_id: int) -> str | None:
+    path = page_path(novels_id)
+    try:
+        age = time.time() - os.stat(path).st_mtime
+    except OSError:
+        return None
+    return path if age < max_age() else None
+
+
+def serve(novels_id: int):
+    """response ของไฟล์ที่ยังไม่หมดอายุ หรือ None ถ้าต้อง render ใหม่"""
+    path = _fresh_path(novels_id)
+    if path is None:
+        return None
+    accel = current_app.config.get("PRERENDER_ACCEL_PREFIX")
+    if accel:
+        resp = make_response("")
+        resp.headers["X-Accel-Redirect"] = f"{accel.rstrip('/')}/novel/{int(novels_id)}.html"
+        resp.headers["Content-Type"] = "text/html; charset=utf-8"
+    else:
+        resp = send_file(path, mimetype="text/html", max_age=0, conditional=True)
+    resp.headers["Vary"] = "Cookie"
+    return resp
+
+
+def _marker_path(novels_id: int) -> str:
+    return os.path.join(prerender_dir(), "novel", f"{int(novels_id)}.inv")
+
+
+def render_started() -> int:
+    """เวลาเริ่ม render (เรียกก่อนอ่าน DB) ส่งต่อให้ write_page"""
+    return time.time_ns()
+
+
+def _invalidated_since(novels_id: int, started: int) -> bool:
+    try:
+        with open(_marker_path(novels_id), encoding="ascii") as f:
+            return int(f.read().strip() or 0) >= started
+    except FileNotFoundError:
+        return False
+    except (OSError, ValueError):
+        return True         # อ่าน marker ไม่ได้ (กำลังเขียนอยู่) → ถือว่ามี invalidate
+
+
+def write_page(novels_id: int, html: str, started: int | None = None) -> None:
+    """
+    เขียนไฟล์แบบ atomic (ไฟล์ชั่วคราวในโฟลเดอร์เดียวกันแล้ว os.replace) worker อื่นไม่เห็นไฟล์ครึ่ง ๆ
+    started = render_started() ก่อนอ่าน DB → ถ้ามี invalidate หลังจากนั้นจะลบไฟล์ที่เพิ่งเขียนทิ้ง
+    (ตรวจหลัง replace: invalidate ที่มาก่อนการตรวจเห็นได้จาก marker ที่มาหลังการตรวจก็ลบไฟล์นี้เอง)
+    """
+    path = page_path(novels_id)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(html)
+            os.chmod(tmp, 0o644)      # mkstemp สร้างเป็น 0600 → front proxy อ่านไม่ได้
+            os.replace(tmp, path)
+        except Exception:
+            os.unlink(tmp)
+            raise
+        if started is not None and _invalidated_since(novels_id, started):
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"[prerender.write_page] novels_id={novels_id} error: {e!r}")
+
+
+def invalidate(novels_id: int) -> None:
+    """เรียกหลังนิยาย / ตอน / คอมเมนต์ของเรื่องนี้เปลี่ยน (request ถัดไปของผู้ไม่ล็อกอินจะ render ใหม่)"""
+    try:
+        marker = _marker_path(novels_id)
+        os.makedirs(os.path.dirname(marker), exist_ok=True)
+        with open(marker, "w", encoding="ascii") as f:
+            f.write(str(time.time_ns()))
+        os.remove(page_path(novels_id))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"[prerender.invalidate] novels_id={novels_id} error: {e!r}")
+
+
+def render_anonymous(cur, novels_id: int):
+    """
+    คืน (detail, html) ของหน้า novel cover แบบผู้ไม่ล็อกอิน
+    html = None ถ้าไม่มีเรื่องนี้ / ยังไม่เผยแพร่ (detail ที่โหลดแล้วส่งคืนให้ผู้เรียกใช้ต่อได้ ไม่ต้องโหลดซ้ำ)
+    """
+    from novelcover import load_novel_detail, render_detail_page  # novelcover import โมดูลนี้
+
+    detail = load_novel_detail(cur, novels_id, None, "asc")
+    if detail is None or not is_publishable(detail.raw_status):
+        return detail, None
+    return detail, render_detail_page(detail, "asc", csrf_token=lambda: CSRF_PLACEHOLDER, prerendered=True)
+
+
+def build_page(cur, novels_id: int) -> bool:
+    """render นอก request (CLI) แล้วเขียนไฟล์ เรื่องที่ไม่เผยแพร่แล้วจะถูกลบไฟล์ทิ้ง"""
+    base_url = current_app.config.get("PRERENDER_BASE_URL") or "http://localhost/"
+    started = render_started()
+    with current_app.test_request_context(f"/novel/{int(novels_id)}", base_url=base_url):
+        _, html = render_anonymous(cur, novels_id)
+    if html is None:
+        invalidate(novels_id)
+        return False
+    write_page(novels_id, html, started)
+    return True
+
+
+# ---------- routes ----------
+
+@prerender_bp.get("/prerender/csrf")
+def csrf():
+    """token จริงแทน CSRF_PLACEHOLDER ในหน้าสำเร็จรูป"""
+    resp = jsonify({"csrf_token": generate_csrf()})
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
+# ---------- CLI ----------
+
+@prerender_bp.cli.command("build")
+@click.option("--stale", is_flag=True, help="เฉพาะเรื่องที่ไม่มีไฟล์หรือไฟล์หมดอายุ")
+def build_command(stale: bool):
+    """สร้างหน้าสำเร็จรูปของนิยายที่เผยแพร่แล้ว"""
+    started = time.monotonic()
+    built = skipped = failed = 0
+    last_id = 0
+    with closing(get_db_connection()) as conn, conn.cursor(DictCursor) as cur:
+        while True:
+            cur.execute(
+                f"""
+                SELECT novels_id FROM novels
+                WHERE novels_id > %s AND status IN ({', '.join(['%s'] * len(PUBLISHED_STATUSES))})
+                ORDER BY novels_id
+                LIMIT %s
+                """,
+                (last_id, *PUBLISHED_STATUSES, BUILD_CHUNK),
+            )
+            ids = [int(r["novels_id"]) for r in cur.fetchall()]
+            if not ids:
+                break
+            last_id = ids[-1]
+            for novels_id in ids:
+                if stale and _fresh_path(novels_id):
+                    skipped += 1
+                    continue
+                try:
+                    if build_page(cur, novels_id):
+                        built += 1
+                    else:
+                        skipped += 1
+                except Exception as e:
+                    failed += 1
+                    print(f"[prerender.build] novels_id={novels_id} error: {e!r}")
+    click.echo(
+        f"prerender build: built={built} skipped={skipped} failed={failed} "
+        f"in {time.monotonic() - started:.1f}s → {prerender_dir()}"
+    )
+
+
+@prerender_bp.cli.command("clear")
+def clear_command():
+    """ลบหน้าสำเร็จรูปทั้งหมด (request ถัดไปจะ render ใหม่)"""
+    folder = os.path.join(prerender_dir(), "novel")
+    removed = 0
+    if os.path.isdir(folder):
+        for name in os.listdir(folder):
+            if name.endswith(".html"):
+                os.remove(os.path.join(folder, name))
+                removed += 1
+    click.echo(f"prerender clear: removed={removed}")
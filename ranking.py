@@ -0,0 +1,173 @@
+# ranking.py
+"""
+งานจัดอันดับนิยายเบื้องหลัง (รันผ่าน Flask CLI / cron)
+
+    flask --app app ranking refresh
+
+คำนวณคะแนนของนิยายที่เผยแพร่ทุกเรื่องพร้อมกันด้วย NumPy แล้วเขียนลง novel_rankings
+หน้า /search จะแค่ filter + ORDER BY คอลัมน์ที่คำนวณไว้แล้ว
+"""
+from __future__ import annotations
+
+from contextlib import closing
+from datetime import date, datetime
+
+import click
+from flask import Blueprint
+from MySQLdb.cursors import DictCursor
+
+from db import get_db_connection
+from stats import NO_VOTES_AVG, rating_prior, set_job_mark
+
+try:
+    import numpy as np
+except ImportError:  # ให้แอปหลักรันได้แม้ไม่มี numpy (ใช้เฉพาะตอนรันงานนี้)
+    np = None
+
+ranking_bp = Blueprint("ranking", __name__, cli_group="ranking")
+
+RANKING_JOB = "novel_rankings"
+PUBLISHED_STATUSES = ("เผยแพร่", "จบแล้ว")
+
+# น้ำหนักของ relevance_score (รวมกันได้ 1)
+RELEVANCE_WEIGHTS = {
+    "rating": 0.5,      # bayesian_avg / 5
+    "activity": 0.35,   # activity_score
+    "bookshelf": 0.15,  # log(bookshelf) เทียบกับเรื่องที่มากที่สุด
+}
+
+# น้ำหนักของผู้อ่านแอคทีฟเดือนนี้เทียบกับยอดชั้นหนังสือใน activity_score
+ACTIVITY_BOOKSHELF_WEIGHT = 0.25
+
+WRITE_CHUNK = 1000
+
+
+def _load_inputs(cur) -> list[dict]:
+    """ดึงตัวเลขดิบของนิยายที่เผยแพร่ทุกเรื่อง (จาก novel_counters + ผู้อ่านเดือนนี้)"""
+    cur.execute(
+        """
+        SELECT n.novels_id,
+               COALESCE(nc.rating_count, 0) AS votes,
+               COALESCE(nc.rating_sum, 0)   AS rating_sum,
+               COALESCE(nc.bookshelf, 0)    AS bookshelf_users,
+               COALESCE(nc.chapters, 0)     AS total_chapters,
+               COALESCE(m.active_readers, 0) AS active_readers
+        FROM novels n
+        LEFT JOIN novel_counters nc ON nc.novels_id = n.novels_id
+        LEFT JOIN (
+            SELECT novels_id, COUNT(DISTINCT users_id) AS active_readers
+            FROM reading_history
+            WHERE last_read_at >= %s
+            GROUP BY novels_id
+        ) m ON m.novels_id = n.novels_id
+        WHERE n.status IN (%s, %s)
+        ORDER BY n.novels_id
+        """,
+        (date.today().replace(day=1), *PUBLISHED_STATUSES),
+    )
+    return list(cur.fetchall())
+
+
+def compute_scores(rows: list[dict], prior: tuple[float, int]) -> dict:
+    """
+    คำนวณคะแนนทุกเรื่องพร้อมกัน (vectorized)
+
+    - bayesian_avg   = (C·m + Σrating) / (C + votes)   โดย (m, C) = stats.rating_prior (ค่าเดียวกับ rating_avg)
+                       ยังไม่มีโหวต = stats.NO_VOTES_AVG
+    - activity_score = log1p(active + w·bookshelf) / ค่าสูงสุด  → 0..1
+    - relevance      = ผลรวมถ่วงน้ำหนักของ rating, activity, bookshelf (0..1)
+    """
+    if np is None:
+        raise RuntimeError("งานจัดอันดับต้องใช้ numpy (pip install numpy)")
+
+    ids = np.fromiter((r["novels_id"] for r in rows), dtype=np.int64, count=len(rows))
+    votes = np.fromiter((r["votes"] for r in rows), dtype=np.float64, count=len(rows))
+    rsum = np.fromiter((r["rating_sum"] for r in rows), dtype=np.float64, count=len(rows))
+    shelf = np.fromiter((r["bookshelf_users"] for r in rows), dtype=np.float64, count=len(rows))
+    chapters = np.fromiter((r["total_chapters"] for r in rows), dtype=np.int64, count=len(rows))
+    active = np.fromiter((r["active_readers"] for r in rows), dtype=np.float64, count=len(rows))
+
+    m, c = float(prior[0]), float(prior[1])
+    bayes = np.where(votes > 0, (c * m + rsum) / (c + votes), NO_VOTES_AVG)
+
+    activity_raw = np.log1p(active + ACTIVITY_BOOKSHELF_WEIGHT * shelf)
+    activity = activity_raw / activity_raw.max() if activity_raw.size and activity_raw.max() > 0 else activity_raw
+
+    shelf_log = np.log1p(shelf)
+    shelf_norm = shelf_log / shelf_log.max() if shelf_log.size and shelf_log.max() > 0 else shelf_log
+
+    relevance = (
+        RELEVANCE_WEIGHTS["rating"] * (bayes / 5.0)
+        + RELEVANCE_WEIGHTS["activity"] * activity
+        + RELEVANCE_WEIGHTS["bookshelf"] * shelf_norm
+    )
+
+    return {
+        "novels_id": ids,
+        "bayesian_avg": np.round(bayes, 4),
+        "votes": votes.astype(np.int64),
+        "bookshelf_users": shelf.astype(np.int64),
+        "total_chapters": chapters,
+        "active_readers": active.astype(np.int64),
+        "activity_score": activity,
+        "relevance_score": relevance,
+        "prior": m,
+    }
+
+
+def refresh_rankings(conn, chunk: int = WRITE_CHUNK) -> dict:
+    """คำนวณและเขียน novel_rankings ใหม่ทั้งตาราง (ลบแถวของเรื่องที่ไม่เผยแพร่แล้ว)"""
+    started = datetime.now().replace(microsecond=0)
+    with conn.cursor(DictCursor) as cur:
+        rows = _load_inputs(cur)
+        written = 0
+        prior = 0.0
+        if rows:
+            scores = compute_scores(rows, rating_prior(cur))
+            prior = scores["prior"]
+            cols = ("novels_id", "bayesian_avg", "votes", "bookshelf_users", "total_chapters",
+                    "active_readers", "activity_score", "relevance_score")
+            records = [
+                tuple(v.item() for v in values) + (started,)
+                for values in zip(*(scores[c] for c in cols))
+            ]
+            for i in range(0, len(records), chunk):
+                cur.executemany(
+                    """
+                    INSERT INTO novel_rankings
+                        (novels_id, bayesian_avg, votes, bookshelf_users, total_chapters,
+                         active_readers, activity_score, relevance_score, computed_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        bayesian_avg    = VALUES(bayesian_avg),
+                        votes           = VALUES(votes),
+                        bookshelf_users = VALUES(bookshelf_users),
+                        total_chapters  = VALUES(total_chapters),
+                        active_readers  = VALUES(active_readers),
+                        activity_score  = VALUES(activity_score),
+                        relevance_score = VALUES(relevance_score),
+                        computed_at     = VALUES(computed_at)
+                    """,
+                    records[i:i + chunk],
+                )
+                conn.commit()
+                written += len(records[i:i + chunk])
+
+        cur.execute("DELETE FROM novel_rankings WHERE computed_at < %s", (started,))
+        removed = cur.rowcount
+        set_job_mark(cur, RANKING_JOB, started)
+    conn.commit()
+    return {"written": written, "removed": removed, "prior": prior}
+
+
+# ---------- CLI ----------
+@ranking_bp.cli.command("refresh")
+@click.option("--chunk", default=WRITE_CHUNK, show_default=True, help="จำนวนแถวต่อ batch ตอนเขียน")
+def refresh_command(chunk: int):
+    """คำนวณ novel_rankings ใหม่ (ตั้ง cron ทุก 15-60 นาที หลัง stats refresh-counters)"""
+    with closing(get_db_connection()) as conn:
+        result = refresh_rankings(conn, chunk=max(1, chunk))
+    click.echo(
+        f"ranking refresh: written={result['written']} removed={result['removed']} "
+        f"prior={result['prior']:.3f}"
+    )
@@ -0,0 +1,236 @@
+# ratelimit.py
+"""
+จำกัดความถี่ของ route ที่เขียนข้อมูล (คอมเมนต์ / ให้ดาว / กดหัวใจ / ชั้นหนังสือ / บันทึก progress)
+
+- token bucket ต่อ (action, ผู้ใช้) และต่อ (action, IP) — ต้องผ่านทั้งสองอันถึงจะนับ
+  bucket ของ IP ใหญ่กว่า (หลายคนอาจใช้ IP เดียวกันผ่าน NAT)
+  หลัง reverse proxy ต้องตั้ง PROXY_FIX_HOPS (app.py) ไม่งั้น request.remote_addr เป็น IP ของ proxy ทุก request
+- เกินแล้วตอบ 429 + Retry-After ก่อนเปิด connection DB เลย จึงไม่ไปแย่ง lock แถวเดียวกับคนอื่น
+- backend (config RATE_LIMIT_BACKEND):
+    shm     (ค่าเริ่มต้น) ไฟล์ mmap ใน /dev/shm ใช้ร่วมกันทุก worker บนเครื่องเดียวกัน + fcntl.flock
+    memory  dict ต่อ process (ใช้ตอน dev / ระบบที่ไม่มี fcntl)
+    off     ไม่จำกัด
+- งบต่อ action แก้ได้ที่ app.config["RATE_LIMITS"] = {action: (ความจุผู้ใช้, เติมต่อวินาที, ความจุ IP)}
+"""
+from __future__ import annotations
+
+import hashlib
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, g, jsonify, make_response, request, session
+
+try:
+    import fcntl
+except ImportError:  # Windows → ใช้ backend memory แทน
+    fcntl = None
+
+# action: (ความจุ bucket ผู้ใช้, token ที่เติมต่อวินาที, ความจุ bucket IP)
+RATE_LIMITS = {
+    "comment":   (5, 1 / 12, 20),      # ต่อเนื่องได้ราว 5 ครั้ง/นาที
+    "rate":      (10, 1 / 6, 40),
+    "like":      (30, 1.0, 120),
+    "bookshelf": (20, 0.5, 80),
+    "progress":  (12, 0.5, 60),        # หน้าอ่านส่งทุก ≥ 5 วินาทีอยู่แล้ว
+}
+
+TOO_MANY_TEXT = "ทำรายการถี่เกินไป กรุณารอสักครู่แล้วลองใหม่"
+
+SHM_SLOTS = 65536
+SHM_PROBES = 8
+_SLOT = struct.Struct("<Qdd")          # key hash (0 = ว่าง), tokens, updated_at (time.time())
+
+
+def _key_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+
+
+def _refill(tokens: float, updated: float, now: float, capacity: float, rate: float) -> float:
+    return min(capacity, tokens + max(0.0, now - updated) * rate)
+
+
+class MemoryBackend:
+    """bucket ใน dict ของ process นี้ (แต่ละ worker นับแยกกัน)"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self._lock = threading.Lock()
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self.max_keys = max_keys
+
+    def take(self, checks, now: float | None = None) -> float:
+        """checks = [(key, capacity, rate)] หัก 1 token จากทุก bucket ถ้าพอทุกอัน คืน 0 ไม่งั้นคืนวินาทีที่ต้องรอ"""
+        now = time.time() if now is None else now
+        with self._lock:
+            levels = []
+            for key, capacity, rate in checks:
+                tokens, updated = self._buckets.get(key, (capacity, now))
+                levels.append(_refill(tokens, updated, now, capacity, rate))
+            wait = max(((1.0 - t) / r for t, (_, _, r) in zip(levels, checks) if t < 1.0), default=0.0)
+            if wait:
+                return wait
+            if len(self._buckets) >= self.max_keys:
+                self._buckets.clear()
+            for t, (key, _, _) in zip(levels, checks):
+                self._buckets[key] = (t - 1.0, now)
+            return 0.0
+
+
+class SharedMemoryBackend:
+    """
+    bucket ในไฟล์ mmap ขนาดคงที่ (SHM_SLOTS ช่อง ช่องละ 24 byte) ที่ทุก worker เปิดร่วมกัน
+
+    หาช่องด้วย hash ของ key แบบ linear probing ไม่เกิน SHM_PROBES ช่อง ถ้าเต็มทับช่องที่เก่าที่สุด
+    (bucket ที่ไม่ได้ใช้นาน ๆ ก็เติมจนเต็มอยู่แล้ว ทับไปก็ไม่ต่างกัน)
+    ล็อกด้วย flock ทั้งไฟล์ (ข้าม process) + threading.Lock (ระหว่าง thread ใน process เดียวกัน)
+    """
+
+    def __init__(self, path: str, slots: int = SHM_SLOTS):
+        self.path = path
+        self.slots = slots
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._mm = None
+
+    def _open(self) -> None:
+        # เปิดใหม่หลัง fork เพราะ flock ผูกกับ file description (fd ที่สืบทอดมาจะล็อกกันเองไม่ได้)
+        if self._pid == os.getpid():
+            return
+        size = self.slots * _SLOT.size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        self._fd, self._mm, self._pid = fd, mmap.mmap(fd, size), os.getpid()
+
+    def _find(self, h: int, taken=()) -> int:
+        start = h % self.slots
+        oldest, oldest_at = start, math.inf
+        for i in range(SHM_PROBES):
+            slot = (start + i) % self.slots
+            if slot in taken:
+                continue
+            sh, _, updated = _SLOT.unpack_from(self._mm, slot * _SLOT.size)
+            if sh == h or sh == 0:
+                return slot
+            if updated < oldest_at:
+                oldest, oldest_at = slot, updated
+        return oldest
+
+    def take(self, checks, now: float | None = None) -> float:
+        now = time.time() if now is None else now
+        with self._lock:
+            self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                found = []
+                for key, capacity, rate in checks:
+                    h = _key_hash(key)
+                    slot = self._find(h, {f[0] for f in found})
+                    sh, tokens, updated = _SLOT.unpack_from(self._mm, slot * _SLOT.size)
+                    if sh != h:
+                        tokens, updated = capacity, now
+                    found.append((slot, h, _refill(tokens, updated, now, capacity, rate), rate))
+                wait = max(((1.0 - t) / r for _, _, t, r in found if t < 1.0), default=0.0)
+                if wait:
+                    return wait
+                for slot, h, t, _ in found:
+                    _SLOT.pack_into(self._mm, slot * _SLOT.size, h, t - 1.0, now)
+                return 0.0
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """backend ตาม config (สร้างครั้งเดียวต่อ process) หรือ None ถ้าปิด"""
+    global _backend
+    if _backend is not None:
+        return _backend or None
+    with _backend_lock:
+        if _backend is None:
+            kind = current_app.config.get("RATE_LIMIT_BACKEND", "shm")
+            if kind == "off":
+                _backend = False
+            elif kind == "shm" and fcntl is not None:
+                base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+                path = current_app.config.get("RATE_LIMIT_PATH") or os.path.join(
+                    base, f"{current_app.name}-ratelimit.bin"
+                )
+                _backend = SharedMemoryBackend(path)
+            else:
+                _backend = MemoryBackend()
+    return _backend or None
+
+
+def _current_user_id():
+    uid = session.get("users_id")
+    if not uid and getattr(g, "user", None):
+        try:
+            uid = g.user["users_id"]
+        except Exception:
+            uid = None
+    return uid
+
+
+def check(action: str, uid=None, ip: str | None = None) -> float:
+    """หัก token ของ action นี้ คืน 0 ถ้าผ่าน ไม่งั้นคืนจำนวนวินาทีที่ควรรอ"""
+    backend = get_backend()
+    limits = {**RATE_LIMITS, **(current_app.config.get("RATE_LIMITS") or {})}
+    if backend is None or action not in limits:
+        return 0.0
+    user_cap, rate, ip_cap = limits[action]
+    checks = []
+    if uid:
+        checks.append((f"{action}:u:{uid}", user_cap, rate))
+    if ip:
+        # IP เติมเร็วกว่าตามสัดส่วนความจุ (ไม่ให้คนหลายคนหลัง NAT เดียวกันแย่งกันจนติด)
+        checks.append((f"{action}:ip:{ip}", ip_cap, rate * ip_cap / max(user_cap, 1)))
+    if not checks:
+        return 0.0
+    try:
+        return backend.take(checks)
+    except Exception as e:
+        # backend มีปัญหา (เช่น /dev/shm เต็ม) → ไม่บล็อกผู้ใช้
+        print(f"[ratelimit.check] error: {e!r}")
+        return 0.0
+
+
+def too_many_response(retry_after: float):
+    """429 + Retry-After: JSON ถ้าเป็น fetch/API ไม่งั้นข้อความธรรมดา"""
+    secs = max(1, math.ceil(retry_after))
+    wants_json = (
+        request.headers.get("X-Requested-With", "").lower() == "xmlhttprequest"
+        or request.is_json
+        or request.accept_mimetypes.best == "application/json"
+        or request.path.startswith("/api/")
+    )
+    if wants_json:
+        resp = make_response(jsonify({"ok": False, "error": TOO_MANY_TEXT, "retry_after": secs}), 429)
+    else:
+        resp = make_response(TOO_MANY_TEXT, 429)
+        resp.mimetype = "text/plain"
+    resp.headers["Retry-After"] = str(secs)
+    return resp
+
+
+def rate_limited(action: str, methods=("POST",)):
+    """decorator ของ route: จำกัดเฉพาะ methods ที่ระบุ (route ที่เป็นทั้ง GET/POST อ่านได้ไม่จำกัด)"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method in methods:
+                wait = check(action, _current_user_id(), request.remote_addr)
+                if wait:
+                    return too_many_response(wait)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
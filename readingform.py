@@ -5,6 +5,8 @@ from flask import (
 from werkzeug.exceptions import HTTPException
 from MySQLdb.cursors import DictCursor
 from db import get_db_connection
+from stats import bump_novel_counter
+from ratelimit import rate_limited
 
 reading_bp = Blueprint('reading', __name__, template_folder='templates')
 
@@ -182,6 +184,7 @@ def read_chapter(novels_id: int, chapter_no: int):
 # ---------- API: บันทึก Progress ----------
 
 @reading_bp.route("/api/reading/progress", methods=["POST"])
+@rate_limited("progress")
 def save_reading_progress():
     """
     รับ progress จากหน้าอ่านตอน แล้วบันทึกลง reading_history
@@ -232,6 +235,10 @@ def save_reading_progress():
               last_read_at = CURRENT_TIMESTAMP
             """
             cur.execute(sql, (user_id, novels_id, chapters_id, progress))
+            # rowcount = 1 คือแถวใหม่ (ผู้อ่านใหม่ของเรื่องนี้), 2 คืออัปเดตแถวเดิม
+            if cur.rowcount == 1:
+                bump_novel_counter(cur, novels_id, "views", 1)
+                bump_novel_counter(cur, novels_id, "readers", 1)
             conn.commit()
     except Exception as e:
         print(f"save_reading_progress error: {e}")
@@ -0,0 +1,210 @@
+# related.py
+"""
+งานคำนวณ "เรื่องที่คล้ายกัน" เบื้องหลัง (รันผ่าน Flask CLI / cron)
+
+    flask --app app related refresh
+
+- เวกเตอร์ TF-IDF ของนิยายที่เผยแพร่ทุกเรื่องจาก ชื่อเรื่อง + คำโปรย + แท็ก (ตัดคำไทยด้วย textseg)
+  เก็บเป็น sparse matrix (SciPy CSR) แถวละเรื่อง normalize ให้ยาว 1
+- cosine = X[chunk] · Xᵀ ทีละ chunk แล้วเลือก top-K ต่อแถวด้วย argpartition
+- คำที่อยู่ในเกือบทุกเรื่อง/มีแค่เรื่องเดียวถูกตัดทิ้ง และเก็บแค่ MAX_TERMS_PER_DOC คำที่น้ำหนักสูงสุด
+  ต่อเรื่อง → ผลคูณยัง sparse พอให้ 100k เรื่องจบในไม่กี่นาทีบน CPU เดียว
+- ผลเขียนลง novel_related (novels_id, rank_no) → novelcover.detail ดึงด้วย query เดียวผ่าน primary key
+"""
+from __future__ import annotations
+
+from contextlib import closing
+from datetime import datetime
+
+import click
+from flask import Blueprint
+from MySQLdb.cursors import DictCursor
+
+import textseg
+from db import get_db_connection
+from stats import set_job_mark
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # ให้แอปหลักรันได้แม้ไม่มี numpy/scipy (ใช้เฉพาะตอนรันงานนี้)
+    np = None
+    sparse = None
+
+related_bp = Blueprint("related", __name__, cli_group="related")
+
+RELATED_JOB = "novel_related"
+PUBLISHED_STATUSES = ("เผยแพร่", "จบแล้ว")
+
+TOP_K = 12
+MIN_SCORE = 0.05            # ต่ำกว่านี้ถือว่าไม่คล้าย ไม่ต้องเก็บ
+MIN_DF = 2                  # คำที่มีแค่เรื่องเดียวไม่ช่วยหาเรื่องคล้าย
+MAX_DF_RATIO = 0.3          # คำที่อยู่ในเกิน 30% ของเรื่องแทบไม่มีความหมาย
+MAX_TERMS_PER_DOC = 64
+TITLE_WEIGHT = 2            # นับคำในชื่อเรื่องซ้ำ (ชื่อเรื่องบอกแนวได้ดีกว่าคำโปรย)
+TAG_PREFIX = "#"            # แท็กเป็น token เดียวทั้งชื่อ แยกจากคำปกติ
+SIM_CHUNK = 1000
+WRITE_CHUNK = 1000
+
+
+def _load_documents(cur) -> list[dict]:
+    """ดึงข้อความของนิยายที่เผยแพร่ทุกเรื่อง (แท็กรวมมาเป็น list ต่อเรื่อง)"""
+    cur.execute(
+        """
+        SELECT novels_id, title, description
+        FROM novels
+        WHERE status IN (%s, %s)
+        ORDER BY novels_id
+        """,
+        PUBLISHED_STATUSES,
+    )
+    docs = list(cur.fetchall())
+    cur.execute(
+        """
+        SELECT nt.novels_id, t.name
+        FROM novels_tags nt
+        JOIN tags t ON t.tag_id = nt.tag_id
+        JOIN novels n ON n.novels_id = nt.novels_id AND n.status IN (%s, %s)
+        """,
+        PUBLISHED_STATUSES,
+    )
+    tags: dict[int, list[str]] = {}
+    for r in cur.fetchall():
+        tags.setdefault(int(r["novels_id"]), []).append(r["name"])
+    for d in docs:
+        d["tags"] = tags.get(int(d["novels_id"]), [])
+    return docs
+
+
+def _tokens(doc: dict) -> list[str]:
+    toks = [w for w in textseg.words(doc.get("title")) if len(w) > 1] * TITLE_WEIGHT
+    toks.extend(w for w in textseg.words(doc.get("description")) if len(w) > 1)
+    toks.extend(TAG_PREFIX + textseg.normalize(t).strip() for t in doc.get("tags") or () if t)
+    return toks
+
+
+def build_tfidf(docs: list[dict]):
+    """
+    คืน sparse matrix (n_docs × n_terms) ที่แต่ละแถวยาว 1
+
+    tf = 1 + log(count), idf = log((1 + N) / (1 + df)) + 1 แล้วตัดคำที่ df อยู่นอกช่วง
+    """
+    if np is None or sparse is None:
+        raise RuntimeError("งานเรื่องที่คล้ายกันต้องใช้ numpy และ scipy (pip install numpy scipy)")
+
+    vocab: dict[str, int] = {}
+    indptr = [0]
+    indices: list[int] = []
+    counts: list[int] = []
+    for doc in docs:
+        row: dict[int, int] = {}
+        for tok in _tokens(doc):
+            j = vocab.setdefault(tok, len(vocab))
+            row[j] = row.get(j, 0) + 1
+        indices.extend(row.keys())
+        counts.extend(row.values())
+        indptr.append(len(indices))
+
+    n = len(docs)
+    x = sparse.csr_matrix(
+        (np.asarray(counts, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr)),
+        shape=(n, max(len(vocab), 1)),
+    )
+    x.sum_duplicates()
+
+    df = np.bincount(x.indices, minlength=x.shape[1])
+    keep = (df >= MIN_DF) & (df <= max(MIN_DF, MAX_DF_RATIO * n))
+    idf = np.where(keep, np.log((1.0 + n) / (1.0 + df)) + 1.0, 0.0).astype(np.float32)
+
+    x.data = (1.0 + np.log(x.data)) * idf[x.indices]
+    x.eliminate_zeros()
+
+    # เก็บแค่คำน้ำหนักสูงสุดต่อเรื่อง (คำโปรยยาว ๆ มีคำทั่วไปเยอะ)
+    for i in range(n):
+        lo, hi = x.indptr[i], x.indptr[i + 1]
+        if hi - lo > MAX_TERMS_PER_DOC:
+            seg = x.data[lo:hi]
+            cut = np.partition(seg, -MAX_TERMS_PER_DOC)[-MAX_TERMS_PER_DOC]
+            seg[seg < cut] = 0.0
+    x.eliminate_zeros()
+
+    norms = np.sqrt(np.asarray(x.multiply(x).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags((1.0 / norms).astype(np.float32)).dot(x).tocsr()
+
+
+def top_neighbours(x, k: int = TOP_K, chunk: int = SIM_CHUNK):
+    """yield (แถว, [(แถวเพื่อนบ้าน, cosine)]) เรียงคะแนนมากไปน้อย ไม่รวมตัวเอง"""
+    xt = x.T.tocsc()
+    n = x.shape[0]
+    for start in range(0, n, chunk):
+        sims = x[start:start + chunk].dot(xt).tocsr()
+        for r in range(sims.shape[0]):
+            i = start + r
+            lo, hi = sims.indptr[r], sims.indptr[r + 1]
+            cols = sims.indices[lo:hi]
+            vals = sims.data[lo:hi]
+            mask = (cols != i) & (vals >= MIN_SCORE)
+            cols, vals = cols[mask], vals[mask]
+            if cols.size > k:
+                part = np.argpartition(vals, -k)[-k:]
+                cols, vals = cols[part], vals[part]
+            order = np.lexsort((cols, -vals))
+            yield i, [(int(cols[o]), float(vals[o])) for o in order]
+
+
+def refresh_related(conn, k: int = TOP_K, chunk: int = WRITE_CHUNK) -> dict:
+    """คำนวณและเขียน novel_related ใหม่ทั้งตาราง (ลบแถวที่ไม่ได้ถูกเขียนในรอบนี้)"""
+    started = datetime.now().replace(microsecond=0)
+    written = 0
+    with conn.cursor(DictCursor) as cur:
+        docs = _load_documents(cur)
+        if docs:
+            x = build_tfidf(docs)
+            ids = [int(d["novels_id"]) for d in docs]
+            batch = []
+            for i, neighbours in top_neighbours(x, k=k):
+                for rank_no, (j, score) in enumerate(neighbours, start=1):
+                    batch.append((ids[i], rank_no, ids[j], round(score, 6), started))
+                if len(batch) >= chunk:
+                    written += _write_batch(cur, batch)
+                    conn.commit()
+                    batch = []
+            if batch:
+                written += _write_batch(cur, batch)
+                conn.commit()
+
+        cur.execute("DELETE FROM novel_related WHERE computed_at < %s", (started,))
+        removed = cur.rowcount
+        set_job_mark(cur, RELATED_JOB, started)
+    conn.commit()
+    return {"novels": len(docs), "written": written, "removed": removed}
+
+
+def _write_batch(cur, batch) -> int:
+    cur.executemany(
+        """
+        INSERT INTO novel_related (novels_id, rank_no, related_id, score, computed_at)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            related_id  = VALUES(related_id),
+            score       = VALUES(score),
+            computed_at = VALUES(computed_at)
+        """,
+        batch,
+    )
+    return len(batch)
+
+
+# ---------- CLI ----------
+@related_bp.cli.command("refresh")
+@click.option("--top-k", default=TOP_K, show_default=True, help="จำนวนเรื่องที่คล้ายกันต่อเรื่อง")
+@click.option("--chunk", default=WRITE_CHUNK, show_default=True, help="จำนวนแถวต่อ batch ตอนเขียน")
+def refresh_command(top_k: int, chunk: int):
+    """คำนวณ novel_related ใหม่ (ตั้ง cron วันละครั้ง)"""
+    with closing(get_db_connection()) as conn:
+        result = refresh_related(conn, k=max(1, top_k), chunk=max(1, chunk))
+    click.echo(
+        f"related refresh: novels={result['novels']} written={result['written']} "
+        f"removed={result['removed']}"
+    )
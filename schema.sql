@@ -0,0 +1,181 @@
+-- schema.sql
+-- ตารางเสริมที่แอปสร้างเอง (db.init_db จะรันไฟล์นี้ตอนเริ่มแอป)
+-- ทุกคำสั่งต้องรันซ้ำได้ (IF NOT EXISTS) และห้ามใส่เครื่องหมาย semicolon ในคอมเมนต์
+-- เพราะ init_db แยกคำสั่งด้วย semicolon
+-- CREATE INDEX บนตารางเดิมใช้ได้ (init_db ข้าม error ชื่อ index ซ้ำ เมื่อรันครั้งถัดไป)
+
+-- สถานะของงานเบื้องหลัง (เก็บ watermark ล่าสุดที่ประมวลผลแล้ว)
+CREATE TABLE IF NOT EXISTS job_state (
+  job_name    VARCHAR(64) NOT NULL,
+  last_mark   DATETIME    NULL,
+  updated_at  DATETIME    NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (job_name)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- rollup-daily สแกนเฉพาะแถวที่ last_read_at >= watermark และหา MAX(last_read_at)
+CREATE INDEX idx_rh_last_read ON reading_history (last_read_at, novels_id);
+
+-- ผู้อ่านที่อ่านถึง 95% เป็นครั้งแรก (ใช้คำนวณ new_completions รายวัน)
+CREATE TABLE IF NOT EXISTS novel_completions (
+  novels_id     INT  NOT NULL,
+  users_id      INT  NOT NULL,
+  completed_on  DATE NOT NULL,
+  PRIMARY KEY (novels_id, users_id),
+  KEY idx_completions_day (novels_id, completed_on)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- สถิติการอ่านรายวันต่อเรื่อง (เติมโดย flask stats rollup-daily)
+CREATE TABLE IF NOT EXISTS novel_daily_stats (
+  novels_id        INT          NOT NULL,
+  stat_date        DATE         NOT NULL,
+  views            INT          NOT NULL DEFAULT 0,
+  unique_readers   INT          NOT NULL DEFAULT 0,
+  new_completions  INT          NOT NULL DEFAULT 0,
+  avg_progress     DECIMAL(5,2) NOT NULL DEFAULT 0,
+  updated_at       DATETIME     NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (novels_id, stat_date)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- ตัวนับสะสมต่อเรื่อง (อัปเดตตอนมี event เขียน + flask stats refresh-counters)
+-- rating_avg เป็นค่าเฉลี่ยแบบ Bayesian ที่งาน refresh คำนวณให้ (NULL = ยังไม่เคยคำนวณ, 0 = ยังไม่มีโหวต เหมือน novel_rankings)
+CREATE TABLE IF NOT EXISTS novel_counters (
+  novels_id     INT          NOT NULL,
+  users_id      INT          NOT NULL,
+  chapters      INT          NOT NULL DEFAULT 0,
+  views         INT          NOT NULL DEFAULT 0,
+  readers       INT          NOT NULL DEFAULT 0,
+  likes         INT          NOT NULL DEFAULT 0,
+  bookshelf     INT          NOT NULL DEFAULT 0,
+  comments      INT          NOT NULL DEFAULT 0,
+  rating_count  INT          NOT NULL DEFAULT 0,
+  rating_sum    INT          NOT NULL DEFAULT 0,
+  rating_avg    DECIMAL(6,4) NULL,
+  updated_at    DATETIME     NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (novels_id),
+  KEY idx_counters_writer (users_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- ตัวนับรวมต่อผู้เขียน (ผลรวมจาก novel_counters ของผู้เขียนคนนั้น)
+CREATE TABLE IF NOT EXISTS writer_counters (
+  users_id         INT      NOT NULL,
+  work_count       INT      NOT NULL DEFAULT 0,
+  total_views      INT      NOT NULL DEFAULT 0,
+  total_likes      INT      NOT NULL DEFAULT 0,
+  total_bookshelf  INT      NOT NULL DEFAULT 0,
+  total_comments   INT      NOT NULL DEFAULT 0,
+  updated_at       DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (users_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- คะแนนจัดอันดับที่คำนวณล่วงหน้า (เติมโดย flask ranking refresh)
+-- search.search_novels เรียงผลด้วยคอลัมน์ในตารางนี้แทนการ join view หลายตัว
+CREATE TABLE IF NOT EXISTS novel_rankings (
+  novels_id        INT          NOT NULL,
+  bayesian_avg     DECIMAL(6,4) NOT NULL DEFAULT 0,
+  votes            INT          NOT NULL DEFAULT 0,
+  bookshelf_users  INT          NOT NULL DEFAULT 0,
+  total_chapters   INT          NOT NULL DEFAULT 0,
+  active_readers   INT          NOT NULL DEFAULT 0,
+  activity_score   DOUBLE       NOT NULL DEFAULT 0,
+  relevance_score  DOUBLE       NOT NULL DEFAULT 0,
+  computed_at      DATETIME     NOT NULL,
+  PRIMARY KEY (novels_id),
+  KEY idx_rank_rating (bayesian_avg, votes),
+  KEY idx_rank_bookshelf (bookshelf_users),
+  KEY idx_rank_active (active_readers),
+  KEY idx_rank_chapters (total_chapters),
+  KEY idx_rank_relevance (relevance_score)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- log การแก้ไขนิยายที่กระทบดัชนีค้นหา (search_index.mark_novel_changed)
+-- แต่ละ worker อ่านแถวที่ change_id มากกว่าที่ตัวเอง sync แล้ว เพื่ออัปเดตดัชนีในหน่วยความจำ
+CREATE TABLE IF NOT EXISTS search_changes (
+  change_id   BIGINT   NOT NULL AUTO_INCREMENT,
+  novels_id   INT      NOT NULL,
+  changed_at  DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (change_id),
+  KEY idx_search_changes_time (changed_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- log ตอนที่เนื้อหาเปลี่ยน (chapter_index.mark_chapter_changed)
+-- worker ใช้อัปเดตดัชนีเนื้อหาตอนระหว่างรอบ flask search build-chapter-index
+CREATE TABLE IF NOT EXISTS chapter_changes (
+  change_id    BIGINT   NOT NULL AUTO_INCREMENT,
+  chapters_id  INT      NOT NULL,
+  changed_at   DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (change_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- เรื่องที่คล้ายกัน K อันดับแรกต่อเรื่อง (เติมโดย flask related refresh)
+-- novelcover.detail ดึงด้วย novels_id ผ่าน primary key
+CREATE TABLE IF NOT EXISTS novel_related (
+  novels_id    INT      NOT NULL,
+  rank_no      SMALLINT NOT NULL,
+  related_id   INT      NOT NULL,
+  score        DOUBLE   NOT NULL DEFAULT 0,
+  computed_at  DATETIME NOT NULL,
+  PRIMARY KEY (novels_id, rank_no),
+  KEY idx_related_computed (computed_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- สรุปความคิดเห็นผู้อ่านต่อเรื่อง (dirty = 1 เมื่อมีคอมเมนต์ใหม่/ถูกลบหลังสรุปล่าสุด)
+CREATE TABLE IF NOT EXISTS comment_summaries (
+  novels_id     INT        NOT NULL,
+  summary_text  MEDIUMTEXT NULL,
+  last_cm_id    INT        NULL,
+  dirty         TINYINT(1) NOT NULL DEFAULT 1,
+  updated_at    DATETIME   NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (novels_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- คิวงานสรุปความคิดเห็น แถวเดียวต่อเรื่อง (summary_jobs.enqueue / claim_next)
+-- request_seq เพิ่มทุกครั้งที่มีคนขอ, claimed_seq = ค่าตอน worker เคลม → ถ้าต่างกันตอนจบให้รันอีกรอบ
+CREATE TABLE IF NOT EXISTS summary_jobs (
+  novels_id     INT          NOT NULL,
+  status        VARCHAR(16)  NOT NULL DEFAULT 'queued',
+  request_seq   INT          NOT NULL DEFAULT 1,
+  claimed_seq   INT          NOT NULL DEFAULT 0,
+  attempts      INT          NOT NULL DEFAULT 0,
+  requested_at  DATETIME     NOT NULL,
+  started_at    DATETIME     NULL,
+  finished_at   DATETIME     NULL,
+  worker        VARCHAR(64)  NULL,
+  error         VARCHAR(255) NULL,
+  PRIMARY KEY (novels_id),
+  KEY idx_summary_jobs_status (status, requested_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- ผลต่อรอบของ flask summary batch (throughput / token / ต้นทุน)
+CREATE TABLE IF NOT EXISTS summary_runs (
+  run_id            BIGINT        NOT NULL AUTO_INCREMENT,
+  started_at        DATETIME      NOT NULL,
+  elapsed_sec       DOUBLE        NOT NULL DEFAULT 0,
+  selected          INT           NOT NULL DEFAULT 0,
+  planned           INT           NOT NULL DEFAULT 0,
+  over_budget       INT           NOT NULL DEFAULT 0,
+  done              INT           NOT NULL DEFAULT 0,
+  failed            INT           NOT NULL DEFAULT 0,
+  skipped           INT           NOT NULL DEFAULT 0,
+  calls             INT           NOT NULL DEFAULT 0,
+  input_tokens      BIGINT        NOT NULL DEFAULT 0,
+  output_tokens     BIGINT        NOT NULL DEFAULT 0,
+  estimated_tokens  BIGINT        NOT NULL DEFAULT 0,
+  cost_usd          DECIMAL(12,6) NOT NULL DEFAULT 0,
+  novels_per_min    DOUBLE        NOT NULL DEFAULT 0,
+  tokens_per_sec    DOUBLE        NOT NULL DEFAULT 0,
+  PRIMARY KEY (run_id),
+  KEY idx_summary_runs_started (started_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- สรุปย่อยต่อ chunk ของคอมเมนต์ (ขั้น map ของ summary_jobs.map_reduce_summary)
+-- เก็บเฉพาะ chunk ที่เต็มแล้ว ต่อเนื่องจาก chunk_no 0 เสมอ → รอบถัดไปเรียกโมเดลเฉพาะคอมเมนต์หลัง last_cm_id ของ chunk สุดท้าย
+CREATE TABLE IF NOT EXISTS comment_summary_chunks (
+  novels_id     INT      NOT NULL,
+  chunk_no      INT      NOT NULL,
+  first_cm_id   INT      NOT NULL,
+  last_cm_id    INT      NOT NULL,
+  n_comments    INT      NOT NULL DEFAULT 0,
+  summary_text  TEXT     NOT NULL,
+  created_at    DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (novels_id, chunk_no)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -1,8 +1,21 @@
 # search.py
-from flask import Blueprint, request, render_template
-from db import mysql
+import hashlib
+from contextlib import closing
+from datetime import datetime, date
+from decimal import Decimal
+
+import click
+from flask import Blueprint, request, render_template, current_app, jsonify, url_for
+from itsdangerous import BadData, URLSafeSerializer
+from db import mysql, get_db_connection
 import MySQLdb.cursors
 
+import chapter_index
+import search_cache
+import search_index
+import search_suggest
+import tag_cache
+
 search_bp = Blueprint('search', __name__)
 
 SORT_OPTIONS = {
@@ -14,38 +27,182 @@ SORT_OPTIONS = {
     'chapters': 'จำนวนตอนมากสุด',
 }
 
-@search_bp.route('/search')
-def search_novels():
-    q = request.args.get('q', '').strip()
-    scope = request.args.get('scope', 'all')        # all/title/author/desc/tag
-    sort = request.args.get('sort', 'relevance')
-    cate_id = request.args.get('cate_id', type=int) # หมวดที่เลือก (หรือ None)
+# mapping sort -> คีย์เรียง [(นิพจน์ SQL, ชื่อคอลัมน์ในผลลัพธ์)] เรียง DESC ทุกคีย์
+# (คอลัมน์คะแนนมาจาก novel_rankings ที่ `flask ranking refresh` คำนวณไว้)
+# ท้ายสุดจะต่อด้วย n.novels_id เสมอ → ลำดับไม่กำกวม ใช้ทำ keyset pagination ได้
+SORT_KEYS = {
+    'new': (("n.created_at", "created_at"),),
+    'rating': (("COALESCE(rk.bayesian_avg, 0)", "bayesian_avg"),
+               ("COALESCE(rk.votes, 0)", "votes"),
+               ("n.created_at", "created_at")),
+    'bookshelf': (("COALESCE(rk.bookshelf_users, 0)", "bookshelf_users"),
+                  ("n.created_at", "created_at")),
+    'active': (("COALESCE(rk.active_readers, 0)", "active_readers"),
+               ("n.created_at", "created_at")),
+    'chapters': (("COALESCE(rk.total_chapters, 0)", "total_chapters"),
+                 ("n.created_at", "created_at")),
+    'relevance': (("COALESCE(rk.relevance_score, 0)", "relevance_score"),
+                  ("n.created_at", "created_at")),
+}
+TIEBREAK_KEY = ("n.novels_id", "novels_id")
 
-    # mapping sort -> ORDER BY
-    order_by_map = {
-        'new': "n.created_at DESC",
-        'rating': "bayesian_avg DESC, votes DESC, n.created_at DESC",
-        'bookshelf': "bookshelf_users DESC, n.created_at DESC",
-        'active': "active_readers DESC, n.created_at DESC",
-        'chapters': "total_chapters DESC, n.created_at DESC",
-        'relevance': "bayesian_avg DESC, active_readers DESC, n.created_at DESC",
-    }
-    order_by_sql = order_by_map.get(sort, order_by_map['relevance'])
+# ตัวกรองสถานะจาก facet "จบแล้ว / ยังไม่จบ"
+STATUS_FILTERS = {
+    'completed': 'จบแล้ว',
+    'ongoing': 'เผยแพร่',
+}
 
-    where_clauses = []
-    params = []
+RESULT_LIMIT = 50
+CHAPTER_RESULT_LIMIT = 20
+# จำนวน novels_id ต่อ statement ตอนส่งผลทั้งหมดจากดัชนีให้ SQL เรียงตาม sort อื่นที่ไม่ใช่ relevance
+CANDIDATE_CHUNK = 2000
+# salt ของ token หน้าถัดไป (เซ็นด้วย SECRET_KEY กันแก้ไข)
+CURSOR_SALT = 'search-cursor'
+# เก็บ search_changes ไว้กี่วันหลัง build-index (worker ที่ค้างนานกว่านี้จะโหลด snapshot ใหม่)
+CHANGES_RETENTION_DAYS = 7
 
-    # แสดงเฉพาะนิยายเผยแพร่/จบแล้ว
-    where_clauses.append("n.status IN ('เผยแพร่', 'จบแล้ว')")
+# engine ค้นหาที่เลือกได้ผ่าน config SEARCH_ENGINE
+#   index    = inverted index ในหน่วยความจำ (search_index.py)
+#   fulltext = MySQL FULLTEXT + ngram parser (ต้องรัน `flask search fulltext-setup` ก่อน)
+#   like     = LIKE '%kw%' แบบเดิม (ใช้เป็น fallback ของทุก engine ด้วย)
+SEARCH_ENGINES = ('index', 'fulltext', 'like')
 
-    # filter ตามหมวดหมู่ถ้ามีเลือก
-    if cate_id:
-        where_clauses.append("n.cate_id = %s")
-        params.append(cate_id)
+# (ตาราง, ชื่อ index, คอลัมน์) ของ FULLTEXT ที่ engine fulltext ใช้
+# MATCH(...) ต้องระบุคอลัมน์ให้ตรงกับ index ตัวใดตัวหนึ่งเป๊ะ ๆ จึงต้องมีแยกต่อ scope
+FULLTEXT_INDEXES = (
+    ('novels', 'ft_novels_title_desc', ('title', 'description')),
+    ('novels', 'ft_novels_title', ('title',)),
+    ('novels', 'ft_novels_desc', ('description',)),
+    ('tags', 'ft_tags_name', ('name',)),
+)
+# อักขระที่เป็น operator ของ boolean mode (ตัดทิ้งจากคำค้นของผู้ใช้)
+_FT_OPERATORS = str.maketrans('', '', '+-<>()~*"@')
 
-    # เตรียม keyword
-    keywords = [w.strip() for w in q.split() if w.strip()] if q else []
+RESULT_SELECT_SQL = """
+    SELECT
+        n.novels_id,
+        n.title,
+        n.description,
+        n.cover,
+        n.status,
+        n.created_at,
+        n.updated_at,
+
+        u.users_id              AS author_id,
+        u.username              AS author_name,
+
+        c.cate_id,
+        c.name                  AS category_name,
+
+        COALESCE(rk.bayesian_avg, 0)    AS bayesian_avg,
+        COALESCE(rk.votes, 0)           AS votes,
+        COALESCE(rk.bookshelf_users, 0) AS bookshelf_users,
+        COALESCE(rk.total_chapters, 0)  AS total_chapters,
+        COALESCE(rk.active_readers, 0)  AS active_readers,
+        COALESCE(rk.relevance_score, 0) AS relevance_score
+
+    FROM novels n
+    JOIN users u
+        ON u.users_id = n.users_id
+    LEFT JOIN categories c
+        ON c.cate_id = n.cate_id
+    LEFT JOIN novel_rankings rk
+        ON rk.novels_id = n.novels_id
+"""
+# join ข้างบนเป็น 1:1 ทั้งหมด จึงไม่ต้อง GROUP BY (ชื่อแท็กเติมทีหลังด้วย tag_cache.attach_tag_names)
+
+
+# ---------- keyset pagination ----------
+def _cursor_serializer():
+    return URLSafeSerializer(current_app.secret_key, salt=CURSOR_SALT)
+
+
+def _cursor_value(v):
+    # ค่าใน token ต้องเป็น JSON ได้ และส่งกลับเข้า SQL เทียบกับคอลัมน์เดิมได้ตรง ๆ
+    if isinstance(v, (datetime, date)):
+        return str(v)
+    if isinstance(v, Decimal):
+        return str(v)
+    return v
+
+
+def _query_fingerprint(*parts):
+    raw = "|".join("" if p is None else str(p) for p in parts)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def encode_cursor(fingerprint, values):
+    """token ทึบของหน้าถัดไป = ค่าคีย์เรียงของแถวสุดท้าย + fingerprint ของคำค้น"""
+    return _cursor_serializer().dumps({"f": fingerprint, "v": [_cursor_value(v) for v in values]})
+
+
+def decode_cursor(token, fingerprint):
+    """คืนค่าคีย์เรียงจาก token (None ถ้า token เสีย/ไม่ใช่ของคำค้นนี้ → เริ่มหน้าแรก)"""
+    if not token:
+        return None
+    try:
+        data = _cursor_serializer().loads(token)
+    except BadData:
+        return None
+    if not isinstance(data, dict) or data.get("f") != fingerprint:
+        return None
+    values = data.get("v")
+    return values if isinstance(values, list) else None
 
+
+def _sort_keys(sort):
+    return tuple(SORT_KEYS.get(sort, SORT_KEYS['relevance'])) + (TIEBREAK_KEY,)
+
+
+def _fetch_results(cur, where_clauses, params, sort_keys, after=None, limit=RESULT_LIMIT,
+                   extra_select="", extra_params=()):
+    """
+    ดึงผลหนึ่งหน้า เรียงตาม sort_keys (DESC ทั้งหมด, คีย์สุดท้ายต้องเป็น novels_id)
+    after = ค่าคีย์ของแถวสุดท้ายหน้าก่อน → WHERE (k1, k2, ..) < (after) แทน OFFSET
+    คีย์อาจมี param ของตัวเองเป็นสมาชิกตัวที่ 3 (เช่นคะแนน MATCH ของ fulltext)
+    คืน (rows, ค่าคีย์ของแถวสุดท้ายถ้ายังมีหน้าถัดไป หรือ None)
+    """
+    where_clauses = list(where_clauses)
+    params = list(params)
+    if after is not None and len(after) == len(sort_keys):
+        exprs = ", ".join(k[0] for k in sort_keys)
+        where_clauses.append(f"({exprs}) < ({', '.join(['%s'] * len(after))})")
+        for k in sort_keys:
+            params.extend(k[2] if len(k) > 2 else ())
+        params.extend(after)
+
+    where_sql = " AND ".join(where_clauses) if where_clauses else "1"
+    order_by_sql = ", ".join(f"{k[1]} DESC" for k in sort_keys)
+    select_sql = RESULT_SELECT_SQL
+    if extra_select:
+        select_sql = select_sql.replace("\n    FROM novels n", f",\n        {extra_select}\n    FROM novels n", 1)
+    sql = f"""
+        {select_sql}
+        WHERE {where_sql}
+        ORDER BY {order_by_sql}
+        LIMIT {int(limit) + 1}
+    """
+    cur.execute(sql, list(extra_params) + params)
+    rows = list(cur.fetchall())
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, [rows[-1][k[1]] for k in sort_keys]
+
+
+def _tag_clause(tag_ids):
+    """เงื่อนไขกรองเรื่องที่มีแท็กใน tag_ids (ผ่าน primary key ของ novels_tags)"""
+    if not tag_ids:
+        return "0", []
+    placeholders = ", ".join(["%s"] * len(tag_ids))
+    return f"n.novels_id IN (SELECT novels_id FROM novels_tags WHERE tag_id IN ({placeholders}))", list(tag_ids)
+
+
+def _like_clauses(cur, keywords, scope):
+    """เงื่อนไข LIKE แบบเดิม (ใช้เมื่อดัชนีค้นหายังไม่พร้อม) ส่วนแท็ก resolve เป็น tag_id ก่อน"""
+    where_clauses = []
+    params = []
+    tags = tag_cache.get_tag_cache(cur) if scope in ('tag', 'all') else None
     for kw in keywords:
         like = f"%{kw}%"
         if scope == 'title':
@@ -58,92 +215,254 @@ def search_novels():
             where_clauses.append("n.description LIKE %s")
             params.append(like)
         elif scope == 'tag':
-            where_clauses.append("t.name LIKE %s")
-            params.append(like)
+            tag_sql, tag_params = _tag_clause(tags.resolve(kw))
+            where_clauses.append(tag_sql)
+            params.extend(tag_params)
         else:  # all
-            where_clauses.append("""
+            tag_sql, tag_params = _tag_clause(tags.resolve(kw))
+            where_clauses.append(f"""
                 (
                     n.title       LIKE %s
                     OR n.description LIKE %s
                     OR u.username LIKE %s
                     OR c.name     LIKE %s
-                    OR t.name     LIKE %s
+                    OR {tag_sql}
                 )
             """)
-            params.extend([like, like, like, like, like])
+            params.extend([like, like, like, like, *tag_params])
+    return where_clauses, params
 
-    where_sql = " AND ".join(where_clauses) if where_clauses else "1"
 
-    sql = f"""
-        SELECT
-            n.novels_id,
-            n.title,
-            n.description,
-            n.cover,
-            n.status,
-            n.created_at,
-            n.updated_at,
-
-            u.users_id              AS author_id,
-            u.username              AS author_name,
-
-            c.cate_id,
-            c.name                  AS category_name,
-
-            COALESCE(r.bayesian_avg, 0)    AS bayesian_avg,
-            COALESCE(r.votes, 0)           AS votes,
-            COALESCE(b.bookshelf_users, 0) AS bookshelf_users,
-            COALESCE(ch.total_chapters, 0) AS total_chapters,
-            COALESCE(m.active_readers, 0)  AS active_readers,
-
-            GROUP_CONCAT(DISTINCT t.name ORDER BY t.name SEPARATOR ', ') AS tag_names
-
-        FROM novels n
-        JOIN users u
-            ON u.users_id = n.users_id
-        LEFT JOIN categories c
-            ON c.cate_id = n.cate_id
-        LEFT JOIN v_novel_rating_stats r
-            ON r.novels_id = n.novels_id
-        LEFT JOIN v_novel_bookshelf_counts b
-            ON b.novels_id = n.novels_id
-        LEFT JOIN v_novel_chapter_counts ch
-            ON ch.novels_id = n.novels_id
-        LEFT JOIN v_monthly_active_readers_by_novel m
-            ON m.novels_id = n.novels_id
-        LEFT JOIN novels_tags nt
-            ON nt.novels_id = n.novels_id
-        LEFT JOIN tags t
-            ON t.tag_id = nt.tag_id
+def _fulltext_phrase(kw):
+    """แปลงคีย์เวิร์ดเป็น phrase ของ boolean mode (ngram parser จะตัดเป็น n-gram ให้เอง)"""
+    kw = kw.translate(_FT_OPERATORS).strip()
+    return f'"{kw}"' if kw else ""
 
-        WHERE {where_sql}
 
-        GROUP BY
-            n.novels_id,
-            n.title,
-            n.description,
-            n.cover,
-            n.status,
-            n.created_at,
-            n.updated_at,
-            u.users_id,
-            u.username,
-            c.cate_id,
-            c.name,
-            r.bayesian_avg,
-            r.votes,
-            b.bookshelf_users,
-            ch.total_chapters,
-            m.active_readers
+def _fulltext_search(cur, keywords, scope, sort, where_clauses, params, after=None):
+    """
+    ค้นด้วย MATCH ... AGAINST (IN BOOLEAN MODE) บน FULLTEXT ngram
+    - AND ระหว่างคีย์เวิร์ด, ภายในคีย์เวิร์ดเดียว OR ข้ามฟิลด์ตาม scope (เหมือน LIKE เดิม)
+    - ชื่อผู้เขียน/หมวดเป็นตารางเล็ก ยังใช้ LIKE
+    - ft_score = คะแนน MATCH ของชื่อเรื่อง+คำโปรย ใช้เรียงเมื่อ sort=relevance
+    """
+    terms = [(kw, _fulltext_phrase(kw)) for kw in keywords]
+    terms = [(kw, phrase) for kw, phrase in terms if phrase]
+    if not terms:
+        return None
+    phrases = [phrase for _, phrase in terms]
 
-        ORDER BY {order_by_sql}
-        LIMIT 50
+    tag_match = (
+        "n.novels_id IN (SELECT nt2.novels_id FROM novels_tags nt2 "
+        "JOIN tags t2 ON t2.tag_id = nt2.tag_id "
+        "WHERE MATCH(t2.name) AGAINST (%s IN BOOLEAN MODE))"
+    )
+    ft_clauses = []
+    ft_params = []
+    for kw, phrase in terms:
+        like = f"%{kw}%"
+        if scope == 'title':
+            ft_clauses.append("MATCH(n.title) AGAINST (%s IN BOOLEAN MODE)")
+            ft_params.append(phrase)
+        elif scope == 'desc':
+            ft_clauses.append("MATCH(n.description) AGAINST (%s IN BOOLEAN MODE)")
+            ft_params.append(phrase)
+        elif scope == 'author':
+            ft_clauses.append("u.username LIKE %s")
+            ft_params.append(like)
+        elif scope == 'tag':
+            ft_clauses.append(tag_match)
+            ft_params.append(phrase)
+        else:  # all
+            ft_clauses.append(f"""
+                (
+                    MATCH(n.title, n.description) AGAINST (%s IN BOOLEAN MODE)
+                    OR {tag_match}
+                    OR u.username LIKE %s
+                    OR c.name     LIKE %s
+                )
+            """)
+            ft_params.extend([phrase, phrase, like, like])
+
+    score_expr = "MATCH(n.title, n.description) AGAINST (%s IN BOOLEAN MODE)"
+    score_params = (" ".join(phrases),)
+    sort_keys = _sort_keys(sort)
+    if sort == 'relevance' or sort not in SORT_KEYS:
+        sort_keys = ((score_expr, "ft_score", score_params),) + sort_keys
+
+    return _fetch_results(
+        cur,
+        where_clauses + ft_clauses,
+        params + ft_params,
+        sort_keys,
+        after=after,
+        extra_select=f"{score_expr} AS ft_score",
+        extra_params=score_params,
+    )
+
+
+def _search_engine():
+    engine = current_app.config.get('SEARCH_ENGINE', 'index')
+    return engine if engine in SEARCH_ENGINES else 'index'
+
+
+def _index_search(cur, index, scores, filters, sort, where_clauses, params, after=None):
+    """
+    ดึงข้อมูลแสดงผลของผลจาก inverted index (scores = index.match(...))
+    filters = (cate_id, statuses, tag_id) กรองในหน่วยความจำก่อนส่ง novels_id ให้ SQL
     """
+    cate_id, statuses, tag_id = filters
+    if sort == 'relevance' or sort not in SORT_KEYS:
+        # เรียงตามคะแนน BM25: keyset = (score, novels_id) ของแถวสุดท้าย
+        hits = index.filter_hits(scores, cate_id, statuses, tag_id)
+        if after is not None and len(after) == 2:
+            last_score, last_id = float(after[0]), int(after[1])
+            hits = [h for h in hits if (h[1], h[0]) < (last_score, last_id)]
+        page = hits[:RESULT_LIMIT]
+        if not page:
+            return [], None
+        ids = [nid for nid, _ in page]
+        placeholders = ", ".join(["%s"] * len(ids))
+        rows, _ = _fetch_results(
+            cur,
+            where_clauses + [f"n.novels_id IN ({placeholders})"],
+            params + ids,
+            _sort_keys('relevance'),
+            limit=len(ids),
+        )
+        rank = {nid: i for i, nid in enumerate(ids)}
+        rows.sort(key=lambda r: rank.get(r['novels_id'], len(rank)))
+        next_after = [page[-1][1], page[-1][0]] if len(hits) > RESULT_LIMIT else None
+        return rows, next_after
+
+    # sort อื่น: ส่งผลทุกเรื่องให้ SQL เป็นชุดละ CANDIDATE_CHUNK แล้ว merge หน้าบนสุดของแต่ละชุด
+    # (หน้าบนสุดรวมทุกชุด = หน้าบนสุดของผลทั้งหมด → keyset แบ่งหน้าได้จนหมดผลเหมือนค้นแบบ LIKE)
+    hits = index.filter_hits(scores, cate_id, statuses, tag_id)
+    if not hits:
+        return [], None
+    ids = sorted(nid for nid, _ in hits)
+    sort_keys = _sort_keys(sort)
+    rows, more = [], False
+    for i in range(0, len(ids), CANDIDATE_CHUNK):
+        chunk = ids[i:i + CANDIDATE_CHUNK]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        chunk_rows, chunk_next = _fetch_results(
+            cur,
+            where_clauses + [f"n.novels_id IN ({placeholders})"],
+            params + chunk,
+            sort_keys,
+            after=after,
+        )
+        rows.extend(chunk_rows)
+        more = more or chunk_next is not None
+    rows.sort(key=lambda r: [(r[k[1]] is not None, r[k[1]]) for k in sort_keys], reverse=True)
+    more = more or len(rows) > RESULT_LIMIT
+    rows = rows[:RESULT_LIMIT]
+    if not more or not rows:
+        return rows, None
+    return rows, [rows[-1][k[1]] for k in sort_keys]
+
+
+
+@search_bp.route('/search')
+def search_novels():
+    q = request.args.get('q', '').strip()
+    scope = request.args.get('scope', 'all')        # all/title/author/desc/tag
+    sort = request.args.get('sort', 'relevance')
+    cate_id = request.args.get('cate_id', type=int) # หมวดที่เลือก (หรือ None)
+    cursor_token = request.args.get('cursor')       # token หน้าถัดไป (จาก next_cursor)
+    status = request.args.get('status', '')         # '' / completed / ongoing
+    if status not in STATUS_FILTERS:
+        status = ''
+    tag_id = request.args.get('tag_id', type=int)   # แท็กที่เลือกจาก facet (หรือ None)
+
+    where_clauses = []
+    params = []
+
+    # แสดงเฉพาะนิยายเผยแพร่/จบแล้ว (หรือสถานะเดียวถ้าเลือก facet)
+    if status:
+        where_clauses.append("n.status = %s")
+        params.append(STATUS_FILTERS[status])
+    else:
+        where_clauses.append("n.status IN ('เผยแพร่', 'จบแล้ว')")
+
+    # filter ตามหมวดหมู่ถ้ามีเลือก
+    if cate_id:
+        where_clauses.append("n.cate_id = %s")
+        params.append(cate_id)
+
+    # filter ตามแท็กที่เลือกจาก facet
+    if tag_id:
+        where_clauses.append("n.novels_id IN (SELECT novels_id FROM novels_tags WHERE tag_id = %s)")
+        params.append(tag_id)
+
+    # เตรียม keyword
+    keywords = [w.strip() for w in q.split() if w.strip()] if q else []
 
     cur = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    cur.execute(sql, params)
-    results = cur.fetchall()
+    engine = _search_engine() if keywords else 'like'
+    page = None
+    # ดัชนีใช้ทั้งค้น (engine index) และนับ facet ไม่ว่า engine ไหนเป็นคนดึงผล
+    index = search_index.get_index()
+    if index is None and engine == 'index':
+        engine = 'like'
+
+    # token ผูกกับคำค้น (รูป normalize)+engine → ถ้าเปลี่ยนเงื่อนไขจะเริ่มหน้าแรกใหม่
+    norm_q = search_cache.normalize_query(keywords)
+    fingerprint = _query_fingerprint(engine, norm_q, scope, cate_id, sort, status, tag_id)
+    after = decode_cursor(cursor_token, fingerprint)
+    facets = None
+    fuzzy = False
+
+    cache = search_cache.get_cache()
+    cache_key = search_cache.make_key(engine, keywords, scope, sort, cate_id, status, tag_id, after)
+    cached = cache.get(cache_key) if cache is not None else None
+    if cached is not None:
+        page, facets, fuzzy = cached[:2], cached[2], cached[3]
+    elif engine == 'index':
+        # match ครั้งเดียว → ใช้ทั้งนับ facet (bitset) และกรอง/เรียงผลหน้านี้
+        scores = index.match(keywords, scope)
+        status_value = STATUS_FILTERS.get(status)
+        filters = (cate_id, (status_value,) if status_value else search_index.PUBLISHED_STATUSES, tag_id)
+        if len(index.filter_hits(scores, *filters)) < search_index.FUZZY_MIN_HITS:
+            # ผลตรงตัวน้อย (อาจพิมพ์ผิด) → เติมผลใกล้เคียงจาก trigram ต่อท้าย
+            merged = index.merge_fuzzy(scores, index.fuzzy_match(keywords, scope))
+            if len(merged) > len(scores):
+                scores = merged
+                fuzzy = True
+        facets = index.facets(scores.keys(), cate_id=cate_id, status=status_value, tag_id=tag_id)
+        page = _index_search(cur, index, scores, filters, sort, where_clauses, params, after)
+    elif engine == 'fulltext':
+        try:
+            page = _fulltext_search(cur, keywords, scope, sort, where_clauses, params, after)
+        except MySQLdb.Error as e:
+            # เช่นยังไม่ได้สร้าง FULLTEXT index → ใช้ LIKE แทน
+            current_app.logger.warning("fulltext search failed, falling back to LIKE: %s", e)
+            page = None
+
+    if page is None:
+        like_clauses, like_params = _like_clauses(cur, keywords, scope)
+        page = _fetch_results(
+            cur, where_clauses + like_clauses, params + like_params, _sort_keys(sort), after=after
+        )
+
+    if cached is None and facets is None and index is not None:
+        # engine อื่น / ไม่มีคำค้น → นับ facet จากชุดที่ดัชนี match (หรือทุกเรื่องที่เผยแพร่)
+        matched = index.match(keywords, scope).keys() if keywords else None
+        facets = index.facets(matched, cate_id=cate_id, status=STATUS_FILTERS.get(status), tag_id=tag_id)
+
+    results, next_after = page
+    if cached is None:
+        tag_cache.attach_tag_names(cur, results)
     cur.close()
+    if cache is not None and cached is None:
+        cache.put(
+            cache_key,
+            (results, next_after, facets, fuzzy),
+            [r['novels_id'] for r in results],
+            browse=not keywords,
+        )
+    next_cursor = encode_cursor(fingerprint, next_after) if next_after else None
 
     # ดึงหมวดหมู่ทั้งหมดสำหรับ dropdown "ทุกหมวด"
     cur = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
@@ -160,4 +479,144 @@ def search_novels():
         sort_options=SORT_OPTIONS,
         cate_id=cate_id,
         categories=categories,
+        next_cursor=next_cursor,
+        is_first_page=after is None,
+        status=status,
+        tag_id=tag_id,
+        facets=facets,
+        fuzzy=fuzzy,
     )
+
+
+@search_bp.route('/search/chapters')
+def search_chapters():
+    """ค้นข้อความ/ชื่อตัวละครในเนื้อหาตอน (เฉพาะตอนที่เผยแพร่ของนิยายที่เผยแพร่)"""
+    q = request.args.get('q', '').strip()
+    keywords = [w.strip() for w in q.split() if w.strip()] if q else []
+    hits = []
+    index_ready = True
+
+    if keywords:
+        idx = chapter_index.get_chapter_index()
+        if idx is None:
+            index_ready = False
+        else:
+            # ดัชนีมีเฉพาะตอนที่เผยแพร่แล้ว เงื่อนไขสถานะใน SQL เหลือไว้กันช่วงที่ worker ยัง sync ไม่ทัน
+            ranked = idx.search(keywords, limit=CHAPTER_RESULT_LIMIT)
+            if ranked:
+                ids = [cid for cid, _, _ in ranked]
+                cur = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+                cur.execute(
+                    f"""
+                    SELECT c.chapters_id, c.novels_id, c.chapter_no, c.title AS chapter_title,
+                           c.content_html, n.title AS novel_title, u.username AS author_name
+                    FROM chapters c
+                    JOIN novels n ON n.novels_id = c.novels_id
+                    LEFT JOIN users u ON u.users_id = n.users_id
+                    WHERE c.chapters_id IN ({", ".join(["%s"] * len(ids))})
+                      AND c.status = 'published'
+                      AND n.status IN ('เผยแพร่', 'จบแล้ว')
+                    """,
+                    ids,
+                )
+                rows = {r['chapters_id']: r for r in cur.fetchall()}
+                cur.close()
+                for cid, score, _ in ranked:
+                    r = rows.get(cid)
+                    if r is None:
+                        continue
+                    text = chapter_index.html_to_text(r.pop('content_html'))
+                    r['snippet'] = chapter_index.make_snippet(text, keywords)
+                    r['score'] = score
+                    hits.append(r)
+
+    return render_template('search_chapters.html', q=q, hits=hits, index_ready=index_ready)
+
+
+@search_bp.route('/api/search/suggest')
+def suggest():
+    """คำแนะนำตอนพิมพ์ (ชื่อเรื่อง / นามปากกา / แท็ก) จากดัชนี prefix ในหน่วยความจำ"""
+    q = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', search_suggest.DEFAULT_LIMIT, type=int), 1),
+                search_suggest.MAX_LIMIT)
+    if not q:
+        return jsonify(ok=True, q=q, suggestions=[])
+
+    idx = search_suggest.get_suggest_index()
+    if idx is None:
+        return jsonify(ok=False, error="unavailable", suggestions=[]), 503
+
+    suggestions = []
+    for s in idx.suggest(q, limit):
+        if s['type'] == search_suggest.KIND_TITLE:
+            url = url_for('novel.detail', novels_id=s['id'])
+        elif s['type'] == search_suggest.KIND_AUTHOR:
+            url = url_for('search.search_novels', q=s['label'], scope='author')
+        else:
+            url = url_for('search.search_novels', q=s['label'], scope='tag')
+        suggestions.append({'type': s['type'], 'label': s['label'], 'url': url})
+
+    resp = jsonify(ok=True, q=q, suggestions=suggestions)
+    resp.headers['Cache-Control'] = 'public, max-age=60'
+    return resp
+
+
+# ---------- CLI ----------
+@search_bp.cli.command("build-index")
+@click.option("--keep-days", default=CHANGES_RETENTION_DAYS, show_default=True,
+              help="เก็บ search_changes ย้อนหลังกี่วัน")
+def build_index_command(keep_days: int):
+    """สร้างดัชนีค้นหาใหม่ทั้งหมดและเขียน snapshot (ตั้ง cron วันละครั้ง)"""
+    path = search_index.snapshot_path()
+    with closing(get_db_connection()) as conn:
+        idx = search_index.build_index(conn)
+        idx.save(path)
+        removed = search_index.prune_changes(conn, max(1, keep_days))
+    click.echo(
+        f"search build-index: docs={len(idx)} change_id={idx.last_change_id} "
+        f"pruned_changes={removed} -> {path}"
+    )
+
+
+@search_bp.cli.command("build-chapter-index")
+@click.option("--chunk", default=chapter_index.BUILD_CHUNK, show_default=True,
+              help="จำนวนตอนที่ดึงจาก DB ต่อรอบ")
+@click.option("--block-postings", default=chapter_index.BLOCK_POSTINGS, show_default=True,
+              help="จำนวนตำแหน่งคำสูงสุดในหน่วยความจำก่อนเขียน block ลงดิสก์")
+def build_chapter_index_command(chunk: int, block_postings: int):
+    """สร้างดัชนีเนื้อหาตอนใหม่ (ตั้ง cron วันละครั้ง ระหว่างวันใช้ chapter_changes)"""
+    path = chapter_index.index_dir()
+    with closing(get_db_connection()) as conn:
+        result = chapter_index.build_chapter_index(
+            conn, path, chunk=max(1, chunk), block_postings=max(1000, block_postings)
+        )
+        removed = chapter_index.prune_changes(conn, result["change_id"])
+    click.echo(
+        f"search build-chapter-index: chapters={result['chapters']} blocks={result['blocks']} "
+        f"change_id={result['change_id']} pruned_changes={removed} -> {path}"
+    )
+
+
+@search_bp.cli.command("fulltext-setup")
+def fulltext_setup_command():
+    """สร้าง FULLTEXT index (ngram parser) ที่ยังไม่มี สำหรับ SEARCH_ENGINE=fulltext"""
+    with closing(get_db_connection()) as conn:
+        with conn.cursor(MySQLdb.cursors.DictCursor) as cur:
+            for table, name, columns in FULLTEXT_INDEXES:
+                cur.execute(
+                    """
+                    SELECT 1 FROM information_schema.STATISTICS
+                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+                    LIMIT 1
+                    """,
+                    (table, name),
+                )
+                if cur.fetchone():
+                    click.echo(f"{table}.{name}: exists")
+                    continue
+                # ชื่อตาราง/คอลัมน์มาจากค่าคงที่ในไฟล์นี้เท่านั้น
+                cur.execute(
+                    f"ALTER TABLE {table} ADD FULLTEXT INDEX {name} ({', '.join(columns)}) WITH PARSER ngram"
+                )
+                click.echo(f"{table}.{name}: created")
+        conn.commit()
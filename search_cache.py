@@ -0,0 +1,195 @@
+# search_cache.py
+"""
+cache ผลค้นหาหนึ่งหน้า (ต่อ worker) สำหรับ search.search_novels
+
+- key = คำค้นที่ normalize แล้ว (ตัวพิมพ์/ลำดับคำ/คำซ้ำไม่มีผล) + engine/scope/sort/ตัวกรอง/หน้า
+- TTL สั้น (SEARCH_CACHE_TTL) แต่ยืดออกตามจำนวนครั้งที่ถูกเรียก จนถึง SEARCH_CACHE_MAX_TTL
+- หน้าเรียกดูแบบไม่มีคำค้น (browse) ใช้ TTL ยาวกว่า (SEARCH_CACHE_BROWSE_TTL)
+- เต็มแล้วไล่รายการที่ถูกเรียกน้อยที่สุดต่อเวลาออกก่อน
+- นิยายที่อยู่ในผลถูกแก้ไข/เปลี่ยนสถานะ (search_changes) → ลบทุก key ที่มีเรื่องนั้น
+"""
+from __future__ import annotations
+
+import math
+import threading
+import time
+from contextlib import closing
+
+from flask import current_app
+from MySQLdb.cursors import DictCursor
+
+import textseg
+from db import get_db_connection
+
+DEFAULT_CAPACITY = 512
+DEFAULT_TTL = 30.0
+DEFAULT_MAX_TTL = 300.0
+DEFAULT_BROWSE_TTL = 120.0
+
+
+def normalize_query(keywords) -> str:
+    """คำค้นรูปมาตรฐาน: normalize, ตัดคำซ้ำ, เรียงลำดับ (ค้นแบบ AND ลำดับคำจึงไม่มีผล)"""
+    terms = {textseg.normalize(k).strip() for k in keywords}
+    return " ".join(sorted(t for t in terms if t))
+
+
+def make_key(engine, keywords, scope, sort, cate_id, status, tag_id, after) -> tuple:
+    q = normalize_query(keywords)
+    return (
+        engine,
+        q,
+        scope if q else "all",
+        sort,
+        cate_id or None,
+        status or None,
+        tag_id or None,
+        tuple(after) if after else None,
+    )
+
+
+class SearchCache:
+    def __init__(self, capacity=DEFAULT_CAPACITY, ttl=DEFAULT_TTL,
+                 max_ttl=DEFAULT_MAX_TTL, browse_ttl=DEFAULT_BROWSE_TTL):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.max_ttl = max_ttl
+        self.browse_ttl = browse_ttl
+        self._lock = threading.Lock()
+        self._entries: dict[tuple, dict] = {}
+        self._by_novel: dict[int, set] = {}
+        self.last_change_id: int | None = None
+        self._last_sync = 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            e = self._entries.get(key)
+            if e is None:
+                return None
+            if now >= e["expires"]:
+                self._drop(key)
+                return None
+            e["hits"] += 1
+            # ยิ่งถูกเรียกบ่อยยิ่งอยู่นาน (แต่ไม่เกิน max_ttl นับจากตอนสร้าง)
+            base = self.browse_ttl if e["browse"] else self.ttl
+            e["expires"] = min(e["created"] + self.max_ttl,
+                               max(e["expires"], now + base * (1 + math.log2(e["hits"]))))
+            return e["value"]
+
+    def put(self, key, value, novels_ids, browse: bool = False) -> None:
+        now = time.monotonic()
+        ids = frozenset(int(i) for i in novels_ids)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            while len(self._entries) >= self.capacity:
+                self._evict(now)
+            self._entries[key] = {
+                "value": value,
+                "ids": ids,
+                "created": now,
+                "expires": now + (self.browse_ttl if browse else self.ttl),
+                "hits": 0,
+                "browse": browse,
+            }
+            for nid in ids:
+                self._by_novel.setdefault(nid, set()).add(key)
+
+    def invalidate_novels(self, novels_ids) -> int:
+        removed = 0
+        with self._lock:
+            for nid in novels_ids:
+                for key in list(self._by_novel.get(int(nid), ())):
+                    self._drop(key)
+                    removed += 1
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_novel.clear()
+
+    def _drop(self, key) -> None:
+        e = self._entries.pop(key, None)
+        if not e:
+            return
+        for nid in e["ids"]:
+            keys = self._by_novel.get(nid)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_novel[nid]
+
+    def _evict(self, now: float) -> None:
+        # หมดอายุแล้วออกก่อน ไม่งั้นเอาตัวที่ถูกเรียกน้อยสุดต่อวินาที
+        victim = min(
+            self._entries,
+            key=lambda k: (
+                now < self._entries[k]["expires"],
+                (self._entries[k]["hits"] + 1) / (now - self._entries[k]["created"] + 1.0),
+            ),
+        )
+        self._drop(victim)
+
+    def sync_changes(self, conn) -> int:
+        """ลบ cache ของนิยายที่มีใน search_changes ใหม่กว่าที่เคยเห็น"""
+        with conn.cursor(DictCursor) as cur:
+            if self.last_change_id is None:
+                # เริ่มต้น: cache ยังว่าง แค่จำตำแหน่งล่าสุด
+                cur.execute("SELECT COALESCE(MAX(change_id), 0) AS m FROM search_changes")
+                self.last_change_id = int((cur.fetchone() or {}).get("m") or 0)
+                return 0
+            cur.execute(
+                """
+                SELECT change_id, novels_id FROM search_changes
+                WHERE change_id > %s ORDER BY change_id LIMIT 1000
+                """,
+                (self.last_change_id,),
+            )
+            rows = cur.fetchall()
+        if not rows:
+            return 0
+        self.last_change_id = int(rows[-1]["change_id"])
+        return self.invalidate_novels({int(r["novels_id"]) for r in rows})
+
+
+_cache: SearchCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> SearchCache | None:
+    """cache ของ worker นี้ (sync การแก้ไขจาก DB ไม่เกินทุก SEARCH_SYNC_INTERVAL วินาที)"""
+    global _cache
+    cfg = current_app.config
+    if not cfg.get("SEARCH_CACHE_ENABLED", True):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SearchCache(
+                    capacity=int(cfg.get("SEARCH_CACHE_SIZE", DEFAULT_CAPACITY)),
+                    ttl=float(cfg.get("SEARCH_CACHE_TTL", DEFAULT_TTL)),
+                    max_ttl=float(cfg.get("SEARCH_CACHE_MAX_TTL", DEFAULT_MAX_TTL)),
+                    browse_ttl=float(cfg.get("SEARCH_CACHE_BROWSE_TTL", DEFAULT_BROWSE_TTL)),
+                )
+    now = time.monotonic()
+    if now - _cache._last_sync >= float(cfg.get("SEARCH_SYNC_INTERVAL", 2.0)):
+        _cache._last_sync = now
+        try:
+            with closing(get_db_connection()) as conn:
+                _cache.sync_changes(conn)
+        except Exception as e:
+            # sync ไม่ได้ → ไม่ใช้ cache รอบนี้ (กันเสิร์ฟผลเก่าที่ไม่ถูก invalidate)
+            print(f"[search_cache.get_cache] sync error: {e!r}")
+            _cache._last_sync = 0.0
+            return None
+    return _cache
+
+
+def invalidate_local(novels_id: int) -> None:
+    """ลบ cache ของเรื่องนี้ใน worker ที่เป็นคนแก้ไขทันที (worker อื่นรอ sync)"""
+    if _cache is not None:
+        _cache.invalidate_novels([novels_id])
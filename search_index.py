@@ -0,0 +1,772 @@
+# search_index.py
+"""
+ดัชนีค้นหานิยายแบบ inverted index ในหน่วยความจำ (1 ชุดต่อ worker)
+
+- ฟิลด์: title / author / tag / category / desc (ตรงกับ scope ในหน้า /search)
+- term = คำจาก textseg.words() + char bigram (prefix NGRAM) สำหรับคำที่ไม่อยู่ในพจนานุกรม
+- posting list เป็น array('I') ของ novels_id เรียงจากน้อยไปมาก + array('H') ของ tf
+- ให้คะแนนด้วย BM25 ถ่วงน้ำหนักตามฟิลด์
+- snapshot (pickle) ให้ worker โหลดได้เร็ว: สร้างด้วย `flask search build-index`
+  worker ที่ไม่มี snapshot สร้างดัชนีใน thread เบื้องหลัง ระหว่างนั้นหน้า /search ค้นด้วย SQL
+- การแก้ไขนิยายบันทึกลง search_changes (mark_novel_changed) แล้วทุก worker
+  ดึงไปอัปเดตดัชนีของตัวเองทุก SEARCH_SYNC_INTERVAL วินาที
+"""
+from __future__ import annotations
+
+import math
+import os
+import pickle
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from contextlib import closing
+from datetime import datetime
+
+from flask import current_app
+from MySQLdb.cursors import DictCursor
+
+import prerender
+import search_cache
+import textseg
+from db import get_db_connection
+
+FIELDS = ("title", "author", "tag", "category", "desc")
+FIELD_WEIGHTS = {"title": 3.0, "author": 2.0, "tag": 2.0, "category": 1.0, "desc": 1.0}
+SCOPE_FIELDS = {
+    "all": FIELDS,
+    "title": ("title",),
+    "author": ("author",),
+    "desc": ("desc",),
+    "tag": ("tag",),
+}
+
+NGRAM = "\x02"          # prefix ของ term ที่เป็น char n-gram
+NGRAM_WEIGHT = 0.5      # คะแนนของการ match ด้วย n-gram เทียบกับคำเต็ม
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+SNAPSHOT_VERSION = 3
+BUILD_CHUNK = 1000
+SYNC_BATCH = 1000
+
+PUBLISHED_STATUSES = ("เผยแพร่", "จบแล้ว")
+COMPLETED_STATUS = "จบแล้ว"
+
+# facet: แท็กที่มี bitset (แท็กยอดนิยมสุด N แท็ก), จำนวนแท็กที่แสดง, อายุสูงสุดของ bitset ก่อนสร้างใหม่
+FACET_TAG_POOL = 200
+FACET_TOP_TAGS = 10
+FACET_STALE_SECONDS = 30.0
+
+
+# fuzzy (trigram): ใช้เมื่อผลแบบตรงตัวน้อยกว่า FUZZY_MIN_HITS เรื่อง
+FUZZY_MIN_HITS = 3
+FUZZY_THRESHOLD = 0.5       # สัดส่วน trigram ของคำค้นที่ต้องพบในข้อความ
+FUZZY_SCORE_SCALE = 0.5     # ผล fuzzy ได้คะแนนไม่เกินสัดส่วนนี้ของคะแนนตรงตัวที่ต่ำที่สุด (ดู merge_fuzzy)
+FUZZY_FIELDS = {
+    "all": ("title", "author", "tag"),
+    "title": ("title",),
+    "author": ("author",),
+    "tag": ("tag",),
+    "desc": (),
+}
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def trigrams(text, segment: bool = False) -> set[str]:
+    """
+    trigram ของแต่ละคำ (เติมช่องว่างหน้า 2 / หลัง 1 แบบ pg_trgm)
+    segment=True ตัดคำไทยด้วย textseg ก่อน (ฝั่งข้อความที่ทำดัชนี เพราะชื่อไทยมักไม่มีเว้นวรรค)
+    ฝั่งคำค้นแบ่งตามช่องว่างเท่านั้น เพราะคำที่พิมพ์ผิดมักตัดคำไม่ถูก
+    """
+    out: set[str] = set()
+    text = textseg.normalize(text).strip()
+    for word in (textseg.words(text) if segment else _SPACE_RE.split(text)):
+        if word:
+            padded = f"  {word} "
+            out.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return out
+
+
+class TrigramIndex:
+    """
+    ดัชนี trigram ของข้อความสั้น (ชื่อเรื่อง / นามปากกา / ชื่อแท็ก)
+    ข้อความเดียวกันเก็บครั้งเดียว (sid) พร้อมชุด novels_id ที่ใช้ข้อความนั้น
+    หา candidate จาก posting list ของ trigram ในคำค้นเท่านั้น (ไม่ไล่ทุกข้อความ)
+    """
+
+    def __init__(self):
+        self.sids: dict[tuple, int] = {}        # (field, text) -> sid
+        self.strings: list[list] = []           # sid -> [field, จำนวน trigram, set(novels_id)]
+        self.postings: dict[str, array] = {}    # trigram -> array('I') ของ sid
+
+    def add(self, field: str, text, novels_id: int) -> None:
+        key = (field, textseg.normalize(text).strip())
+        if not key[1]:
+            return
+        sid = self.sids.get(key)
+        if sid is None:
+            grams = trigrams(key[1], segment=True)
+            sid = len(self.strings)
+            self.sids[key] = sid
+            self.strings.append([field, len(grams), set()])
+            for g in grams:
+                self.postings.setdefault(g, array("I")).append(sid)
+        self.strings[sid][2].add(novels_id)
+
+    def discard(self, field: str, text, novels_id: int) -> None:
+        # ข้อความที่ไม่มีเรื่องใช้แล้วยังค้างใน posting (ถูกข้ามตอนค้น) จนกว่าจะ build ใหม่
+        sid = self.sids.get((field, textseg.normalize(text).strip()))
+        if sid is not None:
+            self.strings[sid][2].discard(novels_id)
+
+    def match(self, text, fields, threshold: float = FUZZY_THRESHOLD) -> dict[int, float]:
+        """คืน {novels_id: similarity} โดย similarity = trigram ที่ตรง / trigram ของคำค้น"""
+        query = trigrams(text)
+        if not query or not fields:
+            return {}
+        counts: dict[int, int] = {}
+        for g in query:
+            for sid in self.postings.get(g, ()):
+                counts[sid] = counts.get(sid, 0) + 1
+        need = threshold * len(query)
+        out: dict[int, float] = {}
+        for sid, common in counts.items():
+            if common < need:
+                continue
+            field, _, novels = self.strings[sid]
+            if field not in fields or not novels:
+                continue
+            sim = common / len(query)
+            for nid in novels:
+                if sim > out.get(nid, 0.0):
+                    out[nid] = sim
+        return out
+
+
+def _popcount(x: int) -> int:
+    return x.bit_count()
+
+
+class FacetBitsets:
+    """
+    bitset (Python int) ต่อค่า facet บนลำดับเอกสารแบบหนาแน่น (ordinal)
+    นับผลด้วย popcount(match & facet) → ไม่ต้อง GROUP BY ต่อ facet
+    """
+
+    def __init__(self, docs: dict[int, dict], tag_pool: int = FACET_TAG_POOL):
+        ids = sorted(docs)
+        self.ordinal = {nid: i for i, nid in enumerate(ids)}
+        self.size = len(ids)
+        by_cate: dict = {}
+        by_status: dict = {}
+        by_tag: dict = {}
+        self.cate_names: dict = {}
+        self.tag_names: dict = {}
+        for i, nid in enumerate(ids):
+            meta = docs[nid]
+            by_cate.setdefault(meta.get("cate_id"), []).append(i)
+            by_status.setdefault(meta.get("status"), []).append(i)
+            if meta.get("cate_id") is not None:
+                self.cate_names[meta["cate_id"]] = meta.get("category_name")
+            for tag_id, name in meta.get("tags") or ():
+                by_tag.setdefault(tag_id, []).append(i)
+                self.tag_names[tag_id] = name
+        pool = sorted(by_tag, key=lambda t: len(by_tag[t]), reverse=True)[:tag_pool]
+        self.cate = {k: self.bits(v) for k, v in by_cate.items() if k is not None}
+        self.status = {k: self.bits(v) for k, v in by_status.items()}
+        self.tags = {t: self.bits(by_tag[t]) for t in pool}
+        self.all = (1 << self.size) - 1
+        self.built_at = time.monotonic()
+
+    def bits(self, ordinals) -> int:
+        buf = bytearray((self.size + 7) // 8)
+        for o in ordinals:
+            buf[o >> 3] |= 1 << (o & 7)
+        return int.from_bytes(buf, "little")
+
+    def ids_to_bits(self, novels_ids) -> int:
+        ordinal = self.ordinal
+        return self.bits(ordinal[nid] for nid in novels_ids if nid in ordinal)
+
+
+
+class InvertedIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        # novels_id -> {"status", "cate_id", "created_at", "terms": {field: {term: tf}}, "len": {field: n}}
+        self.docs: dict[int, dict] = {}
+        self.postings: dict[str, dict[str, array]] = {f: {} for f in FIELDS}
+        self.freqs: dict[str, dict[str, array]] = {f: {} for f in FIELDS}
+        self.total_len: dict[str, int] = {f: 0 for f in FIELDS}
+        self.learned_words: set[str] = set()
+        self.last_change_id = 0
+        self.built_at: datetime | None = None
+        self._version = 0           # เพิ่มทุกครั้งที่เอกสารเปลี่ยน (ใช้ตัดสินว่า facet เก่าหรือยัง)
+        self._facets: FacetBitsets | None = None
+        self._facets_version = -1
+        self.trigrams = TrigramIndex()
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    # ---------- analyze ----------
+    @staticmethod
+    def analyze(text) -> tuple[dict[str, int], int]:
+        """คืน ({term: tf}, จำนวนคำ) ของข้อความหนึ่งฟิลด์"""
+        counts: dict[str, int] = {}
+        ws = textseg.words(text)
+        for w in ws:
+            counts[w] = counts.get(w, 0) + 1
+        for g in textseg.char_ngrams(text):
+            key = NGRAM + g
+            counts[key] = counts.get(key, 0) + 1
+        return counts, len(ws)
+
+    def learn_words(self, words) -> None:
+        """เพิ่มคำ (เช่นชื่อแท็ก/หมวด) เข้าพจนานุกรมตัดคำ และจำไว้ใน snapshot"""
+        d = textseg.default_dictionary()
+        for w in words:
+            w = textseg.normalize(w).strip()
+            if w and w not in self.learned_words:
+                self.learned_words.add(w)
+                d.add(w)
+
+    # ---------- write ----------
+    def upsert(self, doc: dict) -> None:
+        """
+        doc: novels_id, title, description, username, category_name, tags [(tag_id, name)],
+             status, cate_id, created_at
+        """
+        nid = int(doc["novels_id"])
+        fields_text = {
+            "title": doc.get("title"),
+            "author": doc.get("username"),
+            "tag": " ".join(name for _, name in doc.get("tags") or []),
+            "category": doc.get("category_name"),
+            "desc": doc.get("description"),
+        }
+        with self._lock:
+            self.remove(nid)
+            self._version += 1
+            terms, lens = {}, {}
+            for field, text in fields_text.items():
+                tf, length = self.analyze(text)
+                terms[field] = tf
+                lens[field] = length
+                self.total_len[field] += length
+                post, freq = self.postings[field], self.freqs[field]
+                for term, n in tf.items():
+                    ids = post.get(term)
+                    if ids is None:
+                        post[term] = array("I", [nid])
+                        freq[term] = array("H", [min(n, 65535)])
+                        continue
+                    pos = bisect_left(ids, nid)
+                    ids.insert(pos, nid)
+                    freq[term].insert(pos, min(n, 65535))
+            self.docs[nid] = {
+                "status": doc.get("status"),
+                "cate_id": doc.get("cate_id"),
+                "category_name": doc.get("category_name"),
+                "tags": [tuple(t) for t in doc.get("tags") or []],
+                "created_at": doc.get("created_at"),
+                "terms": terms,
+                "len": lens,
+                "fuzzy": [
+                    (field, text)
+                    for field in ("title", "author")
+                    for text in (fields_text[field],) if text
+                ] + [("tag", name) for _, name in doc.get("tags") or []],
+            }
+            for field, text in self.docs[nid]["fuzzy"]:
+                self.trigrams.add(field, text, nid)
+
+    def remove(self, novels_id: int) -> None:
+        with self._lock:
+            old = self.docs.pop(int(novels_id), None)
+            if not old:
+                return
+            self._version += 1
+            for field, text in old.get("fuzzy", ()):
+                self.trigrams.discard(field, text, novels_id)
+            for field, tf in old["terms"].items():
+                self.total_len[field] -= old["len"].get(field, 0)
+                post, freq = self.postings[field], self.freqs[field]
+                for term in tf:
+                    ids = post.get(term)
+                    if ids is None:
+                        continue
+                    pos = bisect_left(ids, novels_id)
+                    if pos < len(ids) and ids[pos] == novels_id:
+                        del ids[pos]
+                        del freq[term][pos]
+                    if not ids:
+                        del post[term]
+                        del freq[term]
+
+    # ---------- search ----------
+    def _bm25(self, field: str, term: str, n_docs: int) -> dict[int, float]:
+        ids = self.postings[field].get(term)
+        if not ids:
+            return {}
+        freqs = self.freqs[field][term]
+        df = len(ids)
+        idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+        avgdl = (self.total_len[field] / n_docs) or 1.0
+        k1, b = BM25_K1, BM25_B
+        weight = FIELD_WEIGHTS[field] * idf
+        docs = self.docs
+        out = {}
+        for nid, tf in zip(ids, freqs):
+            dl = docs[nid]["len"].get(field, 0)
+            out[nid] = weight * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+        return out
+
+    def _match_term(self, term: str, fields, n_docs: int) -> dict[int, float]:
+        """คะแนนของคำหนึ่งคำ: union ข้ามฟิลด์; ถ้าไม่มีคำนี้เลยใช้ n-gram ทุกตัวต้องเจอในฟิลด์เดียวกัน"""
+        scores: dict[int, float] = {}
+        if any(term in self.postings[f] for f in fields):
+            for f in fields:
+                for nid, s in self._bm25(f, term, n_docs).items():
+                    scores[nid] = scores.get(nid, 0.0) + s
+            return scores
+
+        grams = list(dict.fromkeys(textseg.char_ngrams(term)))
+        for f in fields:
+            field_scores = None
+            for g in grams:
+                gs = self._bm25(f, NGRAM + g, n_docs)
+                if field_scores is None:
+                    field_scores = gs
+                else:
+                    field_scores = {d: s + gs[d] for d, s in field_scores.items() if d in gs}
+                if not field_scores:
+                    break
+            for nid, s in (field_scores or {}).items():
+                scores[nid] = scores.get(nid, 0.0) + NGRAM_WEIGHT * s / max(len(grams), 1)
+        return scores
+
+    def match(self, keywords, scope: str = "all") -> dict[int, float]:
+        """
+        ค้นหาแบบ AND ระหว่างคีย์เวิร์ด (เหมือน LIKE เดิม) แต่ให้คะแนน BM25
+        คืน {novels_id: score} ของทุกเรื่องที่ตรง (ยังไม่กรองสถานะ/หมวด)
+        """
+        fields = SCOPE_FIELDS.get(scope, FIELDS)
+        with self._lock:
+            n_docs = len(self.docs) or 1
+            total: dict[int, float] | None = None
+            for kw in keywords:
+                for term in textseg.words(kw) or [textseg.normalize(kw)]:
+                    ts = self._match_term(term, fields, n_docs)
+                    if total is None:
+                        total = ts
+                    else:
+                        total = {d: s + ts[d] for d, s in total.items() if d in ts}
+                    if not total:
+                        return {}
+        return total or {}
+
+    def fuzzy_match(self, keywords, scope: str = "all") -> dict[int, float]:
+        """
+        ค้นแบบทนคำพิมพ์ผิดด้วย trigram (AND ระหว่างคีย์เวิร์ด)
+        คืน similarity รวม (ยังเทียบกับคะแนน BM25 ไม่ได้ → ต่อท้ายผลตรงตัวด้วย merge_fuzzy)
+        """
+        fields = FUZZY_FIELDS.get(scope, FUZZY_FIELDS["all"])
+        with self._lock:
+            total: dict[int, float] | None = None
+            for kw in keywords:
+                sims = self.trigrams.match(kw, fields)
+                if total is None:
+                    total = sims
+                else:
+                    total = {d: s + sims[d] for d, s in total.items() if d in sims}
+                if not total:
+                    return {}
+        return dict(total or {})
+
+    @staticmethod
+    def merge_fuzzy(exact: dict[int, float], near: dict[int, float]) -> dict[int, float]:
+        """
+        ต่อผล fuzzy ท้ายผลตรงตัว: คะแนน fuzzy ถูกย้ายไปอยู่ต่ำกว่า min(คะแนนตรงตัว) เสมอ
+        (BM25 ของเอกสารยาว / คำที่พบบ่อยอาจต่ำมาก จึงคูณค่าคงที่เฉย ๆ ไม่พอ)
+        ลำดับระหว่างผล fuzzy ยังตาม similarity
+        """
+        near = {nid: s for nid, s in near.items() if nid not in exact and s > 0}
+        if not near:
+            return dict(exact)
+        top = max(near.values())
+        floor = min(exact.values(), default=1.0)
+        if floor > 0:
+            moved = {nid: floor * FUZZY_SCORE_SCALE * s / top for nid, s in near.items()}
+        else:
+            moved = {nid: floor - 1.0 + FUZZY_SCORE_SCALE * s / top for nid, s in near.items()}
+        return {**exact, **moved}
+
+    def filter_hits(self, scores: dict[int, float], cate_id: int | None = None,
+                    statuses=PUBLISHED_STATUSES, tag_id: int | None = None,
+                    limit: int | None = None) -> list[tuple[int, float]]:
+        """กรองผลจาก match() แล้วคืน [(novels_id, score)] เรียงจากคะแนนมากไปน้อย"""
+        with self._lock:
+            docs = self.docs
+            hits = [
+                (nid, score) for nid, score in scores.items()
+                if nid in docs
+                and (not statuses or docs[nid]["status"] in statuses)
+                and (not cate_id or docs[nid]["cate_id"] == cate_id)
+                and (not tag_id or any(t == tag_id for t, _ in docs[nid]["tags"]))
+            ]
+        hits.sort(key=lambda h: (-h[1], -h[0]))
+        return hits[:limit]
+
+    def search(self, keywords, scope: str = "all", cate_id: int | None = None,
+               statuses=PUBLISHED_STATUSES, limit: int | None = 1000,
+               tag_id: int | None = None) -> list[tuple[int, float]]:
+        return self.filter_hits(self.match(keywords, scope), cate_id, statuses, tag_id, limit)
+
+    # ---------- facets ----------
+    def facet_bitsets(self) -> FacetBitsets:
+        """bitset ของ facet (สร้างใหม่เมื่อเอกสารเปลี่ยนและของเดิมอายุเกิน FACET_STALE_SECONDS)"""
+        with self._lock:
+            f = self._facets
+            stale = f is None or (
+                self._version != self._facets_version
+                and time.monotonic() - f.built_at >= FACET_STALE_SECONDS
+            )
+            if stale:
+                self._facets = FacetBitsets(self.docs)
+                self._facets_version = self._version
+            return self._facets
+
+    def facets(self, novels_ids, cate_id: int | None = None, status: str | None = None,
+               tag_id: int | None = None, top_tags: int = FACET_TOP_TAGS) -> dict:
+        """
+        นับจำนวนผลต่อหมวด / แท็กยอดนิยม / จบแล้ว-ยังไม่จบ จากชุดผลที่ตรงคำค้น (novels_ids)
+        novels_ids = None → ทุกเรื่องที่เผยแพร่ (เลือกดูตามหมวด/แท็ก/สถานะโดยไม่มีคำค้น)
+        แต่ละ facet ใช้ตัวกรองของ facet อื่นที่เลือกอยู่ แต่ไม่ใช้ตัวกรองของตัวเอง
+        """
+        fb = self.facet_bitsets()
+        published = 0
+        for s in PUBLISHED_STATUSES:
+            published |= fb.status.get(s, 0)
+        matched = published if novels_ids is None else fb.ids_to_bits(novels_ids) & published
+
+        cate_mask = fb.cate.get(cate_id, 0) if cate_id else fb.all
+        if status:
+            status_mask = fb.status.get(status, 0)
+        else:
+            status_mask = fb.all
+        if not tag_id:
+            tag_mask = fb.all
+        elif tag_id in fb.tags:
+            tag_mask = fb.tags[tag_id]
+        else:  # แท็กนอก pool: สร้าง mask จากเอกสารที่ตรงคำค้นเท่านั้น
+            with self._lock:
+                tag_mask = fb.ids_to_bits(
+                    nid for nid in (self.docs if novels_ids is None else novels_ids)
+                    if nid in self.docs and any(t == tag_id for t, _ in self.docs[nid]["tags"])
+                )
+
+        base = matched & status_mask & tag_mask
+        categories = [
+            {"cate_id": k, "name": fb.cate_names.get(k), "count": _popcount(base & bs)}
+            for k, bs in fb.cate.items()
+        ]
+        categories = sorted((c for c in categories if c["count"]), key=lambda c: -c["count"])
+
+        base = matched & cate_mask & tag_mask
+        completed = _popcount(base & fb.status.get(COMPLETED_STATUS, 0))
+        total = _popcount(base)
+
+        base = matched & cate_mask & status_mask
+        tags = [
+            {"tag_id": t, "name": fb.tag_names.get(t), "count": _popcount(base & bs)}
+            for t, bs in fb.tags.items()
+        ]
+        tags = sorted((t for t in tags if t["count"]), key=lambda t: -t["count"])[:top_tags]
+
+        return {
+            "categories": categories,
+            "tags": tags,
+            "status": {"completed": completed, "ongoing": total - completed},
+        }
+
+    # ---------- snapshot ----------
+    def save(self, path: str) -> None:
+        """เขียน snapshot แบบ atomic (เขียนไฟล์ชั่วคราวแล้ว rename)"""
+        with self._lock:
+            state = {
+                "version": SNAPSHOT_VERSION,
+                "docs": self.docs,
+                "postings": self.postings,
+                "freqs": self.freqs,
+                "total_len": self.total_len,
+                "learned_words": sorted(self.learned_words),
+                "trigrams": self.trigrams,
+                "last_change_id": self.last_change_id,
+                "built_at": self.built_at,
+            }
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "InvertedIndex":
+        # snapshot สร้างโดยแอปเองเท่านั้น (อย่าชี้ SEARCH_INDEX_PATH ไปที่ไฟล์จากแหล่งอื่น)
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        if state.get("version") != SNAPSHOT_VERSION:
+            raise ValueError("search index snapshot version mismatch")
+        idx = cls()
+        idx.docs = state["docs"]
+        idx.postings = state["postings"]
+        idx.freqs = state["freqs"]
+        idx.total_len = state["total_len"]
+        idx.learn_words(state.get("learned_words") or [])
+        idx.trigrams = state["trigrams"]
+        idx.last_change_id = int(state.get("last_change_id") or 0)
+        idx.built_at = state.get("built_at")
+        return idx
+
+
+# ---------- DB loading ----------
+def _placeholders(values) -> str:
+    return ", ".join(["%s"] * len(values))
+
+
+def load_documents(cur, novels_ids) -> list[dict]:
+    """ดึงข้อมูลที่ต้องใช้ทำดัชนีของนิยายหลายเรื่อง (2 query ต่อชุด)"""
+    ids = [int(i) for i in novels_ids]
+    if not ids:
+        return []
+    ph = _placeholders(ids)
+    cur.execute(
+        f"""
+        SELECT n.novels_id, n.title, n.description, n.status, n.cate_id, n.created_at,
+               u.username, c.name AS category_name
+        FROM novels n
+        LEFT JOIN users u ON u.users_id = n.users_id
+        LEFT JOIN categories c ON c.cate_id = n.cate_id
+        WHERE n.novels_id IN ({ph})
+        """,
+        ids,
+    )
+    docs = {int(r["novels_id"]): dict(r, tags=[]) for r in cur.fetchall()}
+    if docs:
+        cur.execute(
+            f"""
+            SELECT nt.novels_id, t.tag_id, t.name
+            FROM novels_tags nt
+            JOIN tags t ON t.tag_id = nt.tag_id
+            WHERE nt.novels_id IN ({_placeholders(docs)})
+            """,
+            list(docs),
+        )
+        for r in cur.fetchall():
+            docs[int(r["novels_id"])]["tags"].append((r["tag_id"], r["name"]))
+    return list(docs.values())
+
+
+def _current_change_id(cur) -> int:
+    cur.execute("SELECT COALESCE(MAX(change_id), 0) AS m FROM search_changes")
+    return int((cur.fetchone() or {}).get("m") or 0)
+
+
+def build_index(conn, chunk: int = BUILD_CHUNK) -> InvertedIndex:
+    """สร้างดัชนีใหม่ทั้งหมดจาก DB (ไล่ novels_id ทีละช่วง)"""
+    idx = InvertedIndex()
+    with conn.cursor(DictCursor) as cur:
+        # จำ change_id ก่อนเริ่ม → การแก้ไขระหว่าง build จะถูก sync ซ้ำภายหลัง
+        idx.last_change_id = _current_change_id(cur)
+
+        # คำจากชื่อแท็ก/หมวดช่วยให้ตัดคำไทยตรงกับที่ผู้ใช้พิมพ์ค้น
+        cur.execute("SELECT name FROM tags")
+        idx.learn_words(r["name"] for r in cur.fetchall())
+        cur.execute("SELECT name FROM categories")
+        idx.learn_words(r["name"] for r in cur.fetchall())
+
+        last_id = 0
+        while True:
+            cur.execute(
+                "SELECT novels_id FROM novels WHERE novels_id > %s ORDER BY novels_id LIMIT %s",
+                (last_id, chunk),
+            )
+            ids = [r["novels_id"] for r in cur.fetchall()]
+            if not ids:
+                break
+            for doc in load_documents(cur, ids):
+                idx.upsert(doc)
+            last_id = ids[-1]
+    idx.built_at = datetime.now()
+    return idx
+
+
+def sync_changes(idx: InvertedIndex, conn) -> int:
+    """อัปเดตดัชนีจาก search_changes ที่ใหม่กว่า last_change_id คืนจำนวนเรื่องที่อัปเดต"""
+    updated = 0
+    with conn.cursor(DictCursor) as cur:
+        while True:
+            cur.execute(
+                """
+                SELECT change_id, novels_id
+                FROM search_changes
+                WHERE change_id > %s
+                ORDER BY change_id
+                LIMIT %s
+                """,
+                (idx.last_change_id, SYNC_BATCH),
+            )
+            rows = cur.fetchall()
+            if not rows:
+                break
+            ids = sorted({int(r["novels_id"]) for r in rows})
+            docs = load_documents(cur, ids)
+            with idx._lock:
+                for doc in docs:
+                    idx.upsert(doc)
+                found = {int(d["novels_id"]) for d in docs}
+                for nid in ids:
+                    if nid not in found:
+                        idx.remove(nid)
+                idx.last_change_id = int(rows[-1]["change_id"])
+            updated += len(ids)
+    return updated
+
+
+def _changes_pruned_past(idx: InvertedIndex, conn) -> bool:
+    """True ถ้า change log ถูกลบไปเกินจุดที่ดัชนีนี้ sync ถึง (ต้องโหลดใหม่)"""
+    if not idx.last_change_id:
+        return False
+    with conn.cursor(DictCursor) as cur:
+        cur.execute("SELECT MIN(change_id) AS m FROM search_changes")
+        m = (cur.fetchone() or {}).get("m")
+    return m is not None and int(m) > idx.last_change_id + 1
+
+
+# ---------- per-worker instance ----------
+_index: InvertedIndex | None = None
+_index_lock = threading.Lock()
+_last_sync = 0.0
+_building = False
+
+
+def snapshot_path() -> str:
+    path = current_app.config.get("SEARCH_INDEX_PATH")
+    return path or os.path.join(current_app.instance_path, "search_index.snap")
+
+
+def _load_snapshot() -> InvertedIndex | None:
+    """โหลด snapshot จากดิสก์ (None ถ้าไม่มีหรือเสีย)"""
+    dict_path = current_app.config.get("THAI_DICT_PATH")
+    if dict_path and os.path.exists(dict_path):
+        textseg.load_dictionary_file(dict_path)
+
+    path = snapshot_path()
+    if os.path.exists(path):
+        try:
+            return InvertedIndex.load(path)
+        except Exception as e:
+            print(f"[search_index] load snapshot failed: {e!r} → rebuild")
+    return None
+
+
+def _build_in_background(app) -> None:
+    """
+    สร้างดัชนีใหม่จาก DB ใน thread แยก แล้วบันทึก snapshot ทับ (ไม่สร้างซ้อนถ้ากำลังสร้างอยู่)
+    ระหว่างนั้น get_index คืน None → หน้า /search ค้นด้วย SQL ไปก่อน
+    """
+    global _building
+    with _index_lock:
+        if _building:
+            return
+        _building = True
+
+    def run():
+        global _index, _last_sync, _building
+        try:
+            with app.app_context():
+                with closing(get_db_connection()) as conn:
+                    idx = build_index(conn)
+                try:
+                    idx.save(snapshot_path())
+                except Exception as e:
+                    print(f"[search_index] save snapshot failed: {e!r}")
+            with _index_lock:
+                _index = idx
+                _last_sync = 0.0
+        except Exception as e:
+            print(f"[search_index] background build failed: {e!r}")
+        finally:
+            with _index_lock:
+                _building = False
+
+    threading.Thread(target=run, name="search-index-build", daemon=True).start()
+
+
+def get_index() -> InvertedIndex | None:
+    """
+    คืนดัชนีของ worker นี้ (โหลด snapshot ครั้งแรก) และ sync การแก้ไขล่าสุด
+    คืน None ถ้าใช้ดัชนีไม่ได้ → ผู้เรียกควร fallback ไปค้นด้วย SQL
+    - ไม่มี snapshot / change log ถูกลบเกินจุดที่ดัชนี sync ถึง → สร้างใหม่จาก DB ในเบื้องหลัง
+      (ควรรัน flask search build-index ตอน deploy เพื่อให้ worker ใหม่โหลด snapshot ได้เลย)
+    """
+    global _index, _last_sync
+    try:
+        with _index_lock:
+            if _index is None and not _building:
+                _index = _load_snapshot()
+        if _index is None or _building:
+            if _index is None:
+                _build_in_background(current_app._get_current_object())
+            return None
+
+        interval = float(current_app.config.get("SEARCH_SYNC_INTERVAL", 2.0))
+        now = time.monotonic()
+        if now - _last_sync >= interval:
+            _last_sync = now
+            with closing(get_db_connection()) as conn:
+                if _changes_pruned_past(_index, conn):
+                    # snapshot บนดิสก์ก็ตกหล่นเหมือนกัน → ต้องสร้างจาก DB
+                    _build_in_background(current_app._get_current_object())
+                    return None
+                sync_changes(_index, conn)
+        return _index
+    except Exception as e:
+        print(f"[search_index.get_index] error: {e!r}")
+        return None
+
+
+def mark_novel_changed(cur, novels_id: int) -> None:
+    """
+    บันทึกว่านิยายเรื่องนี้เปลี่ยน (สร้าง/แก้ไข/เปลี่ยนสถานะ/แท็ก/ลบ)
+    ทุก worker จะอัปเดตดัชนีของตัวเองในการค้นหาครั้งถัดไป
+    """
+    global _last_sync
+    try:
+        cur.execute("INSERT INTO search_changes (novels_id) VALUES (%s)", (novels_id,))
+        _last_sync = 0.0  # worker นี้ sync ทันทีในการค้นหาครั้งถัดไป
+        search_cache.invalidate_local(novels_id)
+        prerender.invalidate(novels_id)
+    except Exception as e:
+        print(f"[search_index.mark_novel_changed] novels_id={novels_id} error: {e}")
+
+
+def prune_changes(conn, keep_days: int) -> int:
+    """ลบ change log เก่า (เก็บแถวล่าสุดไว้เสมอ เพื่อให้ worker ตรวจได้ว่าตกหล่นหรือไม่)"""
+    with conn.cursor(DictCursor) as cur:
+        latest = _current_change_id(cur)
+        cur.execute(
+            """
+            DELETE FROM search_changes
+            WHERE changed_at < NOW() - INTERVAL %s DAY
+              AND change_id < %s
+            """,
+            (keep_days, latest),
+        )
+        removed = cur.rowcount
+    conn.commit()
+    return removed
@@ -0,0 +1,347 @@
+# search_suggest.py
+"""
+ดัชนีคำแนะนำตอนพิมพ์ค้นหา (typeahead) สำหรับ /api/search/suggest
+
+- เก็บเป็น sorted array ของ key (ข้อความ normalize แล้ว) → หา prefix ด้วย bisect
+- prefix สั้น (ไม่เกิน SHORT_PREFIX ตัวอักษร) ครอบคลุมเกือบทั้งดัชนี จึงเก็บ top MAX_LIMIT ตามน้ำหนักไว้ล่วงหน้า
+- แก้ไขทีละเรื่องล้างผลที่จำไว้ (memo) เฉพาะ prefix ของ key ที่เปลี่ยน
+- แหล่งข้อมูล: ชื่อเรื่อง (เผยแพร่แล้ว), นามปากกาที่มีผลงานเผยแพร่, ชื่อแท็ก
+- ชื่อเรื่องถูกใส่ key เพิ่มจากต้นคำแต่ละคำด้วย (พิมพ์คำกลางชื่อเรื่องก็เจอ)
+- น้ำหนัก = ความนิยม (ชั้นหนังสือ + ผู้อ่านเดือนนี้ / ยอดรวมของผู้เขียน / จำนวนเรื่องในแท็ก)
+- ชื่อเรื่องอัปเดตทีละเรื่องจาก search_changes, ทั้งดัชนีสร้างใหม่เบื้องหลังทุก SUGGEST_REBUILD_INTERVAL วินาที
+  (ครั้งแรกของ worker ก็สร้างเบื้องหลัง ระหว่างนั้น /api/search/suggest ตอบ 503)
+"""
+from __future__ import annotations
+
+import heapq
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import closing
+
+from flask import current_app
+from MySQLdb.cursors import DictCursor
+
+import textseg
+from db import get_db_connection
+
+KIND_TITLE = "title"
+KIND_AUTHOR = "author"
+KIND_TAG = "tag"
+
+MAX_WORD_KEYS = 5       # จำนวน key จากต้นคำกลางชื่อเรื่องต่อเรื่อง
+MEMO_SIZE = 2048        # จำนวน prefix ที่จำผลไว้ (prefix สั้น ๆ มีรายการในช่วงเยอะ)
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+SHORT_PREFIX = 2        # prefix ยาวไม่เกินนี้ตอบจาก top list ที่คำนวณไว้ (ไม่ไล่ช่วงใน keys)
+
+PUBLISHED_STATUSES = ("เผยแพร่", "จบแล้ว")
+
+
+def _popularity(*values) -> float:
+    return math.log1p(sum(float(v or 0) for v in values))
+
+
+class SuggestIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.keys: list[str] = []                   # เรียงจากน้อยไปมาก
+        self.refs: list[tuple] = []                 # ขนานกับ keys: (kind, ref_id)
+        self.entries: dict[tuple, dict] = {}        # (kind, ref_id) -> {"label", "weight", "keys"}
+        self._memo: dict[tuple, list] = {}
+        self._short: dict[str, list[tuple]] = {}    # prefix สั้น -> refs เรียงน้ำหนักมาก→น้อย (ไม่เกิน MAX_LIMIT)
+        self.last_change_id = 0
+        self.built_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _rank(self, ref: tuple) -> tuple:
+        return (self.entries[ref]["weight"], str(ref[1]))
+
+    @staticmethod
+    def _short_prefixes(keys) -> set[str]:
+        return {k[:n] for k in keys for n in range(1, SHORT_PREFIX + 1) if len(k) >= n}
+
+    def _top_in_range(self, p: str, limit: int) -> list[tuple]:
+        """refs ที่มี key ขึ้นต้นด้วย p น้ำหนักมากสุด limit อัน (ไล่ทั้งช่วง)"""
+        lo = bisect_left(self.keys, p)
+        # ตัวอักษรสูงสุดของ BMP ต่อท้าย → ขอบบนของทุก key ที่ขึ้นต้นด้วย p
+        hi = bisect_left(self.keys, p + "\uffff", lo)
+        return heapq.nlargest(limit, set(self.refs[lo:hi]), key=self._rank)
+
+    def _forget(self, keys) -> None:
+        """ล้าง memo ของ prefix ที่ key เหล่านี้ขึ้นต้นด้วย"""
+        for mk in [mk for mk in self._memo if any(k.startswith(mk[0]) for k in keys)]:
+            del self._memo[mk]
+
+    def _update_short(self, ref: tuple, keys, removed: bool) -> None:
+        """
+        ปรับ top list ของ prefix สั้นเมื่อ ref เปลี่ยน/ถูกลบ
+        ref ที่อยู่ใน list อยู่แล้วถูกลบหรือน้ำหนักลด → คำนวณ prefix นั้นใหม่จากช่วง (เกิดไม่บ่อย)
+        """
+        for p in self._short_prefixes(keys):
+            top = self._short.get(p, [])
+            if ref in top:
+                self._short[p] = self._top_in_range(p, MAX_LIMIT)
+            elif not removed and (len(top) < MAX_LIMIT or self._rank(ref) > self._rank(top[-1])):
+                top = sorted(top + [ref], key=self._rank, reverse=True)[:MAX_LIMIT]
+                self._short[p] = top
+            if not self._short.get(p):
+                self._short.pop(p, None)
+
+    # ---------- write ----------
+    @staticmethod
+    def _keys_for(kind: str, label: str) -> list[str]:
+        base = textseg.normalize(label).strip()
+        if not base:
+            return []
+        keys = [base]
+        if kind == KIND_TITLE:
+            # ต้นคำแต่ละคำในชื่อเรื่อง (ไม่รวมคำแรกซึ่งคือ base อยู่แล้ว)
+            pos = 0
+            for w in textseg.words(base)[:MAX_WORD_KEYS + 1]:
+                i = base.find(w, pos)
+                if i < 0:
+                    continue
+                if i > 0:
+                    keys.append(base[i:])
+                pos = i + len(w)
+        return list(dict.fromkeys(keys))
+
+    def load(self, items) -> None:
+        """ใส่ทีละมาก ๆ ตอน build: [(kind, ref_id, label, weight)] แล้วเรียงครั้งเดียว"""
+        pairs = []
+        with self._lock:
+            for kind, ref_id, label, weight in items:
+                keys = self._keys_for(kind, label)
+                if not keys:
+                    continue
+                ref = (kind, ref_id)
+                self.entries[ref] = {"label": label, "weight": float(weight), "keys": keys}
+                pairs.extend((k, ref) for k in keys)
+            pairs.sort(key=lambda kr: kr[0])
+            self.keys = [k for k, _ in pairs]
+            self.refs = [r for _, r in pairs]
+            self._memo.clear()
+
+            buckets: dict[str, set] = {}
+            for ref, e in self.entries.items():
+                for p in self._short_prefixes(e["keys"]):
+                    buckets.setdefault(p, set()).add(ref)
+            self._short = {
+                p: heapq.nlargest(MAX_LIMIT, refs, key=self._rank) for p, refs in buckets.items()
+            }
+
+    def put(self, kind: str, ref_id, label: str, weight: float) -> None:
+        ref = (kind, ref_id)
+        with self._lock:
+            self.discard(kind, ref_id)
+            keys = self._keys_for(kind, label)
+            if not keys:
+                return
+            for k in keys:
+                pos = bisect_left(self.keys, k)
+                self.keys.insert(pos, k)
+                self.refs.insert(pos, ref)
+            self.entries[ref] = {"label": label, "weight": float(weight), "keys": keys}
+            self._update_short(ref, keys, removed=False)
+            self._forget(keys)
+
+    def discard(self, kind: str, ref_id) -> None:
+        ref = (kind, ref_id)
+        with self._lock:
+            old = self.entries.pop(ref, None)
+            if not old:
+                return
+            for k in old["keys"]:
+                pos = bisect_left(self.keys, k)
+                while pos < len(self.keys) and self.keys[pos] == k:
+                    if self.refs[pos] == ref:
+                        del self.keys[pos]
+                        del self.refs[pos]
+                        break
+                    pos += 1
+            self._update_short(ref, old["keys"], removed=True)
+            self._forget(old["keys"])
+
+    # ---------- read ----------
+    def suggest(self, prefix: str, limit: int = DEFAULT_LIMIT) -> list[dict]:
+        """คืนรายการที่มี key ขึ้นต้นด้วย prefix เรียงตามน้ำหนัก (ไม่ซ้ำเรื่อง/คน/แท็ก)"""
+        p = textseg.normalize(prefix).strip()
+        if not p:
+            return []
+        memo_key = (p, limit)
+        with self._lock:
+            if len(p) <= SHORT_PREFIX and limit <= MAX_LIMIT:
+                return self._items(self._short.get(p, [])[:limit])
+            hit = self._memo.get(memo_key)
+            if hit is not None:
+                return hit
+            out = self._items(self._top_in_range(p, limit))
+            if len(self._memo) >= MEMO_SIZE:
+                self._memo.clear()
+            self._memo[memo_key] = out
+            return out
+
+    def _items(self, refs) -> list[dict]:
+        return [
+            {"type": kind, "id": ref_id, "label": self.entries[(kind, ref_id)]["label"]}
+            for kind, ref_id in refs
+        ]
+
+
+# ---------- DB loading ----------
+def _title_rows(cur, novels_ids=None) -> list[dict]:
+    where = "n.status IN (%s, %s)"
+    params: list = list(PUBLISHED_STATUSES)
+    if novels_ids is not None:
+        where += f" AND n.novels_id IN ({', '.join(['%s'] * len(novels_ids))})"
+        params.extend(novels_ids)
+    cur.execute(
+        f"""
+        SELECT n.novels_id, n.title,
+               COALESCE(rk.bookshelf_users, 0) AS bookshelf_users,
+               COALESCE(rk.active_readers, 0)  AS active_readers
+        FROM novels n
+        LEFT JOIN novel_rankings rk ON rk.novels_id = n.novels_id
+        WHERE {where}
+        """,
+        params,
+    )
+    return list(cur.fetchall())
+
+
+def build_suggest_index(conn) -> SuggestIndex:
+    idx = SuggestIndex()
+    with conn.cursor(DictCursor) as cur:
+        cur.execute("SELECT COALESCE(MAX(change_id), 0) AS m FROM search_changes")
+        idx.last_change_id = int((cur.fetchone() or {}).get("m") or 0)
+
+        items = [
+            (KIND_TITLE, r["novels_id"], r["title"],
+             _popularity(r["bookshelf_users"], r["active_readers"]))
+            for r in _title_rows(cur)
+        ]
+
+        cur.execute(
+            """
+            SELECT u.users_id, u.username,
+                   COALESCE(wc.total_bookshelf, 0) AS total_bookshelf,
+                   COALESCE(wc.work_count, 0)      AS work_count
+            FROM users u
+            JOIN (SELECT DISTINCT users_id FROM novels WHERE status IN (%s, %s)) p
+              ON p.users_id = u.users_id
+            LEFT JOIN writer_counters wc ON wc.users_id = u.users_id
+            """,
+            PUBLISHED_STATUSES,
+        )
+        items.extend(
+            (KIND_AUTHOR, r["users_id"], r["username"],
+             _popularity(r["total_bookshelf"], r["work_count"]))
+            for r in cur.fetchall()
+        )
+
+        cur.execute(
+            """
+            SELECT t.tag_id, t.name, COUNT(*) AS novels
+            FROM tags t
+            JOIN novels_tags nt ON nt.tag_id = t.tag_id
+            JOIN novels n ON n.novels_id = nt.novels_id AND n.status IN (%s, %s)
+            GROUP BY t.tag_id, t.name
+            """,
+            PUBLISHED_STATUSES,
+        )
+        items.extend(
+            (KIND_TAG, r["tag_id"], r["name"], _popularity(r["novels"]))
+            for r in cur.fetchall()
+        )
+    idx.load(items)
+    idx.built_at = time.monotonic()
+    return idx
+
+
+def sync_title_changes(idx: SuggestIndex, conn) -> int:
+    """อัปเดตชื่อเรื่องที่ถูกแก้ไข/เปลี่ยนสถานะ/ลบ ตาม search_changes (นามปากกา/แท็กรอรอบ rebuild)"""
+    with conn.cursor(DictCursor) as cur:
+        cur.execute(
+            """
+            SELECT change_id, novels_id FROM search_changes
+            WHERE change_id > %s ORDER BY change_id LIMIT 1000
+            """,
+            (idx.last_change_id,),
+        )
+        rows = cur.fetchall()
+        if not rows:
+            return 0
+        ids = sorted({int(r["novels_id"]) for r in rows})
+        found = {int(r["novels_id"]): r for r in _title_rows(cur, ids)}
+    with idx._lock:
+        for nid in ids:
+            r = found.get(nid)
+            if r is None:
+                idx.discard(KIND_TITLE, nid)
+            else:
+                idx.put(KIND_TITLE, nid, r["title"],
+                        _popularity(r["bookshelf_users"], r["active_readers"]))
+        idx.last_change_id = int(rows[-1]["change_id"])
+    return len(ids)
+
+
+# ---------- per-worker instance ----------
+_suggest: SuggestIndex | None = None
+_suggest_lock = threading.Lock()
+_last_sync = 0.0
+_rebuilding = False
+
+
+def _rebuild_in_background(app) -> None:
+    """สร้างดัชนีใหม่ใน thread แยกแล้วสลับเข้าที่ (ไม่สร้างซ้อนถ้ากำลังสร้างอยู่)"""
+    global _rebuilding
+    with _suggest_lock:
+        if _rebuilding:
+            return
+        _rebuilding = True
+
+    def run():
+        global _suggest, _last_sync, _rebuilding
+        try:
+            with app.app_context(), closing(get_db_connection()) as conn:
+                fresh = build_suggest_index(conn)
+            with _suggest_lock:
+                _suggest = fresh
+                _last_sync = time.monotonic()
+        except Exception as e:
+            print(f"[search_suggest] rebuild failed: {e!r}")
+        finally:
+            with _suggest_lock:
+                _rebuilding = False
+
+    threading.Thread(target=run, name="suggest-rebuild", daemon=True).start()
+
+
+def get_suggest_index() -> SuggestIndex | None:
+    """
+    ดัชนี typeahead ของ worker นี้ — สร้างเบื้องหลังเสมอ (ครั้งแรกและทุก SUGGEST_REBUILD_INTERVAL)
+    คืน None ระหว่างที่ยังไม่มีดัชนี → route ตอบ 503 ไปก่อนแทนการให้ request รอ
+    """
+    global _last_sync
+    try:
+        if _suggest is None:
+            _rebuild_in_background(current_app._get_current_object())
+            return None
+
+        idx = _suggest
+        cfg = current_app.config
+        now = time.monotonic()
+        if now - idx.built_at >= float(cfg.get("SUGGEST_REBUILD_INTERVAL", 900)):
+            _rebuild_in_background(current_app._get_current_object())
+        if now - _last_sync >= float(cfg.get("SEARCH_SYNC_INTERVAL", 2.0)):
+            _last_sync = now
+            with closing(get_db_connection()) as conn:
+                sync_title_changes(idx, conn)
+        return idx
+    except Exception as e:
+        print(f"[search_suggest.get_suggest_index] error: {e!r}")
+        return None
@@ -0,0 +1,793 @@
+# stats.py
+"""
+งานเบื้องหลังสำหรับสถิตินิยาย (รันผ่าน Flask CLI / cron)
+
+    flask --app app stats rollup-daily          # เติม novel_daily_stats แบบ incremental
+    flask --app app stats refresh-counters      # คำนวณ novel_counters / writer_counters ใหม่ทั้งหมด
+    flask --app app stats reconcile             # ตรวจ/แก้ตัวนับที่คลาดเคลื่อนแบบออนไลน์
+
+ตารางที่ใช้ดูใน schema.sql
+"""
+from __future__ import annotations
+
+import time
+from contextlib import closing
+from datetime import date, datetime, timedelta
+
+import click
+from flask import Blueprint
+from MySQLdb.cursors import DictCursor
+
+from db import get_db_connection
+
+stats_bp = Blueprint("stats", __name__, cli_group="stats")
+
+# ถือว่าอ่านจบเมื่อ progress >= ค่านี้ (ให้ตรงกับหน้า writerwork)
+COMPLETION_THRESHOLD = 95
+
+# ย้อนหลังสูงสุดที่ API กราฟรองรับ (ใช้เป็นช่วงเริ่มต้นตอนรันครั้งแรกด้วย)
+MAX_ROLLUP_DAYS = 180
+
+DAILY_ROLLUP_JOB = "novel_daily_stats"
+COUNTERS_JOB = "novel_counters"
+RECONCILE_JOB = "reconcile_counters"
+
+# คอลัมน์ใน novel_counters ที่ปรับด้วย delta ได้ → คอลัมน์รวมใน writer_counters
+NOVEL_COUNTER_COLUMNS = {
+    "chapters": None,
+    "views": "total_views",
+    "readers": None,
+    "likes": "total_likes",
+    "bookshelf": "total_bookshelf",
+    "comments": "total_comments",
+}
+
+# น้ำหนักของค่าเฉลี่ยรวมทั้งเว็บใน Bayesian average (เทียบเท่าจำนวนโหวตสมมติ)
+RATING_PRIOR_VOTES = 5
+# Bayesian average = (C·m + Σrating) / (C + votes) โดย (m, C) จาก rating_prior — ยังไม่มีโหวต = NO_VOTES_AVG
+# novel_counters.rating_avg (RATING_AVG_SQL) และ novel_rankings.bayesian_avg (ranking.py) ใช้กติกาเดียวกัน
+NO_VOTES_AVG = 0.0
+RATING_AVG_SQL = f"""CASE
+        WHEN rating_count > 0
+        THEN (%s * %s + rating_sum) / (%s + rating_count)
+        ELSE {NO_VOTES_AVG}
+    END"""
+# อายุของค่า prior ที่ cache ไว้ต่อ worker (ใช้ตอนให้ดาว / สร้าง-ลบตอน)
+RATING_PRIOR_TTL = 600.0
+
+# จำนวนนิยายต่อรอบตอน refresh ทั้งเว็บ
+REFRESH_CHUNK = 500
+# จำนวนแถว novel_counters ต่อ statement ตอนรวมค่า prior
+PRIOR_CHUNK = 5000
+
+# ค่าเริ่มต้นของงาน reconcile: นิยายต่อรอบ / นิยายสูงสุดต่อวินาที
+RECONCILE_CHUNK = 200
+RECONCILE_RATE = 500
+
+
+# ---------- job_state helpers ----------
+def get_job_mark(cur, job_name: str) -> datetime | None:
+    """คืน watermark ล่าสุดของงาน หรือ None ถ้ายังไม่เคยรัน"""
+    cur.execute("SELECT last_mark FROM job_state WHERE job_name = %s", (job_name,))
+    row = cur.fetchone()
+    return row["last_mark"] if row else None
+
+
+def set_job_mark(cur, job_name: str, mark: datetime | None) -> None:
+    cur.execute(
+        """
+        INSERT INTO job_state (job_name, last_mark)
+        VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE last_mark = VALUES(last_mark)
+        """,
+        (job_name, mark),
+    )
+
+
+# ---------- Daily rollup ----------
+def rollup_daily_stats(conn, days: int = MAX_ROLLUP_DAYS) -> dict:
+    """
+    เติม novel_daily_stats จาก reading_history แบบ incremental
+
+    - reading_history มี 1 แถวต่อ (users_id, novels_id) และ last_read_at ขยับไปข้างหน้าเสมอ
+      จึงสแกนเฉพาะแถวที่ last_read_at >= วันของ watermark ก่อนหน้า
+    - วันที่ปิดไปแล้วจะไม่ถูกคำนวณใหม่ (เป็น snapshot ณ สิ้นวัน)
+    - วันที่ยังเปิดอยู่ใช้ GREATEST เพื่อไม่ให้ยอดลดลงเมื่อผู้อ่านกลับมาอ่านวันถัดไป
+    - new_completions มาจาก novel_completions (บันทึกวันแรกที่อ่านถึง COMPLETION_THRESHOLD)
+    """
+    with conn.cursor(DictCursor) as cur:
+        mark = get_job_mark(cur, DAILY_ROLLUP_JOB)
+        if mark:
+            since = datetime.combine(mark.date(), datetime.min.time())
+        else:
+            since = datetime.combine(date.today() - timedelta(days=days), datetime.min.time())
+
+        cur.execute("SELECT MAX(last_read_at) AS m FROM reading_history")
+        new_mark = (cur.fetchone() or {}).get("m") or mark
+
+        # 1) ผู้อ่านที่อ่านจบครั้งแรก (INSERT IGNORE → เก็บวันแรกไว้เสมอ)
+        cur.execute(
+            """
+            INSERT IGNORE INTO novel_completions (novels_id, users_id, completed_on)
+            SELECT novels_id, users_id, DATE(last_read_at)
+            FROM reading_history
+            WHERE last_read_at >= %s
+              AND progress >= %s
+            """,
+            (since, COMPLETION_THRESHOLD),
+        )
+        completions = cur.rowcount
+
+        # 2) views / unique_readers / avg_progress ของวันที่ยังเปิดอยู่
+        cur.execute(
+            """
+            INSERT INTO novel_daily_stats
+                (novels_id, stat_date, views, unique_readers, avg_progress)
+            SELECT novels_id,
+                   DATE(last_read_at)        AS stat_date,
+                   COUNT(*)                  AS views,
+                   COUNT(DISTINCT users_id)  AS unique_readers,
+                   ROUND(AVG(COALESCE(progress, 0)), 2) AS avg_progress
+            FROM reading_history
+            WHERE last_read_at >= %s
+            GROUP BY novels_id, DATE(last_read_at)
+            ON DUPLICATE KEY UPDATE
+                views          = GREATEST(novel_daily_stats.views, VALUES(views)),
+                unique_readers = GREATEST(novel_daily_stats.unique_readers, VALUES(unique_readers)),
+                avg_progress   = VALUES(avg_progress)
+            """,
+            (since,),
+        )
+        day_rows = cur.rowcount
+
+        # 3) new_completions ของวันเดียวกัน
+        cur.execute(
+            """
+            INSERT INTO novel_daily_stats (novels_id, stat_date, new_completions)
+            SELECT novels_id, completed_on, COUNT(*)
+            FROM novel_completions
+            WHERE completed_on >= %s
+            GROUP BY novels_id, completed_on
+            ON DUPLICATE KEY UPDATE new_completions = VALUES(new_completions)
+            """,
+            (since.date(),),
+        )
+
+        set_job_mark(cur, DAILY_ROLLUP_JOB, new_mark)
+    conn.commit()
+
+    return {"since": since, "mark": new_mark, "day_rows": day_rows, "completions": completions}
+
+
+def load_daily_stats(cur, novels_id: int, days: int) -> list[dict]:
+    """อ่าน timeseries รายวันของนิยายจาก novel_daily_stats (ย้อนหลัง days วัน)"""
+    cur.execute(
+        """
+        SELECT stat_date AS date, views, unique_readers, new_completions, avg_progress
+        FROM novel_daily_stats
+        WHERE novels_id = %s
+          AND stat_date >= CURDATE() - INTERVAL %s DAY
+        ORDER BY stat_date
+        """,
+        (novels_id, days),
+    )
+    return list(cur.fetchall() or [])
+
+
+# ---------- Counters ----------
+def _placeholders(values) -> str:
+    return ", ".join(["%s"] * len(values))
+
+
+def _scalar(row):
+    """ค่าคอลัมน์แรกของแถว (รองรับทั้ง DictCursor และ cursor ปกติ)"""
+    if not row:
+        return None
+    if isinstance(row, dict):
+        return next(iter(row.values()), None)
+    return row[0]
+
+
+def prior_from_totals(rating_sum, rating_count) -> tuple[float, int]:
+    """(ค่าเฉลี่ยคะแนนทั้งเว็บ, น้ำหนัก) จากผลรวม rating_sum / rating_count"""
+    rating_count = int(rating_count or 0)
+    m = float(rating_sum or 0) / rating_count if rating_count else 0.0
+    return m, RATING_PRIOR_VOTES
+
+
+def rating_prior(cur, chunk: int = PRIOR_CHUNK) -> tuple[float, int]:
+    """
+    คืน (ค่าเฉลี่ยคะแนนทั้งเว็บ, น้ำหนัก) สำหรับ Bayesian average
+    รวม rating_sum / rating_count ของ novel_counters ทีละช่วง novels_id
+    (ไม่อ่านทั้งตาราง ratings หรือ novel_counters ใน statement เดียว)
+    """
+    total = votes = 0
+    last_id = 0
+    while True:
+        cur.execute(
+            """
+            SELECT MAX(novels_id) AS last_id, SUM(rating_sum) AS s, SUM(rating_count) AS c
+            FROM (
+                SELECT novels_id, rating_sum, rating_count
+                FROM novel_counters
+                WHERE novels_id > %s
+                ORDER BY novels_id
+                LIMIT %s
+            ) AS part
+            """,
+            (last_id, chunk),
+        )
+        row = cur.fetchone() or {}
+        if row.get("last_id") is None:
+            break
+        total += int(row["s"] or 0)
+        votes += int(row["c"] or 0)
+        last_id = int(row["last_id"])
+    return prior_from_totals(total, votes)
+
+
+_prior_cache: tuple[float, tuple[float, int]] | None = None
+
+
+def cached_rating_prior(cur) -> tuple[float, int]:
+    """rating_prior ที่ cache ไว้ RATING_PRIOR_TTL วินาที (ไล่ทั้ง novel_counters ไม่ควรทำทุกครั้งที่มีคนให้ดาว)"""
+    global _prior_cache
+    now = time.monotonic()
+    if _prior_cache is None or now - _prior_cache[0] > RATING_PRIOR_TTL:
+        _prior_cache = (now, rating_prior(cur))
+    return _prior_cache[1]
+
+
+def refresh_novel_counters(cur, novels_ids, prior: tuple[float, int] | None = None) -> int:
+    """
+    คำนวณ novel_counters ใหม่จากตารางหลักเฉพาะนิยายที่ระบุ
+    (ทุก subquery ถูกจำกัดด้วย novels_id จึงใช้ index และไม่แตะเรื่องอื่น)
+
+    - prior = (m, C) จาก rating_prior() → อัปเดต rating_avg ด้วย
+      ถ้าไม่ส่งมา rating_avg จะคงค่าเดิมไว้ (หน้าเว็บ fallback ไปใช้ค่าเฉลี่ยดิบ)
+    """
+    ids = [int(i) for i in novels_ids if i]
+    if not ids:
+        return 0
+
+    cur.execute(
+        f"""
+        INSERT INTO novel_counters
+            (novels_id, users_id, chapters, views, readers, likes,
+             bookshelf, comments, rating_count, rating_sum)
+        SELECT
+            n.novels_id,
+            n.users_id,
+            (SELECT COUNT(*) FROM chapters c WHERE c.novels_id = n.novels_id),
+            (SELECT COUNT(*) FROM reading_history rh WHERE rh.novels_id = n.novels_id),
+            (SELECT COUNT(DISTINCT rh.users_id) FROM reading_history rh WHERE rh.novels_id = n.novels_id),
+            (SELECT COUNT(*) FROM chapter_likes cl
+               JOIN chapters c ON c.chapters_id = cl.chapters_id
+              WHERE c.novels_id = n.novels_id),
+            (SELECT COUNT(*) FROM bookshelf b WHERE b.novels_id = n.novels_id),
+            (SELECT COUNT(*) FROM comments cm WHERE cm.novels_id = n.novels_id),
+            (SELECT COUNT(*) FROM ratings r WHERE r.novels_id = n.novels_id),
+            (SELECT COALESCE(SUM(r.rating), 0) FROM ratings r WHERE r.novels_id = n.novels_id)
+        FROM novels n
+        WHERE n.novels_id IN ({_placeholders(ids)})
+        ON DUPLICATE KEY UPDATE
+            users_id     = VALUES(users_id),
+            chapters     = VALUES(chapters),
+            views        = VALUES(views),
+            readers      = VALUES(readers),
+            likes        = VALUES(likes),
+            bookshelf    = VALUES(bookshelf),
+            comments     = VALUES(comments),
+            rating_count = VALUES(rating_count),
+            rating_sum   = VALUES(rating_sum)
+        """,
+        ids,
+    )
+    affected = cur.rowcount
+
+    if prior is not None:
+        _set_rating_avg(cur, ids, prior)
+    return affected
+
+
+def refresh_writer_counters(cur, users_ids=None) -> int:
+    """
+    รวม novel_counters เป็น writer_counters
+    - users_ids = None → ทุกคน (ใช้ในงาน refresh)
+    - ผู้เขียนที่ไม่มีนิยายเหลือแล้วจะถูกลบแถวออก
+    """
+    where = ""
+    params: list = []
+    if users_ids is not None:
+        params = [int(u) for u in users_ids if u]
+        if not params:
+            return 0
+        where = f"WHERE n.users_id IN ({_placeholders(params)})"
+
+    cur.execute(
+        f"""
+        INSERT INTO writer_counters
+            (users_id, work_count, total_views, total_likes, total_bookshelf, total_comments)
+        SELECT n.users_id,
+               COUNT(*),
+               COALESCE(SUM(nc.views), 0),
+               COALESCE(SUM(nc.likes), 0),
+               COALESCE(SUM(nc.bookshelf), 0),
+               COALESCE(SUM(nc.comments), 0)
+        FROM novels n
+        LEFT JOIN novel_counters nc ON nc.novels_id = n.novels_id
+        {where}
+        GROUP BY n.users_id
+        ON DUPLICATE KEY UPDATE
+            work_count      = VALUES(work_count),
+            total_views     = VALUES(total_views),
+            total_likes     = VALUES(total_likes),
+            total_bookshelf = VALUES(total_bookshelf),
+            total_comments  = VALUES(total_comments)
+        """,
+        params,
+    )
+    affected = cur.rowcount
+
+    stale_where = f"AND wc.users_id IN ({_placeholders(params)})" if params else ""
+    cur.execute(
+        f"""
+        DELETE wc FROM writer_counters wc
+        WHERE NOT EXISTS (SELECT 1 FROM novels n WHERE n.users_id = wc.users_id)
+        {stale_where}
+        """,
+        params,
+    )
+    return affected
+
+
+def ensure_writer_counters(cur, users_id: int) -> None:
+    """เติมตัวนับที่ยังไม่มี (นิยายใหม่ / ก่อนงาน refresh รอบแรก) เฉพาะของผู้เขียนคนนี้"""
+    cur.execute(
+        """
+        SELECT n.novels_id
+        FROM novels n
+        LEFT JOIN novel_counters nc ON nc.novels_id = n.novels_id
+        WHERE n.users_id = %s AND nc.novels_id IS NULL
+        """,
+        (users_id,),
+    )
+    missing = [_scalar(r) for r in cur.fetchall()]
+    cur.execute("SELECT 1 FROM writer_counters WHERE users_id = %s", (users_id,))
+    has_writer_row = cur.fetchone() is not None
+
+    if missing:
+        refresh_novel_counters(cur, missing, prior=cached_rating_prior(cur))
+    if missing or not has_writer_row:
+        refresh_writer_counters(cur, [users_id])
+
+
+# ตัวนับที่คำนวณแบบ batch ได้: ชื่อ → SQL ที่ GROUP BY novels_id (ใส่ IN (...) แทน {ids})
+_METRIC_SQL = {
+    "chapters": "SELECT novels_id, COUNT(*) AS v FROM chapters "
+                "WHERE novels_id IN ({ids}) GROUP BY novels_id",
+    "views": "SELECT novels_id, COUNT(*) AS v FROM reading_history "
+             "WHERE novels_id IN ({ids}) GROUP BY novels_id",
+    "readers": "SELECT novels_id, COUNT(DISTINCT users_id) AS v FROM reading_history "
+               "WHERE novels_id IN ({ids}) GROUP BY novels_id",
+    "likes": "SELECT c.novels_id, COUNT(*) AS v FROM chapter_likes cl "
+             "JOIN chapters c ON c.chapters_id = cl.chapters_id "
+             "WHERE c.novels_id IN ({ids}) GROUP BY c.novels_id",
+    "bookshelf": "SELECT novels_id, COUNT(*) AS v FROM bookshelf "
+                 "WHERE novels_id IN ({ids}) GROUP BY novels_id",
+    "comments": "SELECT novels_id, COUNT(*) AS v FROM comments "
+                "WHERE novels_id IN ({ids}) GROUP BY novels_id",
+    "rating_count": "SELECT novels_id, COUNT(*) AS v FROM ratings "
+                    "WHERE novels_id IN ({ids}) GROUP BY novels_id",
+    "rating_sum": "SELECT novels_id, COALESCE(SUM(rating), 0) AS v FROM ratings "
+                  "WHERE novels_id IN ({ids}) GROUP BY novels_id",
+}
+
+
+def aggregate_novel_metrics(cur, novels_ids, metrics=tuple(_METRIC_SQL)) -> dict[int, dict]:
+    """
+    นับตัวเลขของหลายเรื่องพร้อมกัน: 1 query ต่อ metric (GROUP BY novels_id + IN)
+    แล้วรวมผลใน Python → จำนวน query คงที่ไม่ว่าจะมีกี่เรื่อง
+    """
+    ids = [int(i) for i in novels_ids if i]
+    result = {i: {m: 0 for m in metrics} for i in ids}
+    if not ids:
+        return result
+
+    ph = _placeholders(ids)
+    for metric in metrics:
+        cur.execute(_METRIC_SQL[metric].format(ids=ph), ids)
+        for row in cur.fetchall():
+            nid, value = (row["novels_id"], row["v"]) if isinstance(row, dict) else row
+            result[int(nid)][metric] = int(value or 0)
+    return result
+
+
+def load_novel_counters(cur, novels_ids, metrics=tuple(_METRIC_SQL)) -> dict[int, dict]:
+    """
+    อ่านตัวนับของหลายเรื่องจาก novel_counters ใน query เดียว
+    เรื่องที่ยังไม่มีแถว (เช่นเพิ่งสร้าง) จะนับสดด้วย aggregate_novel_metrics
+    """
+    ids = [int(i) for i in novels_ids if i]
+    if not ids:
+        return {}
+
+    cols = ", ".join(metrics)
+    cur.execute(
+        f"SELECT novels_id, {cols} FROM novel_counters WHERE novels_id IN ({_placeholders(ids)})",
+        ids,
+    )
+    result = {}
+    for row in cur.fetchall():
+        if not isinstance(row, dict):
+            row = dict(zip(("novels_id",) + tuple(metrics), row))
+        result[int(row["novels_id"])] = {m: int(row[m] or 0) for m in metrics}
+
+    missing = [i for i in ids if i not in result]
+    if missing:
+        result.update(aggregate_novel_metrics(cur, missing, metrics))
+    return result
+
+
+def bump_novel_counter(cur, novels_id: int, column: str, delta: int = 1) -> None:
+    """
+    ปรับตัวนับของนิยายตาม event เขียน (เช่น กดหัวใจ / เพิ่มชั้นหนังสือ / คอมเมนต์)
+    ถ้ายังไม่มีแถวของนิยายนี้ จะคำนวณใหม่จากตารางหลักแทน
+    ไม่ raise ต่อ เพื่อไม่ให้ตัวนับทำให้การเขียนหลักล้มเหลว
+    """
+    if column not in NOVEL_COUNTER_COLUMNS:
+        raise ValueError(f"unknown counter column: {column}")
+    try:
+        cur.execute(
+            f"""
+            UPDATE novel_counters
+            SET {column} = GREATEST({column} + %s, 0)
+            WHERE novels_id = %s
+            """,
+            (delta, novels_id),
+        )
+        if cur.rowcount == 0:
+            refresh_novel_counters(cur, [novels_id], prior=cached_rating_prior(cur))
+            cur.execute("SELECT users_id FROM novels WHERE novels_id = %s", (novels_id,))
+            owner = _scalar(cur.fetchone())
+            if owner:
+                refresh_writer_counters(cur, [owner])
+            return
+
+        writer_col = NOVEL_COUNTER_COLUMNS[column]
+        if writer_col:
+            cur.execute(
+                f"""
+                UPDATE writer_counters wc
+                JOIN novels n ON n.users_id = wc.users_id
+                SET wc.{writer_col} = GREATEST(wc.{writer_col} + %s, 0)
+                WHERE n.novels_id = %s
+                """,
+                (delta, novels_id),
+            )
+    except Exception as e:
+        print(f"[stats.bump_novel_counter] {column} novels_id={novels_id} error: {e}")
+
+
+def bump_novel_rating(cur, novels_id: int, sum_delta: int, count_delta: int = 0) -> None:
+    """
+    ปรับ rating_sum / rating_count ตอนผู้ใช้ให้คะแนนหรือแก้คะแนน และคำนวณ rating_avg ใหม่ในคำสั่งเดียวกัน
+    (UPDATE ตารางเดียวของ MySQL ประเมิน SET จากซ้ายไปขวา rating_avg จึงเห็นค่า sum/count ใหม่แล้ว)
+    """
+    try:
+        m, weight = cached_rating_prior(cur)
+        cur.execute(
+            f"""
+            UPDATE novel_counters
+            SET rating_sum   = GREATEST(rating_sum + %s, 0),
+                rating_count = GREATEST(rating_count + %s, 0),
+                rating_avg   = {RATING_AVG_SQL}
+            WHERE novels_id = %s
+            """,
+            (sum_delta, count_delta, weight, m, weight, novels_id),
+        )
+        if cur.rowcount == 0:
+            refresh_novel_counters(cur, [novels_id], prior=(m, weight))
+    except Exception as e:
+        print(f"[stats.bump_novel_rating] novels_id={novels_id} error: {e}")
+
+
+def refresh_novel_and_writer(cur, novels_id: int | None, users_id: int | None = None) -> None:
+    """
+    ใช้หลังสร้าง/ลบนิยายหรือตอน (ซึ่ง cascade ไปลบหัวใจด้วย):
+    คำนวณตัวนับของเรื่องนั้นและของผู้เขียนใหม่
+    - ถ้าไม่ระบุ users_id จะใช้เจ้าของจากตาราง novels
+    """
+    try:
+        if novels_id:
+            if not users_id:
+                cur.execute("SELECT users_id FROM novels WHERE novels_id = %s", (novels_id,))
+                users_id = _scalar(cur.fetchone())
+            cur.execute("DELETE FROM novel_counters WHERE novels_id = %s", (novels_id,))
+            refresh_novel_counters(cur, [novels_id], prior=cached_rating_prior(cur))
+        if users_id:
+            refresh_writer_counters(cur, [users_id])
+    except Exception as e:
+        print(f"[stats.refresh_novel_and_writer] novels_id={novels_id} error: {e}")
+
+
+def refresh_all_counters(conn, chunk: int = REFRESH_CHUNK) -> dict:
+    """
+    คำนวณตัวนับทั้งเว็บใหม่ทีละช่วง novels_id (ไม่ล็อกตารางหลักนาน)
+    รอบแรกนับใหม่และรวม rating_sum / rating_count ของแต่ละช่วงเป็นค่า prior
+    รอบสองอัปเดต rating_avg ทุกช่วงด้วยค่า prior ชุดเดียวกัน
+    """
+    novels = 0
+    rating_sum = rating_count = 0
+    with conn.cursor(DictCursor) as cur:
+        last_id = 0
+        while True:
+            cur.execute(
+                "SELECT novels_id FROM novels WHERE novels_id > %s ORDER BY novels_id LIMIT %s",
+                (last_id, chunk),
+            )
+            ids = [r["novels_id"] for r in cur.fetchall()]
+            if not ids:
+                break
+            refresh_novel_counters(cur, ids)
+            cur.execute(
+                f"""
+                SELECT SUM(rating_sum) AS s, SUM(rating_count) AS c
+                FROM novel_counters WHERE novels_id IN ({_placeholders(ids)})
+                """,
+                ids,
+            )
+            row = cur.fetchone() or {}
+            rating_sum += int(row.get("s") or 0)
+            rating_count += int(row.get("c") or 0)
+            conn.commit()
+            novels += len(ids)
+            last_id = ids[-1]
+
+        prior = prior_from_totals(rating_sum, rating_count)
+        last_id = 0
+        while True:
+            cur.execute(
+                "SELECT novels_id FROM novel_counters WHERE novels_id > %s ORDER BY novels_id LIMIT %s",
+                (last_id, chunk),
+            )
+            ids = [r["novels_id"] for r in cur.fetchall()]
+            if not ids:
+                break
+            _set_rating_avg(cur, ids, prior)
+            conn.commit()
+            last_id = ids[-1]
+
+        # ลบตัวนับของนิยายที่ถูกลบไปแล้ว
+        cur.execute(
+            """
+            DELETE nc FROM novel_counters nc
+            LEFT JOIN novels n ON n.novels_id = nc.novels_id
+            WHERE n.novels_id IS NULL
+            """
+        )
+        removed = cur.rowcount
+        writers = refresh_writer_counters(cur)
+        set_job_mark(cur, COUNTERS_JOB, datetime.now())
+    conn.commit()
+    return {"novels": novels, "removed": removed, "writers": writers, "prior": prior}
+
+
+# ---------- Reconciliation ----------
+def _set_rating_avg(cur, novels_ids, prior: tuple[float, int]) -> None:
+    ids = [int(i) for i in novels_ids]
+    if not ids:
+        return
+    m, weight = prior
+    cur.execute(
+        f"""
+        UPDATE novel_counters
+        SET rating_avg = {RATING_AVG_SQL}
+        WHERE novels_id IN ({_placeholders(ids)})
+        """,
+        [weight, m, weight] + ids,
+    )
+
+
+def _reconcile_chunk(cur, ids: list[int], dry_run: bool, prior: tuple[float, int]) -> list[dict]:
+    """
+    เทียบตัวนับที่เก็บไว้กับค่าจริงของนิยายชุดหนึ่ง แล้วแก้เฉพาะแถวที่คลาด
+    - อ่านค่าที่เก็บไว้ก่อน แล้วค่อยนับจริง → ถ้ามี bump แทรกระหว่างนั้น
+      UPDATE แบบ compare-and-set จะไม่ match และปล่อยให้รอบถัดไปจัดการ
+    - กันได้ไม่ทุกกรณี: connection เป็น autocommit ถ้า INSERT ของ event (คอมเมนต์ / หัวใจ) commit
+      ก่อนนับจริง แต่ bump_novel_counter ของมันมาหลัง UPDATE นี้ ตัวนับจะเกินไป 1
+      (ไม่ล็อกแถวค้างไว้ระหว่างนับ เพื่อไม่ให้การเขียนของผู้ใช้ต้องรอ) รอบถัดไปจะเห็นว่าคลาดแล้วแก้เอง
+    - แก้ rating_sum / rating_count แล้วคำนวณ rating_avg ใหม่ด้วย prior
+    """
+    metrics = tuple(_METRIC_SQL)
+    cols = ", ".join(metrics)
+    cur.execute(
+        f"SELECT novels_id, {cols} FROM novel_counters WHERE novels_id IN ({_placeholders(ids)})",
+        ids,
+    )
+    stored = {int(r["novels_id"]): r for r in cur.fetchall()}
+    actual = aggregate_novel_metrics(cur, ids, metrics)
+
+    drifts = []
+    for nid in ids:
+        real = actual[nid]
+        have = stored.get(nid)
+        if have is None:
+            drifts.append({"novels_id": nid, "missing": True, "diff": real})
+            if not dry_run:
+                refresh_novel_counters(cur, [nid], prior=prior)
+            continue
+
+        diff = {m: real[m] - int(have[m] or 0) for m in metrics if real[m] != int(have[m] or 0)}
+        if not diff:
+            continue
+        drifts.append({"novels_id": nid, "missing": False, "diff": diff})
+        if dry_run:
+            continue
+
+        sets = ", ".join(f"{m} = %s" for m in diff)
+        guards = " AND ".join(f"{m} = %s" for m in diff)
+        cur.execute(
+            f"UPDATE novel_counters SET {sets} WHERE novels_id = %s AND {guards}",
+            [real[m] for m in diff] + [nid] + [int(have[m] or 0) for m in diff],
+        )
+        if cur.rowcount == 0:
+            drifts[-1]["skipped"] = True
+        elif "rating_sum" in diff or "rating_count" in diff:
+            _set_rating_avg(cur, [nid], prior)
+    return drifts
+
+
+def _orphan_counters(cur, after: int, upto: int | None, live_ids, dry_run: bool) -> tuple[int, set[int]]:
+    """
+    แถว novel_counters ในช่วง (after, upto] ที่ไม่มีนิยายแล้ว (live_ids = novels_id ที่ยังอยู่ในช่วงนั้น)
+    upto = None คือช่วงท้ายสุดหลังนิยายเรื่องสุดท้าย คืน (จำนวน, ผู้เขียนของแถวเหล่านั้น)
+    """
+    where = "novels_id > %s"
+    params: list = [after]
+    if upto is not None:
+        where += " AND novels_id <= %s"
+        params.append(upto)
+    live = [int(i) for i in live_ids]
+    if live:
+        where += f" AND novels_id NOT IN ({_placeholders(live)})"
+        params += live
+    cur.execute(f"SELECT novels_id, users_id FROM novel_counters WHERE {where}", params)
+    rows = cur.fetchall()
+    if not rows:
+        return 0, set()
+    if not dry_run:
+        ids = [int(r["novels_id"]) for r in rows]
+        cur.execute(f"DELETE FROM novel_counters WHERE novels_id IN ({_placeholders(ids)})", ids)
+    return len(rows), {int(r["users_id"]) for r in rows if r["users_id"]}
+
+
+def reconcile_counters(conn, chunk: int = RECONCILE_CHUNK, rate: int = RECONCILE_RATE,
+                       dry_run: bool = False, on_chunk=None) -> dict:
+    """
+    ไล่ตรวจ novel_counters ทีละช่วง novels_id (ทุก query ผูกกับ IN ของช่วงนั้น)
+    - หน่วงเวลาให้ไม่เกิน rate เรื่อง/วินาที เพื่อรันบน production ได้
+    - commit ทุกช่วง → ไม่มี transaction หรือ lock ยาว
+    - ลบแถวของนิยายที่ถูกลบไปแล้วทีละช่วงเดียวกัน (ไม่ JOIN ทั้งตาราง)
+      และคำนวณ writer_counters ใหม่เฉพาะผู้เขียนที่ได้รับผลกระทบ
+    """
+    report = {"scanned": 0, "drifted": 0, "missing": 0, "skipped": 0,
+              "orphans": 0, "totals": {}, "samples": []}
+    affected_writers: set[int] = set()
+    started = time.monotonic()
+    last_id = 0
+
+    with conn.cursor(DictCursor) as cur:
+        prior = rating_prior(cur)
+        while True:
+            cur.execute(
+                "SELECT novels_id, users_id FROM novels WHERE novels_id > %s "
+                "ORDER BY novels_id LIMIT %s",
+                (last_id, chunk),
+            )
+            rows = cur.fetchall()
+            if not rows:
+                break
+            owners = {int(r["novels_id"]): r["users_id"] for r in rows}
+            ids = list(owners)
+
+            drifts = _reconcile_chunk(cur, ids, dry_run, prior)
+            orphans, orphan_writers = _orphan_counters(cur, last_id, ids[-1], ids, dry_run)
+            conn.commit()
+            report["orphans"] += orphans
+            affected_writers |= orphan_writers
+
+            for d in drifts:
+                report["drifted"] += 1
+                report["missing"] += int(d["missing"])
+                report["skipped"] += int(bool(d.get("skipped")))
+                for m, delta in d["diff"].items():
+                    report["totals"][m] = report["totals"].get(m, 0) + abs(delta)
+                if len(report["samples"]) < 20:
+                    report["samples"].append(d)
+                if owners.get(d["novels_id"]):
+                    affected_writers.add(int(owners[d["novels_id"]]))
+            report["scanned"] += len(ids)
+            last_id = ids[-1]
+            if on_chunk:
+                on_chunk(last_id, report)
+
+            # จำกัดความเร็ว: รอจนกว่าจำนวนที่สแกนแล้วไม่เกิน rate เรื่อง/วินาที
+            if rate > 0:
+                wait = report["scanned"] / rate - (time.monotonic() - started)
+                if wait > 0:
+                    time.sleep(wait)
+
+        # แถวที่ novels_id เลยนิยายเรื่องสุดท้ายไปแล้ว
+        orphans, orphan_writers = _orphan_counters(cur, last_id, None, (), dry_run)
+        report["orphans"] += orphans
+        affected_writers |= orphan_writers
+        if not dry_run:
+            writers = sorted(affected_writers)
+            for i in range(0, len(writers), chunk):
+                refresh_writer_counters(cur, writers[i:i + chunk])
+                conn.commit()
+            set_job_mark(cur, RECONCILE_JOB, datetime.now())
+    conn.commit()
+
+    report["elapsed"] = time.monotonic() - started
+    return report
+
+
+# ---------- CLI ----------
+@stats_bp.cli.command("rollup-daily")
+@click.option("--days", default=MAX_ROLLUP_DAYS, show_default=True,
+              help="จำนวนวันย้อนหลังตอนรันครั้งแรก")
+def rollup_daily_command(days: int):
+    """เติมตาราง novel_daily_stats (ตั้ง cron ให้รันทุก ๆ 5-15 นาที)"""
+    with closing(get_db_connection()) as conn:
+        result = rollup_daily_stats(conn, days=max(1, min(days, MAX_ROLLUP_DAYS)))
+    click.echo(
+        f"rollup-daily: since={result['since']:%Y-%m-%d} "
+        f"day_rows={result['day_rows']} completions={result['completions']} "
+        f"mark={result['mark']}"
+    )
+
+
+@stats_bp.cli.command("refresh-counters")
+@click.option("--chunk", default=REFRESH_CHUNK, show_default=True,
+              help="จำนวนนิยายต่อรอบ")
+def refresh_counters_command(chunk: int):
+    """คำนวณ novel_counters / writer_counters ใหม่ (ตั้ง cron วันละครั้ง หรือทุกชั่วโมง)"""
+    with closing(get_db_connection()) as conn:
+        result = refresh_all_counters(conn, chunk=max(1, chunk))
+    m, weight = result["prior"]
+    click.echo(
+        f"refresh-counters: novels={result['novels']} removed={result['removed']} "
+        f"writers={result['writers']} prior=({m:.3f}, {weight})"
+    )
+
+
+@stats_bp.cli.command("reconcile")
+@click.option("--chunk", default=RECONCILE_CHUNK, show_default=True, help="จำนวนนิยายต่อรอบ")
+@click.option("--rate", default=RECONCILE_RATE, show_default=True,
+              help="จำนวนนิยายสูงสุดต่อวินาที (0 = ไม่จำกัด)")
+@click.option("--dry-run", is_flag=True, help="รายงานอย่างเดียว ไม่แก้ไขตัวนับ")
+@click.option("-v", "--verbose", is_flag=True, help="แสดงความคืบหน้าทุกช่วง")
+def reconcile_command(chunk: int, rate: int, dry_run: bool, verbose: bool):
+    """ตรวจตัวนับที่คลาดเคลื่อน (เช่นหลัง crash หรือลบแบบ cascade) แล้วแก้ให้ตรง"""
+    def progress(last_id, report):
+        if verbose:
+            click.echo(f"  ... novels_id <= {last_id}: scanned={report['scanned']} drifted={report['drifted']}")
+
+    with closing(get_db_connection()) as conn:
+        report = reconcile_counters(conn, chunk=max(1, chunk), rate=max(0, rate),
+                                    dry_run=dry_run, on_chunk=progress)
+
+    mode = "dry-run" if dry_run else "fixed"
+    click.echo(
+        f"reconcile ({mode}): scanned={report['scanned']} drifted={report['drifted']} "
+        f"missing={report['missing']} skipped={report['skipped']} "
+        f"orphans={report['orphans']} elapsed={report['elapsed']:.1f}s"
+    )
+    for metric, total in sorted(report["totals"].items()):
+        click.echo(f"  {metric}: |drift| = {total}")
+    for d in report["samples"]:
+        tag = " (missing row)" if d["missing"] else (" (skipped, changed concurrently)" if d.get("skipped") else "")
+        diff = ", ".join(f"{m}{v:+d}" for m, v in d["diff"].items())
+        click.echo(f"  novels_id={d['novels_id']}{tag}: {diff}")
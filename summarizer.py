@@ -0,0 +1,352 @@
+# summarizer.py
+"""
+สรุปความคิดเห็นผู้อ่าน (ใช้โดย summary_jobs)
+
+engine เลือกได้ผ่าน config SUMMARY_ENGINE (ดู ENGINES / register_engine)
+  - llm         : โมเดล AI (ค่าเริ่มต้น) รันใน worker เบื้องหลัง ไม่ใช่ใน request
+  - extractive  : เลือกคอมเมนต์ตัวแทนด้วย TF-IDF (extractive.py) ไม่ต่อเน็ต เร็วพอรันใน request
+                  และเป็นตัวสำรองเสมอเมื่อไม่มี client / เรียกโมเดลไม่สำเร็จ / เกินงบ token
+
+client ต้องมี responses.create(model=..., instructions=..., input=...) แบบ openai-python
+ตอนพัฒนา/ทดสอบบนเครื่องตั้ง OPENAI_FAKE=1 เพื่อใช้ FakeOpenAIClient แทน (ไม่ต่อเน็ต ไม่เสียเงิน)
+"""
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from flask import current_app
+
+import extractive
+
+# ข้อความ fallback เวลาเรียก AI ไม่ได้ (summary_jobs ใช้ FALLBACK_PREFIX แยกว่าสรุปสำเร็จหรือไม่)
+FALLBACK_PREFIX = "ไม่สามารถติดต่อบริการสรุปด้วย AI ได้ในขณะนี้"
+FALLBACK_TEXT = FALLBACK_PREFIX + " โปรดลองใหม่อีกครั้งภายหลัง"
+NO_CLIENT_TEXT = "ไม่สามารถเรียกใช้โมเดล AI ได้ (ยังไม่ได้ตั้งค่า OPENAI_CLIENT ใน app.py)"
+NOT_ENOUGH_TEXT = "ยังไม่มีความคิดเห็นจากผู้อ่านเพียงพอสำหรับการสรุป"
+
+SUMMARY_MODEL = "gpt-4o-mini"
+COMMENT_MAX_CHARS = 400
+# ใช้ประมาณจำนวน token ก่อนเรียกโมเดล (ข้อความไทยปน emoji ราว 2-3 ตัวอักษรต่อ token)
+CHARS_PER_TOKEN = 2.5
+PROMPT_OVERHEAD_TOKENS = 300
+
+# map-reduce สำหรับเรื่องที่คอมเมนต์ใหม่เยอะเกินจะใส่ prompt เดียว (ดู summary_jobs.refresh_summary)
+SINGLE_PASS_TOKENS = 6000   # คอมเมนต์ใหม่ไม่เกินนี้ → prompt เดียวแบบเดิม
+CHUNK_TOKENS = 3000         # คอมเมนต์ต่อ chunk ในขั้น map
+REDUCE_FANIN = 10           # สรุปย่อยต่อการรวมหนึ่งครั้งในขั้น reduce
+MAP_WORKERS = 4             # จำนวนครั้งที่เรียกโมเดลพร้อมกันต่อเรื่อง
+
+
+def is_fallback(text) -> bool:
+    """ข้อความนี้มี fallback ต่อท้าย/ล้วน ๆ ไหม (generate_comment_summary ต่อ fallback ท้ายสรุปเดิม)"""
+    s = str(text or "").strip()
+    return s.startswith(FALLBACK_PREFIX) or FALLBACK_TEXT in s or NO_CLIENT_TEXT in s
+
+
+def is_extractive(text) -> bool:
+    """สรุปนี้มาจาก engine extractive (ใช้แสดงได้ แต่ไม่ใช้เป็นสรุปเดิมให้โมเดลต่อยอด)"""
+    return str(text or "").lstrip().startswith(extractive.HEADER)
+
+
+def estimate_tokens(chars: int) -> int:
+    return int(chars / CHARS_PER_TOKEN) + 1
+
+
+def add_usage(usage: dict | None, response, prompt: str = "", output: str = "") -> None:
+    """รวมจำนวน token ของ response ลง usage (ถ้า SDK ไม่คืน usage มาใช้ค่าประมาณจากความยาวข้อความ)"""
+    if usage is None:
+        return
+    u = getattr(response, "usage", None)
+    in_tok = getattr(u, "input_tokens", None) if u is not None else None
+    out_tok = getattr(u, "output_tokens", None) if u is not None else None
+    usage["calls"] = usage.get("calls", 0) + 1
+    usage["input_tokens"] = usage.get("input_tokens", 0) + int(in_tok if in_tok is not None else estimate_tokens(len(prompt)))
+    usage["output_tokens"] = usage.get("output_tokens", 0) + int(out_tok if out_tok is not None else estimate_tokens(len(output)))
+
+
+# ใช้ instructions (ภาษาอังกฤษ) + input (มีไทยได้เต็ม ๆ)
+# เพื่อลดโอกาสเจอ bug encoding แปลก ๆ
+INSTRUCTIONS = (
+    "You are an assistant that summarizes reader comments for an online novel. "
+    "You can read Thai and English comments and you must answer in Thai. "
+    "Summarize the key sentiments (what readers like, dislike, and suggestions) "
+    "into 3-5 concise bullet-style lines in Thai."
+)
+
+
+def clip_comment(c) -> str:
+    """ข้อความคอมเมนต์ที่ส่งให้โมเดล (กันคอมเมนต์ยาวเกินไป)"""
+    text = str(c.get("content") or "").strip()
+    if len(text) > COMMENT_MAX_CHARS:
+        text = text[:COMMENT_MAX_CHARS] + "..."
+    return text
+
+
+def _title_part(novel_title: str) -> str:
+    return f"นิยายเรื่อง: {novel_title}\n" if novel_title else ""
+
+
+def call_model(client, instructions: str, user_prompt: str, usage: dict | None = None) -> str:
+    """เรียกโมเดลหนึ่งครั้ง คืนข้อความ ("" ถ้าโมเดลไม่ตอบอะไร) — error ของ SDK โยนต่อให้ผู้เรียก"""
+    # ใช้รูปแบบเรียกตาม docs: instructions + input (string เดียว)
+    # ตัวอย่างจากเอกสาร:
+    #   client.responses.create(model="gpt-4o-mini", instructions="...", input="...")
+    # อ้างอิง: GitHub openai-python :contentReference[oaicite:0]{index=0}
+    response = client.responses.create(
+        model=SUMMARY_MODEL,  # หรือรุ่นอื่นที่คุณมีสิทธิ์ใช้ เช่น gpt-4.1-mini
+        instructions=instructions,
+        input=user_prompt,
+    )
+
+    # ไลบรารีใหม่จะมี helper ชื่อ output_text สำหรับ text ล้วน
+    summary_text = (getattr(response, "output_text", None) or "").strip()
+
+    # กันเคสที่ output_text ไม่มี (เผื่อใช้เวอร์ชันอื่น)
+    if not summary_text and hasattr(response, "output"):
+        try:
+            summary_text = response.output[0].content[0].text.strip()
+        except Exception:
+            pass
+
+    add_usage(usage, response, instructions + user_prompt, summary_text)
+    return summary_text
+
+
+def generate_comment_summary(base_summary, comments, novel_title: str = "", client=None, usage: dict | None = None) -> str:
+    """
+    เรียก OpenAI API เพื่อสรุปความคิดเห็นผู้อ่านของนิยายเรื่องหนึ่งจริง ๆ
+    - base_summary = สรุปเดิม (ถ้าเคยสรุปแล้ว)
+    - comments = list ของคอมเมนต์ใหม่ที่ยังไม่เคยถูกสรุป
+    - novel_title = ชื่อเรื่อง (เอาไว้ช่วยให้ model รู้ context)
+    - client = OpenAI client (ไม่ส่งมา → ใช้ app.config["OPENAI_CLIENT"])
+    - usage = dict ที่จะถูกบวก calls / input_tokens / output_tokens (งาน batch ใช้คิดต้นทุน)
+    """
+
+    # ถ้าไม่มีคอมเมนต์ใหม่เลย แต่มีสรุปเดิมอยู่แล้ว → ส่งสรุปเดิมกลับ
+    if (not comments) and base_summary:
+        return base_summary
+
+    # ดึง client จาก app.config (เราตั้งไว้ใน app.py แล้ว)
+    if client is None:
+        client = current_app.config.get("OPENAI_CLIENT")
+    if client is None:
+        fallback = NO_CLIENT_TEXT
+        return base_summary + "\n\n" + fallback if base_summary else fallback
+
+    # รวมข้อความคอมเมนต์ใหม่เป็น list
+    comment_items = [f"- {text}" for text in (clip_comment(c) for c in comments) if text]
+
+    if not comment_items and base_summary:
+        return base_summary
+    elif not comment_items:
+        return base_summary or NOT_ENOUGH_TEXT
+
+    comments_block = "\n".join(comment_items)
+
+    instructions = INSTRUCTIONS
+    title_part = _title_part(novel_title)
+
+    if base_summary:
+        user_prompt = (
+            f"{title_part}"
+            "นี่คือสรุปเดิมจากความคิดเห็นก่อนหน้า:\n"
+            f"{base_summary}\n\n"
+            "และนี่คือความคิดเห็นใหม่ที่เพิ่งเพิ่มเข้ามา:\n"
+            f"{comments_block}\n\n"
+            "โปรดสร้างสรุปฉบับอัปเดตที่รวมทั้งสรุปเดิมและความคิดเห็นใหม่ "
+            "ให้ตอบเป็นภาษาไทยเท่านั้น แบ่งบรรทัดให้อ่านง่าย"
+        )
+    else:
+        user_prompt = (
+            f"{title_part}"
+            "นี่คือความคิดเห็นจากผู้อ่านนิยายเรื่องนี้:\n"
+            f"{comments_block}\n\n"
+            "โปรดสรุปความคิดเห็นของผู้อ่านจากข้อความทั้งหมดด้านบน "
+            "ให้เป็นภาษาไทยสั้น ๆ แบ่งเป็นหลายบรรทัดอ่านง่าย"
+        )
+
+    try:
+        summary_text = call_model(client, instructions, user_prompt, usage)
+        if not summary_text:
+            return base_summary or "ไม่สามารถสร้างสรุปความคิดเห็นได้ในขณะนี้"
+
+        return summary_text
+
+    except Exception as e:
+        # log แบบไม่ไปชน encoding error (ใช้ repr)
+        print("[generate_comment_summary] OpenAI error type:", type(e), "detail:", repr(e))
+        fallback = FALLBACK_TEXT
+        return base_summary + "\n\n" + fallback if base_summary else fallback
+
+
+# ---------- map-reduce ----------
+PARTIAL_INSTRUCTIONS = (
+    "You are an assistant that summarizes reader comments for an online novel. "
+    "You can read Thai and English comments and you must answer in Thai. "
+    "This is one batch of many; summarize what readers like, dislike and suggest "
+    "in up to 5 short Thai lines so it can be merged with other batches later."
+)
+
+
+def comment_tokens(comments) -> int:
+    """จำนวน token (ประมาณ) ของคอมเมนต์ชุดนี้ตามที่จะส่งจริง"""
+    return sum(estimate_tokens(len(clip_comment(c)) + 2) for c in comments)
+
+
+def needs_map_reduce(comments) -> bool:
+    return comment_tokens(comments) > SINGLE_PASS_TOKENS
+
+
+def chunk_comments(comments, max_tokens: int = CHUNK_TOKENS) -> list[list[dict]]:
+    """
+    แบ่งคอมเมนต์ (เรียง cm_id) เป็น chunk ละไม่เกิน max_tokens ตามลำดับเดิม
+    ทุก chunk ยกเว้นอันสุดท้าย "เต็ม" แล้ว (ขอบเขตไม่เปลี่ยนเมื่อมีคอมเมนต์ใหม่) จึง cache ได้
+    """
+    chunks: list[list[dict]] = []
+    cur: list[dict] = []
+    used = 0
+    for c in comments:
+        if not clip_comment(c):
+            continue
+        t = estimate_tokens(len(clip_comment(c)) + 2)
+        if cur and used + t > max_tokens:
+            chunks.append(cur)
+            cur, used = [], 0
+        cur.append(c)
+        used += t
+    if cur:
+        chunks.append(cur)
+    return chunks
+
+
+def summarize_chunk(client, comments, novel_title: str = "", usage: dict | None = None) -> str:
+    """ขั้น map: สรุปย่อยของ chunk เดียว (error โยนต่อ)"""
+    block = "\n".join(f"- {t}" for t in (clip_comment(c) for c in comments) if t)
+    prompt = (
+        f"{_title_part(novel_title)}"
+        "นี่คือความคิดเห็นจากผู้อ่านชุดหนึ่ง:\n"
+        f"{block}\n\n"
+        "โปรดสรุปสั้น ๆ เป็นภาษาไทย"
+    )
+    text = call_model(client, PARTIAL_INSTRUCTIONS, prompt, usage)
+    if not text:
+        raise RuntimeError("empty partial summary")
+    return text
+
+
+def merge_summaries(client, parts: list[str], novel_title: str = "", usage: dict | None = None,
+                    final: bool = True) -> str:
+    """ขั้น reduce: รวมสรุปย่อยหลายอันเป็นอันเดียว (final = ใช้รูปแบบคำตอบ 3-5 บรรทัดของหน้าเว็บ)"""
+    block = "\n\n".join(f"[{i}]\n{p}" for i, p in enumerate(parts, start=1))
+    prompt = (
+        f"{_title_part(novel_title)}"
+        "นี่คือสรุปความคิดเห็นของผู้อ่านแยกตามช่วง (เรียงจากเก่าไปใหม่):\n"
+        f"{block}\n\n"
+        "โปรดรวมเป็นสรุปเดียว ให้น้ำหนักประเด็นที่พบบ่อยหลายช่วง "
+        "ให้ตอบเป็นภาษาไทยเท่านั้น แบ่งบรรทัดให้อ่านง่าย"
+    )
+    text = call_model(client, INSTRUCTIONS if final else PARTIAL_INSTRUCTIONS, prompt, usage)
+    if not text:
+        raise RuntimeError("empty merged summary")
+    return text
+
+
+def parallel_map(fn, items, workers: int = MAP_WORKERS, usage: dict | None = None) -> list:
+    """
+    เรียก fn(item, usage_ของตัวเอง) พร้อมกันไม่เกิน workers งาน คืนผลตามลำดับเดิม
+    (ผลที่ error เป็น exception object ให้ผู้เรียกตัดสินเอง) แล้วรวม usage ของทุกงานใน thread หลัก
+    """
+    def run(item):
+        u: dict = {}
+        try:
+            return fn(item, u), u
+        except Exception as e:
+            return e, u
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(items) or 1)),
+                            thread_name_prefix="summary-map") as ex:
+        results = list(ex.map(run, items))
+    if usage is not None:
+        for _, u in results:
+            for k, v in u.items():
+                usage[k] = usage.get(k, 0) + v
+    return [r for r, _ in results]
+
+
+def reduce_summaries(client, parts: list[str], novel_title: str = "", usage: dict | None = None,
+                     workers: int = MAP_WORKERS) -> str:
+    """รวมแบบลำดับชั้น: ทีละ REDUCE_FANIN อัน (พร้อมกัน) จนเหลือชั้นสุดท้ายชั้นเดียว"""
+    parts = [p for p in parts if p]
+    if not parts:
+        raise RuntimeError("nothing to merge")
+    while len(parts) > REDUCE_FANIN:
+        groups = [parts[i:i + REDUCE_FANIN] for i in range(0, len(parts), REDUCE_FANIN)]
+        merged = parallel_map(
+            lambda g, u: g[0] if len(g) == 1 else merge_summaries(client, g, novel_title, u, final=False),
+            groups, workers, usage,
+        )
+        for m in merged:
+            if isinstance(m, Exception):
+                raise m
+        parts = merged
+    return merge_summaries(client, parts, novel_title, usage, final=True)
+
+
+# ---------- engine ----------
+def extractive_summary(base_summary, comments, novel_title: str = "", client=None,
+                       usage: dict | None = None) -> str:
+    """engine extractive: ใช้ signature เดียวกับ generate_comment_summary (client/usage ไม่ได้ใช้)"""
+    return extractive.summarize(comments) or base_summary or NOT_ENOUGH_TEXT
+
+
+# ชื่อ engine → ฟังก์ชัน (base_summary, comments, novel_title, client, usage) -> str
+ENGINES = {
+    "llm": generate_comment_summary,
+    "extractive": extractive_summary,
+}
+DEFAULT_ENGINE = "llm"
+FALLBACK_ENGINE = "extractive"
+
+
+def register_engine(name: str, fn) -> None:
+    """เพิ่ม engine ใหม่ (เช่นโมเดล local) แล้วเลือกด้วย SUMMARY_ENGINE=name"""
+    ENGINES[name] = fn
+
+
+def summary_engine() -> str:
+    """engine ที่ใช้จริง: ตาม config แต่ถ้าเป็น llm และไม่มี client ให้ใช้ extractive ทันที"""
+    engine = current_app.config.get("SUMMARY_ENGINE", DEFAULT_ENGINE)
+    if engine not in ENGINES:
+        engine = DEFAULT_ENGINE
+    if engine == "llm" and current_app.config.get("OPENAI_CLIENT") is None:
+        return FALLBACK_ENGINE
+    return engine
+
+
+class FakeOpenAIClient:
+    """
+    client ปลอมสำหรับรันบนเครื่อง: คืนบรรทัดแรกของคอมเมนต์ใหม่ไม่เกิน 5 บรรทัดเป็น "สรุป"
+    delay = หน่วงเวลาต่อครั้ง (วินาที) ไว้ลองพฤติกรรมของคิว/poll, fail = โยน error ทุกครั้ง
+    """
+
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.calls: list[dict] = []
+        self.responses = SimpleNamespace(create=self._create)
+
+    def _create(self, model: str = "", instructions: str = "", input: str = "", **kwargs):
+        self.calls.append({"model": model, "instructions": instructions, "input": input})
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("fake client failure")
+        lines = [ln[2:].strip() for ln in str(input).splitlines() if ln.startswith("- ")]
+        text = "\n".join(f"- {ln[:80]}" for ln in lines[:5]) or "- (ไม่มีความคิดเห็นใหม่)"
+        usage = SimpleNamespace(
+            input_tokens=estimate_tokens(len(instructions) + len(str(input))),
+            output_tokens=estimate_tokens(len(text)),
+        )
+        return SimpleNamespace(output_text=text, usage=usage)
@@ -0,0 +1,679 @@
+# summary_jobs.py
+"""
+คิวงานสรุปความคิดเห็นด้วย AI (แทนการเรียกโมเดลใน request thread)
+
+- คิวเก็บในตาราง summary_jobs แถวเดียวต่อเรื่อง: queued → running → done / failed
+  ขอซ้ำระหว่างรอไม่สร้างงานใหม่ ขอระหว่างกำลังรันจะเพิ่ม request_seq ให้รันต่ออีกรอบหลังจบ
+- worker เคลมงานด้วย UPDATE ... WHERE status='queued' (rowcount = 1 คือได้งาน) จึงรันหลาย process ได้
+  งานที่ running ค้างเกิน STALE_SECONDS (worker ตาย) จะถูกเคลมใหม่
+- ในเว็บแต่ละ process มี SummaryWorkerPool ไม่เกิน SUMMARY_WORKERS thread (0 = ปิด แล้วใช้ CLI แทน)
+
+    flask --app app summary work              # worker แยก process วนรอคิวไปเรื่อย ๆ
+    flask --app app summary work --once       # เคลียร์คิวที่ค้างแล้วจบ
+    flask --app app summary batch             # สรุปล่วงหน้าเรื่องยอดอ่านสูงที่ dirty (ตั้ง cron)
+"""
+from __future__ import annotations
+
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import datetime
+
+import click
+from flask import Blueprint, current_app
+from MySQLdb.cursors import DictCursor
+
+import extractive
+from db import get_db_connection
+from stats import set_job_mark
+from summarizer import (
+    COMMENT_MAX_CHARS, FALLBACK_TEXT, MAP_WORKERS, NO_CLIENT_TEXT, PROMPT_OVERHEAD_TOKENS,
+    ENGINES, chunk_comments, estimate_tokens, generate_comment_summary, is_extractive, is_fallback,
+    needs_map_reduce, parallel_map, reduce_summaries, summarize_chunk, summary_engine,
+)
+
+summary_bp = Blueprint("summary", __name__, cli_group="summary")
+
+SUMMARY_WORKERS = 2         # thread ต่อ process เว็บ (ตั้งใน app.config["SUMMARY_WORKERS"])
+MAX_ATTEMPTS = 3            # เรียกโมเดลไม่สำเร็จเกินนี้ → failed (รอคนกดขอใหม่)
+STALE_SECONDS = 300
+POLL_INTERVAL = 2.0         # CLI worker: เว้นระยะตอนคิวว่าง
+CLAIM_BATCH = 5
+
+# งาน batch: จำนวนเรื่องต่อรอบ / thread / งบ token ต่อรอบ (0 = ไม่จำกัด)
+BATCH_JOB = "comment_summary_batch"
+BATCH_LIMIT = 50
+BATCH_WORKERS = 4
+BATCH_TOKEN_BUDGET = 200_000
+# ราคา USD ต่อ 1M token ของ summarizer.SUMMARY_MODEL (แก้ได้ใน app.config SUMMARY_PRICE_INPUT / SUMMARY_PRICE_OUTPUT)
+PRICE_INPUT_PER_MTOK = 0.15
+PRICE_OUTPUT_PER_MTOK = 0.60
+
+# สถานะที่ client ต้อง poll ต่อ
+PENDING_STATUSES = ("queued", "running")
+
+
+# ---------- คิว ----------
+def enqueue(cur, novels_id: int) -> None:
+    """ขอสรุปใหม่ (ลำดับการ assign สำคัญ: status ต้องอยู่ท้ายสุดเพราะคอลัมน์ก่อนหน้าอ่านค่าเดิม)"""
+    cur.execute(
+        """
+        INSERT INTO summary_jobs (novels_id, status, request_seq, requested_at)
+        VALUES (%s, 'queued', 1, NOW())
+        ON DUPLICATE KEY UPDATE
+            request_seq  = request_seq + 1,
+            requested_at = IF(status IN ('done', 'failed'), NOW(), requested_at),
+            attempts     = IF(status IN ('done', 'failed'), 0, attempts),
+            error        = IF(status IN ('done', 'failed'), NULL, error),
+            status       = IF(status = 'running', 'running', 'queued')
+        """,
+        (novels_id,),
+    )
+
+
+def job_status(cur, novels_id: int) -> str | None:
+    cur.execute("SELECT status FROM summary_jobs WHERE novels_id = %s", (novels_id,))
+    row = cur.fetchone()
+    return row["status"] if row else None
+
+
+_CLAIMABLE_SQL = "(status = 'queued' OR (status = 'running' AND started_at < NOW() - INTERVAL %s SECOND))"
+
+
+def claim(cur, novels_id: int, worker: str) -> bool:
+    """เคลมงานของเรื่องนี้โดยเฉพาะ (False ถ้าไม่ได้อยู่ในคิว หรือมี worker อื่นรันอยู่)"""
+    cur.execute(
+        f"""
+        UPDATE summary_jobs
+        SET status = 'running', claimed_seq = request_seq, started_at = NOW(),
+            worker = %s, attempts = attempts + 1
+        WHERE novels_id = %s AND {_CLAIMABLE_SQL}
+        """,
+        (worker, novels_id, STALE_SECONDS),
+    )
+    return cur.rowcount == 1
+
+
+def claim_next(cur, worker: str) -> int | None:
+    """เคลมงานที่รอนานที่สุด คืน novels_id หรือ None ถ้าคิวว่าง"""
+    cur.execute(
+        f"""
+        SELECT novels_id FROM summary_jobs
+        WHERE {_CLAIMABLE_SQL}
+        ORDER BY requested_at
+        LIMIT %s
+        """,
+        (STALE_SECONDS, CLAIM_BATCH),
+    )
+    for row in cur.fetchall():
+        if claim(cur, int(row["novels_id"]), worker):
+            return int(row["novels_id"])
+    return None
+
+
+def finish_job(cur, novels_id: int, worker: str) -> None:
+    """จบงาน ถ้ามีคนขอเพิ่มระหว่างรัน (request_seq ขยับ) ให้กลับเข้าคิวอีกรอบ"""
+    cur.execute(
+        """
+        UPDATE summary_jobs
+        SET status = IF(request_seq > claimed_seq, 'queued', 'done'),
+            attempts = IF(request_seq > claimed_seq, 0, attempts),
+            finished_at = NOW(), error = NULL
+        WHERE novels_id = %s AND worker = %s AND status = 'running'
+        """,
+        (novels_id, worker),
+    )
+
+
+def fail_job(cur, novels_id: int, worker: str, error: str) -> None:
+    cur.execute(
+        """
+        UPDATE summary_jobs
+        SET status = IF(attempts >= %s, 'failed', 'queued'),
+            finished_at = NOW(), error = %s
+        WHERE novels_id = %s AND worker = %s AND status = 'running'
+        """,
+        (MAX_ATTEMPTS, (error or "")[:255], novels_id, worker),
+    )
+
+
+# ---------- สรุป (ย้ายมาจาก novelcover.comment_summary) ----------
+def read_summary(cur, novels_id: int) -> dict | None:
+    cur.execute(
+        """
+        SELECT summary_text, last_cm_id, dirty
+        FROM comment_summaries
+        WHERE novels_id = %s
+        LIMIT 1
+        """,
+        (novels_id,),
+    )
+    return cur.fetchone()
+
+
+def _latest_comments(cur, novels_id: int, limit: int) -> list[dict]:
+    """คอมเมนต์ล่าสุด limit อัน เรียงเก่า → ใหม่ (สำหรับ engine ที่ไม่ต่อยอดจากสรุปเดิม)"""
+    cur.execute(
+        """
+        SELECT cm_id, content
+        FROM comments
+        WHERE novels_id = %s
+        ORDER BY cm_id DESC
+        LIMIT %s
+        """,
+        (novels_id, limit),
+    )
+    return list(reversed(cur.fetchall()))
+
+
+def _write_summary(cur, novels_id: int, text: str, last_cm_id: int) -> None:
+    """เขียนสรุปที่ครอบคลุมถึง last_cm_id (คอมเมนต์ที่เข้ามาระหว่างสรุปมี cm_id มากกว่า → คง dirty ไว้ให้รอบหน้า)"""
+    cur.execute(
+        """
+        INSERT INTO comment_summaries (novels_id, summary_text, last_cm_id, dirty)
+        VALUES (%s, %s, %s, 0)
+        ON DUPLICATE KEY UPDATE
+            summary_text = VALUES(summary_text),
+            last_cm_id   = VALUES(last_cm_id),
+            dirty        = EXISTS (SELECT 1 FROM comments c WHERE c.novels_id = %s AND c.cm_id > %s)
+        """,
+        (novels_id, text, last_cm_id or None, novels_id, last_cm_id or 0),
+    )
+
+
+def _mark_dirty(cur, novels_id: int, interim: str | None = None) -> None:
+    """ยังต้องสรุปใหม่ — interim (สรุป extractive) ถ้ามีจะถูกเก็บไว้ให้ผู้อ่านเห็นระหว่างรอ"""
+    cur.execute(
+        """
+        INSERT INTO comment_summaries (novels_id, summary_text, last_cm_id, dirty)
+        VALUES (%s, %s, NULL, 1)
+        ON DUPLICATE KEY UPDATE
+            summary_text = COALESCE(VALUES(summary_text), summary_text),
+            dirty        = 1
+        """,
+        (novels_id, interim),
+    )
+
+
+def instant_summary(cur, novels_id: int) -> str | None:
+    """สรุป extractive จากคอมเมนต์ล่าสุด (หลักสิบ ms) เก็บไว้เป็นสรุปชั่วคราวจนกว่า engine หลักจะเสร็จ"""
+    text = extractive.summarize(_latest_comments(cur, novels_id, extractive.MAX_COMMENTS))
+    if not text:
+        return None
+    _mark_dirty(cur, novels_id, text)
+    return text
+
+
+def refresh_summary(conn, novels_id: int, client=None, usage: dict | None = None,
+                    engine: str | None = None) -> dict:
+    """
+    สรุปคอมเมนต์ที่ยังไม่เคยสรุปของเรื่องนี้แล้วเขียนลง comment_summaries
+
+    engine = ชื่อใน summarizer.ENGINES (ไม่ส่งมา → summary_engine()) — engine อื่นที่ไม่ใช่ llm
+    สรุปจากคอมเมนต์ล่าสุดทุกครั้ง ไม่ต่อยอดสรุปเดิม
+    คืน {"summary", "ok"} — ok = False เมื่อเรียกโมเดลไม่สำเร็จ (สรุปเดิมไม่ถูกเขียนทับ, dirty ยังเป็น 1)
+    """
+    with conn.cursor(DictCursor) as cur:
+        cur.execute("SELECT title FROM novels WHERE novels_id = %s LIMIT 1", (novels_id,))
+        row = cur.fetchone()
+        novel_title = str(row["title"]) if row and row.get("title") else ""
+
+        engine = engine or summary_engine()
+        if engine != "llm":
+            rows = _latest_comments(cur, novels_id, extractive.MAX_COMMENTS)
+            text = ENGINES[engine](None, rows, novel_title, client, usage)
+            _write_summary(cur, novels_id, text, int(rows[-1]["cm_id"]) if rows else 0)
+            conn.commit()
+            return {"summary": text, "ok": True}
+
+        summary_row = read_summary(cur, novels_id)
+        base_summary = None
+        last_cm_id = 0
+        if summary_row:
+            base_summary = summary_row.get("summary_text") or None
+            try:
+                last_cm_id = int(summary_row.get("last_cm_id") or 0)
+            except (TypeError, ValueError):
+                last_cm_id = 0
+            # ถ้า summary เดิมเป็นข้อความ fallback / extractive ให้ถือว่าไม่มี base_summary
+            if is_fallback(base_summary) or is_extractive(base_summary):
+                base_summary = None
+
+        # มีสรุปเดิม → ดึงเฉพาะคอมเมนต์ใหม่, ยังไม่เคยสรุป → ดึงทั้งหมด
+        if base_summary and last_cm_id > 0:
+            cur.execute(
+                """
+                SELECT cm_id, content
+                FROM comments
+                WHERE novels_id = %s
+                  AND cm_id > %s
+                ORDER BY cm_id ASC
+                """,
+                (novels_id, last_cm_id),
+            )
+        else:
+            cur.execute(
+                """
+                SELECT cm_id, content
+                FROM comments
+                WHERE novels_id = %s
+                ORDER BY cm_id ASC
+                """,
+                (novels_id,),
+            )
+        new_comments = cur.fetchall()
+
+        if not new_comments and base_summary:
+            cur.execute("UPDATE comment_summaries SET dirty = 0 WHERE novels_id = %s", (novels_id,))
+            conn.commit()
+            return {"summary": base_summary, "ok": True}
+
+        if needs_map_reduce(new_comments):
+            new_summary, covered_cm_id = map_reduce_summary(
+                conn, cur, novels_id, novel_title, base_summary, last_cm_id, client=client, usage=usage,
+            )
+        else:
+            new_summary = generate_comment_summary(base_summary, new_comments, novel_title=novel_title,
+                                                   client=client, usage=usage)
+            covered_cm_id = max([last_cm_id] + [int(r.get("cm_id") or 0) for r in new_comments])
+        if is_fallback(new_summary):
+            # อย่าเขียนทับสรุปเก่าด้วย fallback; แค่ mark ว่ายังต้องสรุปใหม่
+            # ยังไม่มีสรุปที่ใช้ได้ → เก็บสรุป extractive ไว้ให้ผู้อ่านก่อน
+            interim = None if base_summary else (extractive.summarize(new_comments) or None)
+            _mark_dirty(cur, novels_id, interim)
+            conn.commit()
+            return {"summary": new_summary, "ok": False}
+
+        _write_summary(cur, novels_id, new_summary, covered_cm_id)
+    conn.commit()
+    return {"summary": new_summary, "ok": True}
+
+
+# ---------- map-reduce + cache สรุปย่อยต่อ chunk ----------
+def load_chunks(cur, novels_id: int) -> list[dict]:
+    cur.execute(
+        """
+        SELECT chunk_no, first_cm_id, last_cm_id, summary_text
+        FROM comment_summary_chunks
+        WHERE novels_id = %s
+        ORDER BY chunk_no
+        """,
+        (novels_id,),
+    )
+    return list(cur.fetchall())
+
+
+def _save_chunks(cur, novels_id: int, chunks: list[dict]) -> None:
+    if not chunks:
+        return
+    cur.executemany(
+        """
+        INSERT INTO comment_summary_chunks
+            (novels_id, chunk_no, first_cm_id, last_cm_id, n_comments, summary_text)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            first_cm_id  = VALUES(first_cm_id),
+            last_cm_id   = VALUES(last_cm_id),
+            n_comments   = VALUES(n_comments),
+            summary_text = VALUES(summary_text)
+        """,
+        [
+            (novels_id, c["chunk_no"], c["first_cm_id"], c["last_cm_id"], c.get("n_comments", 0), c["summary_text"])
+            for c in chunks
+        ],
+    )
+
+
+def drop_chunks_from(cur, novels_id: int, cm_id: int) -> None:
+    """เรียกตอนลบคอมเมนต์: ทิ้ง chunk ที่มีคอมเมนต์นั้นและทุก chunk หลังจากนั้น (cache ต้องต่อเนื่องจากต้นเสมอ)"""
+    cur.execute(
+        "DELETE FROM comment_summary_chunks WHERE novels_id = %s AND last_cm_id >= %s",
+        (novels_id, cm_id),
+    )
+
+
+def map_reduce_summary(conn, cur, novels_id: int, novel_title: str, base_summary, last_cm_id: int,
+                       client=None, usage: dict | None = None) -> tuple[str, int]:
+    """
+    สรุปทั้งเรื่องจาก chunk: สรุปย่อยของ chunk ที่เต็มแล้วอ่านจาก comment_summary_chunks
+    เรียกโมเดลเฉพาะ chunk ใหม่ (พร้อมกันไม่เกิน SUMMARY_MAP_WORKERS) แล้ว reduce ทุกสรุปย่อยเป็นอันเดียว
+
+    chunk สุดท้ายยังไม่เต็ม จึงไม่ cache (รอบหน้าสรุปใหม่พร้อมคอมเมนต์ที่เพิ่มเข้ามา)
+    คืน (สรุป, cm_id สุดท้ายที่ครอบคลุม) — เรียกโมเดลไม่สำเร็จคืนข้อความ fallback
+    """
+    if client is None:
+        client = current_app.config.get("OPENAI_CLIENT")
+    if client is None:
+        return NO_CLIENT_TEXT, last_cm_id
+    workers = int(current_app.config.get("SUMMARY_MAP_WORKERS", MAP_WORKERS))
+
+    cached = load_chunks(cur, novels_id)
+    if not cached and base_summary and last_cm_id > 0:
+        # เคยสรุปแบบ prompt เดียวมาก่อน → ใช้สรุปเดิมเป็น chunk 0 ที่ครอบคลุมถึง last_cm_id
+        cached = [{"chunk_no": 0, "first_cm_id": 0, "last_cm_id": last_cm_id, "summary_text": base_summary}]
+        _save_chunks(cur, novels_id, cached)
+    after = int(cached[-1]["last_cm_id"]) if cached else 0
+    next_no = int(cached[-1]["chunk_no"]) + 1 if cached else 0
+
+    cur.execute(
+        """
+        SELECT cm_id, content
+        FROM comments
+        WHERE novels_id = %s
+          AND cm_id > %s
+        ORDER BY cm_id ASC
+        """,
+        (novels_id, after),
+    )
+    rows = list(cur.fetchall())
+    chunks = chunk_comments(rows)
+    partials = parallel_map(lambda ch, u: summarize_chunk(client, ch, novel_title, u), chunks, workers, usage)
+
+    # เก็บเฉพาะ chunk ที่เต็มแล้วและสำเร็จต่อเนื่องจากต้น (ถ้ากลางทางพัง รอบหน้าเริ่มจากตรงนั้น)
+    closed = []
+    for i, (ch, part) in enumerate(zip(chunks[:-1], partials[:-1])):
+        if isinstance(part, Exception):
+            break
+        closed.append({
+            "chunk_no": next_no + i,
+            "first_cm_id": int(ch[0]["cm_id"]),
+            "last_cm_id": int(ch[-1]["cm_id"]),
+            "n_comments": len(ch),
+            "summary_text": part,
+        })
+    _save_chunks(cur, novels_id, closed)
+    conn.commit()
+
+    errors = [p for p in partials if isinstance(p, Exception)]
+    if errors:
+        print(f"[summary_jobs.map_reduce] novels_id={novels_id} {len(errors)}/{len(chunks)} chunks failed: {errors[0]!r}")
+        return FALLBACK_TEXT, last_cm_id
+    try:
+        summary = reduce_summaries(client, [c["summary_text"] for c in cached] + partials, novel_title, usage, workers)
+    except Exception as e:
+        print(f"[summary_jobs.map_reduce] novels_id={novels_id} reduce error: {e!r}")
+        return FALLBACK_TEXT, last_cm_id
+    covered = int(rows[-1]["cm_id"]) if rows else after
+    return summary, max(covered, last_cm_id)
+
+
+def run_job(conn, novels_id: int, worker: str, client=None, usage: dict | None = None) -> bool:
+    """รันงานที่เคลมแล้วหนึ่งงาน คืน True ถ้าสรุปสำเร็จ"""
+    try:
+        result = refresh_summary(conn, novels_id, client=client, usage=usage)
+        error = None if result["ok"] else "model unavailable"
+    except Exception as e:
+        print(f"[summary_jobs.run_job] novels_id={novels_id} error: {e!r}")
+        error = repr(e)
+    with conn.cursor(DictCursor) as cur:
+        if error is None:
+            finish_job(cur, novels_id, worker)
+        else:
+            fail_job(cur, novels_id, worker, error)
+    conn.commit()
+    return error is None
+
+
+# ---------- worker pool ----------
+class SummaryWorkerPool:
+    """
+    thread ไม่เกิน workers ตัว แต่ละตัวเปิด connection เดียวแล้ววนเคลมงานจากตารางจนคิวว่าง
+    kick() ตอนเต็มจะตั้ง flag ไว้ให้ thread ที่กำลังจะจบลองเคลมอีกรอบ (งานไม่ตกหล่นระหว่างรอ)
+    """
+
+    def __init__(self, app, workers: int = SUMMARY_WORKERS):
+        self.app = app
+        self.workers = max(1, int(workers))
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="summary")
+        self._lock = threading.Lock()
+        self._active = 0
+        self._pending = False
+
+    def kick(self) -> None:
+        with self._lock:
+            if self._active >= self.workers:
+                self._pending = True
+                return
+            self._active += 1
+        self._executor.submit(self._drain)
+
+    def _drain(self) -> None:
+        try:
+            with self.app.app_context():
+                with closing(get_db_connection()) as conn:
+                    while True:
+                        with conn.cursor(DictCursor) as cur:
+                            novels_id = claim_next(cur, self.name)
+                        conn.commit()
+                        if novels_id is not None:
+                            run_job(conn, novels_id, self.name)
+                            continue
+                        with self._lock:
+                            if not self._pending:
+                                self._active -= 1
+                                return
+                            self._pending = False
+        except Exception as e:
+            print(f"[summary_jobs.drain] error: {e!r}")
+        with self._lock:
+            self._active -= 1
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+
+def init_summary_workers(app) -> None:
+    """เรียกใน app.py: สร้าง pool ของ process นี้ (SUMMARY_WORKERS = 0 → ไม่สร้าง ใช้ CLI worker แทน)"""
+    workers = int(app.config.get("SUMMARY_WORKERS", SUMMARY_WORKERS) or 0)
+    if workers > 0:
+        app.extensions["summary_pool"] = SummaryWorkerPool(app, workers)
+
+
+def kick_workers() -> None:
+    """ปลุก pool ของ process นี้หลัง enqueue (ไม่มี pool → รอ CLI worker)"""
+    pool = current_app.extensions.get("summary_pool")
+    if pool is not None:
+        pool.kick()
+
+
+def summary_payload(cur, novels_id: int) -> dict:
+    """
+    สรุปล่าสุดที่มี + สถานะงาน สำหรับ endpoint ของหน้า novel cover (ไม่เรียกโมเดล)
+    สรุป extractive ถือว่ายัง dirty ถ้า engine ตอนนี้เป็น llm (ให้โมเดลสรุปทับเมื่อกลับมาใช้ได้)
+    """
+    row = read_summary(cur, novels_id) or {}
+    summary = row.get("summary_text") or None
+    if is_fallback(summary):
+        summary = None
+    dirty = int(row.get("dirty") if row.get("dirty") is not None else 1)
+    if summary and is_extractive(summary) and summary_engine() == "llm":
+        dirty = 1
+    status = job_status(cur, novels_id)
+    if not dirty and status not in PENDING_STATUSES:
+        status = "done"
+    return {
+        "ok": True,
+        "summary": summary,
+        "from_cache": True,
+        "dirty": bool(dirty),
+        "status": status or "idle",
+        "engine": "extractive" if is_extractive(summary) else "llm",
+    }
+
+
+# ---------- batch ตามรอบเวลา ----------
+def dirty_candidates(cur, limit: int) -> list[dict]:
+    """
+    เรื่องที่ dirty เรียงตามยอดอ่าน (novel_counters.views) มากไปน้อย
+    พร้อมจำนวนตัวอักษรของคอมเมนต์ที่ยังไม่ได้สรุป (ตัดที่ COMMENT_MAX_CHARS เหมือนตอนส่งโมเดล) ไว้ประมาณ token
+    ข้ามเรื่องที่มี worker กำลังรันอยู่ (head = ต้นข้อความสรุปเดิม ไว้ดูว่ามีสรุปที่ใช้ได้แล้วหรือยัง)
+    เลือก limit เรื่องใน derived table ก่อน แล้วค่อยรวมตัวอักษรคอมเมนต์เฉพาะเรื่องเหล่านั้น
+    (ไม่สแกนคอมเมนต์ของทุกเรื่องที่ dirty)
+    """
+    cur.execute(
+        """
+        SELECT top.novels_id,
+               top.views,
+               top.head,
+               (SELECT COALESCE(SUM(LEAST(CHAR_LENGTH(c.content), %s)), 0)
+                  FROM comments c
+                 WHERE c.novels_id = top.novels_id
+                   AND c.cm_id > top.last_cm_id) AS pending_chars
+        FROM (
+            SELECT cs.novels_id,
+                   COALESCE(nc.views, 0) AS views,
+                   LEFT(cs.summary_text, 64) AS head,
+                   COALESCE(cs.last_cm_id, 0) AS last_cm_id
+            FROM comment_summaries cs
+            LEFT JOIN novel_counters nc ON nc.novels_id = cs.novels_id
+            LEFT JOIN summary_jobs j ON j.novels_id = cs.novels_id
+            WHERE cs.dirty = 1
+              AND (j.status IS NULL OR j.status <> 'running')
+            ORDER BY views DESC, cs.novels_id
+            LIMIT %s
+        ) AS top
+        ORDER BY top.views DESC, top.novels_id
+        """,
+        (COMMENT_MAX_CHARS, limit),
+    )
+    return list(cur.fetchall())
+
+
+def _batch_one(app, novels_id: int, worker: str) -> tuple[str, dict]:
+    """เข้าคิว + เคลม + สรุปหนึ่งเรื่องใน thread ของ batch (connection ของตัวเอง)"""
+    usage: dict = {}
+    with app.app_context():
+        with closing(get_db_connection()) as conn:
+            with conn.cursor(DictCursor) as cur:
+                enqueue(cur, novels_id)
+                claimed = claim(cur, novels_id, worker)
+            conn.commit()
+            if not claimed:
+                return "skipped", usage
+            ok = run_job(conn, novels_id, worker, usage=usage)
+    return ("done" if ok else "failed"), usage
+
+
+def run_batch(app, limit: int = BATCH_LIMIT, workers: int = BATCH_WORKERS,
+              token_budget: int = BATCH_TOKEN_BUDGET) -> dict:
+    """
+    สรุปล่วงหน้า limit เรื่องที่อ่านเยอะที่สุดซึ่ง dirty ด้วย thread ไม่เกิน workers ตัว
+
+    งบ token ใช้ค่าประมาณก่อนเรียก (ตัวอักษรคอมเมนต์ใหม่ + prompt) — เรื่องที่ไม่พอดีงบที่เหลือถูกข้ามไปรอบหน้า
+    แต่ถ้ายังไม่มีสรุปที่ใช้ได้เลยจะได้สรุป extractive ไว้ก่อน
+    ผลต่อรอบ (จำนวนเรื่อง, token จริงจาก usage ของ API, ต้นทุน, ความเร็ว) บันทึกลง summary_runs
+    """
+    started = datetime.now().replace(microsecond=0)
+    t0 = time.monotonic()
+    worker = f"batch:{socket.gethostname()}:{os.getpid()}"
+
+    with closing(get_db_connection()) as conn:
+        with conn.cursor(DictCursor) as cur:
+            candidates = dirty_candidates(cur, limit)
+
+    planned: list[int] = []
+    instant: list[int] = []
+    estimated = 0
+    over_budget = 0
+    for c in candidates:
+        est = estimate_tokens(int(c["pending_chars"] or 0)) + PROMPT_OVERHEAD_TOKENS
+        if token_budget and estimated + est > token_budget:
+            over_budget += 1
+            if not c.get("head") or is_fallback(c["head"]):
+                instant.append(int(c["novels_id"]))
+            continue
+        estimated += est
+        planned.append(int(c["novels_id"]))
+
+    counts = {"done": 0, "failed": 0, "skipped": 0}
+    usage = {"calls": 0, "input_tokens": 0, "output_tokens": 0}
+    if planned:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="summary-batch") as ex:
+            for status, u in ex.map(lambda nid: _batch_one(app, nid, worker), planned):
+                counts[status] += 1
+                for k in usage:
+                    usage[k] += int(u.get(k, 0))
+    if instant:
+        with closing(get_db_connection()) as conn:
+            with conn.cursor(DictCursor) as cur:
+                for nid in instant:
+                    instant_summary(cur, nid)
+            conn.commit()
+
+    elapsed = max(time.monotonic() - t0, 0.001)
+    price_in = float(app.config.get("SUMMARY_PRICE_INPUT", PRICE_INPUT_PER_MTOK))
+    price_out = float(app.config.get("SUMMARY_PRICE_OUTPUT", PRICE_OUTPUT_PER_MTOK))
+    result = {
+        "selected": len(candidates),
+        "planned": len(planned),
+        "over_budget": over_budget,
+        "instant": len(instant),
+        **counts,
+        **usage,
+        "estimated_tokens": estimated,
+        "cost_usd": round(usage["input_tokens"] / 1e6 * price_in + usage["output_tokens"] / 1e6 * price_out, 6),
+        "elapsed_sec": round(elapsed, 3),
+        "novels_per_min": round(counts["done"] / elapsed * 60, 2),
+        "tokens_per_sec": round((usage["input_tokens"] + usage["output_tokens"]) / elapsed, 1),
+    }
+
+    with closing(get_db_connection()) as conn:
+        with conn.cursor(DictCursor) as cur:
+            cur.execute(
+                """
+                INSERT INTO summary_runs
+                    (started_at, elapsed_sec, selected, planned, over_budget, done, failed, skipped,
+                     calls, input_tokens, output_tokens, estimated_tokens, cost_usd,
+                     novels_per_min, tokens_per_sec)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """,
+                (started, result["elapsed_sec"], result["selected"], result["planned"], over_budget,
+                 counts["done"], counts["failed"], counts["skipped"], usage["calls"],
+                 usage["input_tokens"], usage["output_tokens"], estimated, result["cost_usd"],
+                 result["novels_per_min"], result["tokens_per_sec"]),
+            )
+            set_job_mark(cur, BATCH_JOB, started)
+        conn.commit()
+    return result
+
+
+# ---------- CLI ----------
+@summary_bp.cli.command("work")
+@click.option("--workers", default=SUMMARY_WORKERS, show_default=True, help="จำนวน thread ที่เรียกโมเดลพร้อมกัน")
+@click.option("--once", is_flag=True, help="เคลียร์คิวที่ค้างแล้วจบ")
+def work_command(workers: int, once: bool):
+    """รัน worker สรุปความคิดเห็นแยกจากเว็บ"""
+    pool = SummaryWorkerPool(current_app._get_current_object(), workers)
+    click.echo(f"summary worker {pool.name}: workers={pool.workers}")
+    try:
+        while True:
+            for _ in range(pool.workers):
+                pool.kick()
+            if once:
+                break
+            time.sleep(POLL_INTERVAL)
+    finally:
+        pool.shutdown(wait=True)
+
+
+@summary_bp.cli.command("batch")
+@click.option("--limit", default=BATCH_LIMIT, show_default=True, help="จำนวนเรื่อง dirty สูงสุดต่อรอบ (เรียงตามยอดอ่าน)")
+@click.option("--workers", default=BATCH_WORKERS, show_default=True, help="จำนวนเรื่องที่สรุปพร้อมกัน")
+@click.option("--token-budget", default=BATCH_TOKEN_BUDGET, show_default=True,
+              help="งบ token (ประมาณ) ต่อรอบ 0 = ไม่จำกัด")
+def batch_command(limit: int, workers: int, token_budget: int):
+    """สรุปความคิดเห็นล่วงหน้าให้เรื่องที่อ่านเยอะ (ตั้ง cron ทุก 10-30 นาที)"""
+    r = run_batch(current_app._get_current_object(), limit=max(1, limit), workers=max(1, workers),
+                  token_budget=max(0, token_budget))
+    click.echo(
+        f"summary batch: selected={r['selected']} planned={r['planned']} over_budget={r['over_budget']} "
+        f"instant={r['instant']} "
+        f"done={r['done']} failed={r['failed']} skipped={r['skipped']} "
+        f"tokens={r['input_tokens']}+{r['output_tokens']} (est {r['estimated_tokens']}) "
+        f"cost=${r['cost_usd']} {r['novels_per_min']} novels/min {r['tokens_per_sec']} tok/s "
+        f"in {r['elapsed_sec']}s"
+    )
@@ -0,0 +1,87 @@
+# tag_cache.py
+"""
+cache ชื่อแท็ก ↔ tag_id (ต่อ worker) สำหรับหน้า /search
+
+- resolve(คำค้น) → tag_id ที่ชื่อมีคำนั้น (ความหมายเดียวกับ t.name LIKE '%kw%' เดิม)
+  แล้ว SQL กรองด้วย novels_tags.tag_id IN (...) ซึ่งใช้ primary key
+- ชื่อแท็กของผลลัพธ์ดึงจาก novels_tags ของเรื่องในหน้านั้น + map id→ชื่อ แทน GROUP_CONCAT
+- โหลดใหม่ทั้งตารางทุก TAG_CACHE_TTL วินาที หรือเมื่อเจอ tag_id ที่ยังไม่รู้จัก
+"""
+from __future__ import annotations
+
+import threading
+import time
+
+import textseg
+
+TAG_CACHE_TTL = 300.0
+MAX_RESOLVED = 500     # กันคำค้นสั้นมาก ๆ ที่ตรงกับแท็กเกือบทั้งหมด
+
+
+class TagCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_id: dict[int, str] = {}
+        self.by_name: dict[str, int] = {}     # ชื่อ normalize แล้ว → tag_id
+        self.loaded_at = 0.0
+
+    def refresh(self, cur) -> None:
+        cur.execute("SELECT tag_id, name FROM tags")
+        rows = cur.fetchall()
+        by_id, by_name = {}, {}
+        for r in rows:
+            tag_id, name = (r["tag_id"], r["name"]) if isinstance(r, dict) else (r[0], r[1])
+            by_id[int(tag_id)] = name
+            by_name[textseg.normalize(name)] = int(tag_id)
+        with self._lock:
+            self.by_id, self.by_name = by_id, by_name
+            self.loaded_at = time.monotonic()
+
+    def resolve(self, term: str) -> list[int]:
+        """tag_id ของแท็กที่ชื่อมี term (ตรงทั้งชื่อขึ้นก่อน)"""
+        t = textseg.normalize(term).strip()
+        if not t:
+            return []
+        by_name = self.by_name
+        exact = by_name.get(t)
+        ids = [exact] if exact is not None else []
+        for name, tag_id in by_name.items():
+            if t in name and tag_id != exact:
+                ids.append(tag_id)
+                if len(ids) >= MAX_RESOLVED:
+                    break
+        return ids
+
+    def names(self, tag_ids) -> list[str]:
+        by_id = self.by_id
+        return sorted(by_id[i] for i in tag_ids if i in by_id)
+
+
+_cache = TagCache()
+
+
+def get_tag_cache(cur) -> TagCache:
+    if time.monotonic() - _cache.loaded_at >= TAG_CACHE_TTL:
+        _cache.refresh(cur)
+    return _cache
+
+
+def attach_tag_names(cur, rows) -> None:
+    """เติม row['tag_names'] ("a, b, c") ให้ผลค้นหาทั้งหน้าด้วย query เดียวบน novels_tags"""
+    if not rows:
+        return
+    ids = [r["novels_id"] for r in rows]
+    cur.execute(
+        f"SELECT novels_id, tag_id FROM novels_tags WHERE novels_id IN ({', '.join(['%s'] * len(ids))})",
+        ids,
+    )
+    by_novel: dict[int, list[int]] = {}
+    for r in cur.fetchall():
+        by_novel.setdefault(int(r["novels_id"]), []).append(int(r["tag_id"]))
+
+    cache = get_tag_cache(cur)
+    if any(t not in cache.by_id for tags in by_novel.values() for t in tags):
+        cache.refresh(cur)  # มีแท็กใหม่ที่เพิ่งสร้าง
+    for r in rows:
+        names = cache.names(by_novel.get(int(r["novels_id"]), ()))
+        r["tag_names"] = ", ".join(names) if names else None
@@ -0,0 +1,103 @@
+# tests/conftest.py
+"""
+fixture ของการทดสอบที่ต้องใช้ MySQL จริง
+
+    TEST_MYSQL_DB=readweb_test MYSQL_USER=root MYSQL_PASSWORD=... python -m pytest -q tests
+
+- TEST_MYSQL_DB ต้องเป็นฐานข้อมูลทิ้งได้ (ตารางที่ใช้ทดสอบจะถูกล้างก่อนทุกเทส)
+- MYSQL_HOST / MYSQL_USER / MYSQL_PASSWORD / MYSQL_PORT อ่านจาก env ถ้ามี ไม่งั้นใช้ค่าเริ่มต้นของ db.py
+- ไม่ได้ตั้ง TEST_MYSQL_DB / ต่อไม่ได้ / ไม่มี flask หรือ MySQLdb → ข้ามทั้งชุด
+"""
+from __future__ import annotations
+
+import os
+import sys
+from contextlib import closing
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# ตารางหลักแบบย่อที่คิวสรุปอ่าน (ของจริงมาจาก dump ของเว็บ ไม่ได้อยู่ใน schema.sql)
+BASE_TABLES = (
+    """
+    CREATE TABLE IF NOT EXISTS novels (
+      novels_id  INT          NOT NULL AUTO_INCREMENT,
+      users_id   INT          NOT NULL DEFAULT 0,
+      title      VARCHAR(255) NOT NULL DEFAULT '',
+      status     VARCHAR(32)  NOT NULL DEFAULT 'เผยแพร่',
+      PRIMARY KEY (novels_id)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS comments (
+      cm_id      INT      NOT NULL AUTO_INCREMENT,
+      users_id   INT      NOT NULL DEFAULT 0,
+      novels_id  INT      NOT NULL,
+      content    TEXT     NOT NULL,
+      created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+      PRIMARY KEY (cm_id),
+      KEY idx_comments_novel (novels_id)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+)
+# ตารางของคิวสรุป สร้างจาก schema.sql ตัวจริง
+SCHEMA_TABLES = ("summary_jobs", "comment_summaries", "comment_summary_chunks")
+CLEAN_TABLES = ("summary_jobs", "comment_summary_chunks", "comment_summaries", "comments", "novels")
+
+
+def _schema_statements(names) -> list[str]:
+    """คำสั่ง CREATE TABLE ของตารางใน names จาก schema.sql (แยกด้วย semicolon แบบเดียวกับ db.init_db)"""
+    with open(os.path.join(ROOT, "schema.sql"), encoding="utf-8") as f:
+        sql = f.read()
+    out = []
+    for stmt in sql.split(";"):
+        body = "\n".join(ln for ln in stmt.splitlines() if not ln.strip().startswith("--")).strip()
+        if any(body.startswith(f"CREATE TABLE IF NOT EXISTS {name} ") for name in names):
+            out.append(body)
+    return out
+
+
+@pytest.fixture(scope="session")
+def app():
+    db_name = os.environ.get("TEST_MYSQL_DB")
+    if not db_name:
+        pytest.skip("ไม่ได้ตั้ง TEST_MYSQL_DB")
+    flask = pytest.importorskip("flask")
+    pytest.importorskip("MySQLdb")
+    from db import apply_defaults, get_db_connection
+
+    app = flask.Flask("tests", root_path=ROOT)
+    apply_defaults(app)
+    for key in ("MYSQL_HOST", "MYSQL_USER", "MYSQL_PASSWORD", "MYSQL_PORT"):
+        if os.environ.get(key):
+            app.config[key] = os.environ[key]
+    app.config["MYSQL_DB"] = db_name
+    app.config["SUMMARY_ENGINE"] = "llm"
+
+    with app.app_context():
+        try:
+            conn = get_db_connection()
+        except Exception as e:
+            pytest.skip(f"ต่อ MySQL ไม่ได้: {e!r}")
+        with closing(conn), conn.cursor() as cur:
+            for stmt in BASE_TABLES + tuple(_schema_statements(SCHEMA_TABLES)):
+                cur.execute(stmt)
+    return app
+
+
+@pytest.fixture
+def db(app):
+    """connection (autocommit) ใน app context ที่ล้างตารางแล้ว + FakeOpenAIClient เป็น OPENAI_CLIENT"""
+    from db import get_db_connection
+    from summarizer import FakeOpenAIClient
+
+    app.config["OPENAI_CLIENT"] = FakeOpenAIClient()
+    with app.app_context():
+        with closing(get_db_connection()) as conn:
+            with conn.cursor() as cur:
+                for table in CLEAN_TABLES:
+                    cur.execute(f"DELETE FROM {table}")
+            yield conn
@@ -0,0 +1,193 @@
+# tests/test_summary_jobs.py
+"""คิวสรุปความคิดเห็น (summary_jobs) กับ MySQL จริง โดยใช้ summarizer.FakeOpenAIClient แทน OpenAI"""
+from __future__ import annotations
+
+import time
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("MySQLdb")
+
+from MySQLdb.cursors import DictCursor  # noqa: E402
+
+import summary_jobs as sj  # noqa: E402
+from summarizer import FakeOpenAIClient, is_extractive  # noqa: E402
+
+
+def _novel(conn, title: str = "นิยายทดสอบ", comments=()) -> int:
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO novels (title) VALUES (%s)", (title,))
+        novels_id = cur.lastrowid
+        for text in comments:
+            cur.execute("INSERT INTO comments (novels_id, content) VALUES (%s, %s)", (novels_id, text))
+    return int(novels_id)
+
+
+def _job(conn, novels_id: int) -> dict | None:
+    with conn.cursor(DictCursor) as cur:
+        cur.execute("SELECT * FROM summary_jobs WHERE novels_id = %s", (novels_id,))
+        return cur.fetchone()
+
+
+def _summary(conn, novels_id: int) -> dict | None:
+    with conn.cursor(DictCursor) as cur:
+        return sj.read_summary(cur, novels_id)
+
+
+# ---------- สถานะของคิว ----------
+def test_enqueue_twice_keeps_one_queued_job(db):
+    nid = _novel(db)
+    with db.cursor(DictCursor) as cur:
+        sj.enqueue(cur, nid)
+        sj.enqueue(cur, nid)
+    job = _job(db, nid)
+    assert job["status"] == "queued"
+    assert job["request_seq"] == 2
+    assert job["attempts"] == 0
+
+
+def test_claim_is_exclusive_and_finish_marks_done(db):
+    nid = _novel(db)
+    with db.cursor(DictCursor) as cur:
+        sj.enqueue(cur, nid)
+        assert sj.claim(cur, nid, "w1")
+        assert not sj.claim(cur, nid, "w2")
+        job = _job(db, nid)
+        assert (job["status"], job["worker"], job["claimed_seq"], job["attempts"]) == ("running", "w1", 1, 1)
+
+        sj.finish_job(cur, nid, "w1")
+        job = _job(db, nid)
+        assert job["status"] == "done"
+        assert job["finished_at"] is not None
+
+        # ขอใหม่หลังจบแล้ว → กลับเข้าคิวและนับ attempts ใหม่
+        sj.enqueue(cur, nid)
+    job = _job(db, nid)
+    assert (job["status"], job["attempts"]) == ("queued", 0)
+
+
+def test_claim_next_takes_oldest_request_first(db):
+    first, second = _novel(db), _novel(db)
+    with db.cursor(DictCursor) as cur:
+        sj.enqueue(cur, second)
+        sj.enqueue(cur, first)
+        cur.execute(
+            "UPDATE summary_jobs SET requested_at = NOW() - INTERVAL 10 SECOND WHERE novels_id = %s",
+            (first,),
+        )
+        assert sj.claim_next(cur, "w1") == first
+        assert sj.claim_next(cur, "w1") == second
+        assert sj.claim_next(cur, "w1") is None
+
+
+def test_request_during_run_requeues_after_finish(db):
+    nid = _novel(db)
+    with db.cursor(DictCursor) as cur:
+        sj.enqueue(cur, nid)
+        assert sj.claim(cur, nid, "w1")
+        sj.enqueue(cur, nid)
+        job = _job(db, nid)
+        assert (job["status"], job["request_seq"], job["claimed_seq"]) == ("running", 2, 1)
+
+        sj.finish_job(cur, nid, "w1")
+        job = _job(db, nid)
+        assert (job["status"], job["attempts"]) == ("queued", 0)
+
+        assert sj.claim(cur, nid, "w1")
+        assert _job(db, nid)["claimed_seq"] == 2
+        sj.finish_job(cur, nid, "w1")
+    assert _job(db, nid)["status"] == "done"
+
+
+def test_stale_running_job_is_reclaimed(db):
+    nid = _novel(db)
+    with db.cursor(DictCursor) as cur:
+        sj.enqueue(cur, nid)
+        assert sj.claim(cur, nid, "w1")
+        assert sj.claim_next(cur, "w2") is None
+
+        # worker แรกตายไป started_at เก่ากว่า STALE_SECONDS
+        cur.execute(
+            "UPDATE summary_jobs SET started_at = NOW() - INTERVAL %s SECOND WHERE novels_id = %s",
+            (sj.STALE_SECONDS + 5, nid),
+        )
+        assert sj.claim_next(cur, "w2") == nid
+        job = _job(db, nid)
+        assert (job["status"], job["worker"], job["attempts"]) == ("running", "w2", 2)
+
+        # worker เดิมที่ฟื้นมาจบงานไม่ได้แล้ว
+        sj.finish_job(cur, nid, "w1")
+        assert _job(db, nid)["status"] == "running"
+        sj.finish_job(cur, nid, "w2")
+    assert _job(db, nid)["status"] == "done"
+
+
+def test_fail_retries_until_max_attempts(db):
+    nid = _novel(db)
+    with db.cursor(DictCursor) as cur:
+        sj.enqueue(cur, nid)
+        for attempt in range(1, sj.MAX_ATTEMPTS + 1):
+            assert sj.claim(cur, nid, "w1")
+            sj.fail_job(cur, nid, "w1", "boom")
+            job = _job(db, nid)
+            assert job["error"] == "boom"
+            assert job["status"] == ("failed" if attempt >= sj.MAX_ATTEMPTS else "queued")
+        assert not sj.claim(cur, nid, "w1")
+
+
+# ---------- รันงานกับ client ปลอม ----------
+def test_run_job_writes_summary_with_fake_client(db):
+    nid = _novel(db, comments=["สนุกมากอ่านรวดเดียวจบ", "ตัวเอกเท่มากครับ"])
+    client = FakeOpenAIClient()
+    with db.cursor(DictCursor) as cur:
+        sj.enqueue(cur, nid)
+        assert sj.claim(cur, nid, "w1")
+
+    assert sj.run_job(db, nid, "w1", client=client)
+    assert len(client.calls) == 1
+    assert _job(db, nid)["status"] == "done"
+
+    summary = _summary(db, nid)
+    assert summary["dirty"] == 0
+    assert "สนุกมากอ่านรวดเดียวจบ" in summary["summary_text"]
+    with db.cursor(DictCursor) as cur:
+        cur.execute("SELECT MAX(cm_id) AS m FROM comments WHERE novels_id = %s", (nid,))
+        assert summary["last_cm_id"] == cur.fetchone()["m"]
+
+
+def test_run_job_failure_requeues_and_keeps_interim_summary(db):
+    nid = _novel(db, comments=["สนุกมากอ่านรวดเดียวจบ", "ตัวเอกเท่มากครับ", "รอตอนต่อไปอยู่นะคะ"])
+    with db.cursor(DictCursor) as cur:
+        sj.enqueue(cur, nid)
+        assert sj.claim(cur, nid, "w1")
+
+    assert not sj.run_job(db, nid, "w1", client=FakeOpenAIClient(fail=True))
+    job = _job(db, nid)
+    assert (job["status"], job["attempts"], job["error"]) == ("queued", 1, "model unavailable")
+
+    summary = _summary(db, nid)
+    assert summary["dirty"] == 1
+    assert is_extractive(summary["summary_text"])
+
+
+def test_worker_pool_drains_queue(app, db):
+    ids = [_novel(db, comments=[f"ความคิดเห็นที่ {i} ของเรื่องนี้"]) for i in range(3)]
+    with db.cursor(DictCursor) as cur:
+        for nid in ids:
+            sj.enqueue(cur, nid)
+
+    pool = sj.SummaryWorkerPool(app, workers=2)
+    try:
+        pool.kick()
+        pool.kick()
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            if all(_job(db, nid)["status"] == "done" for nid in ids):
+                break
+            time.sleep(0.05)
+    finally:
+        pool.shutdown()
+
+    assert [_job(db, nid)["status"] for nid in ids] == ["done"] * 3
+    assert len(app.config["OPENAI_CLIENT"].calls) == 3
@@ -0,0 +1,204 @@
+# textseg.py
+"""
+ตัดคำสำหรับระบบค้นหา (ไทย + อังกฤษ)
+
+- ภาษาไทย: maximal matching จากพจนานุกรม (เลือกทางที่คำไม่รู้จักน้อยที่สุด แล้วจำนวนคำน้อยที่สุด)
+- ภาษาอื่น: ตัดตามตัวอักษร/ตัวเลขต่อเนื่อง
+- char n-gram (ค่าเริ่มต้น 2 ตัวอักษร) ใช้เป็น fallback เวลาคำค้นไม่อยู่ในพจนานุกรม
+
+พจนานุกรมมาจาก:
+  1) คำพื้นฐานในไฟล์นี้
+  2) pythainlp.corpus.thai_words() ถ้าติดตั้งไว้
+  3) ไฟล์ THAI_DICT_PATH (1 คำต่อบรรทัด) และคำที่ระบบค้นหาเพิ่มเข้ามา (ชื่อแท็ก/หมวด)
+"""
+from __future__ import annotations
+
+import re
+import threading
+import unicodedata
+
+# อักขระที่ขึ้นต้นคำไม่ได้ (สระหลัง/บน/ล่าง วรรณยุกต์ การันต์)
+_THAI_NONSTART = set("ะัาำิีึืฺุู็่้๊๋์ํ๎ๅ")
+# อักขระที่จบคำไม่ได้ (สระหน้า)
+_THAI_NONEND = set("เแโใไ")
+
+_RUN_RE = re.compile(r"[฀-๿]+|[^\W_]+", re.UNICODE)
+_THAI_RE = re.compile(r"^[฀-๿]+$")
+
+# คำพื้นฐานที่พบบ่อยในชื่อเรื่อง/แท็กนิยาย (พจนานุกรมเต็มควรมาจาก pythainlp หรือ THAI_DICT_PATH)
+_BASE_WORDS = """
+นิยาย เรื่อง ตอน รัก ความรัก หัวใจ แฟน สาว หนุ่ม พระเอก นางเอก เจ้าชาย เจ้าหญิง ราชา ราชินี
+จักรพรรดิ องค์ชาย ท่าน ประธาน บอส เลขา หมอ ทหาร ตำรวจ นักเรียน โรงเรียน มหาลัย มหาวิทยาลัย
+แฟนตาซี ผจญภัย สืบสวน ระทึกขวัญ สยองขวัญ ผี วิญญาณ ปีศาจ เวทมนตร์ จอมเวท ดาบ มังกร เทพ
+ย้อนยุค ข้ามเวลา ข้ามมิติ เกิดใหม่ ทะลุมิติ กำลังภายใน จีน เกาหลี ญี่ปุ่น ไทย โลก ต่างโลก
+ชีวิต ครอบครัว เพื่อน มิตรภาพ ดราม่า ตลก โรแมนติก คอมเมดี้ แอคชั่น สงคราม ระบบ เกม
+วาย ยูริ ชาย หญิง ลูก พ่อ แม่ พี่ น้อง บ้าน เมือง วัง ป่า ทะเล ฟ้า ดาว ดวงจันทร์ พระจันทร์
+ดอกไม้ ฝน หิมะ ไฟ น้ำ ลม ดิน เลือด น้ำตา ความลับ คำสาป สัญญา แต่งงาน คืน วัน เวลา
+ที่ และ ของ ใน กับ ไม่ ได้ ให้ เป็น มี จะ ว่า คือ แห่ง ผู้ นาย นาง คุณ ฉัน เธอ เขา เรา
+จบ แล้ว ใหม่ เก่า สุด ยอด ร้าย ดี ลับ หวาน ขม ร้อน เย็น
+""".split()
+
+
+def normalize(text: str | None) -> str:
+    """ปรับข้อความให้อยู่รูปเดียวกัน (NFC + ตัวพิมพ์เล็ก)"""
+    if not text:
+        return ""
+    return unicodedata.normalize("NFC", str(text)).lower()
+
+
+class ThaiDictionary:
+    """พจนานุกรมแบบ trie (dict ซ้อน) ใช้หา 'ทุกคำที่ขึ้นต้นที่ตำแหน่ง i' ได้เร็ว"""
+
+    _END = "\0"
+
+    def __init__(self, words=()):
+        self._root: dict = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self.add_many(words)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, word: str) -> None:
+        word = normalize(word).strip()
+        if len(word) < 2 or not _THAI_RE.match(word):
+            return
+        with self._lock:
+            node = self._root
+            for ch in word:
+                node = node.setdefault(ch, {})
+            if self._END not in node:
+                node[self._END] = True
+                self._size += 1
+
+    def add_many(self, words) -> None:
+        for w in words:
+            self.add(w)
+
+    def prefixes_at(self, text: str, start: int):
+        """คืนตำแหน่งจบของทุกคำในพจนานุกรมที่เริ่มที่ text[start]"""
+        node = self._root
+        for i in range(start, len(text)):
+            node = node.get(text[i])
+            if node is None:
+                return
+            if self._END in node:
+                yield i + 1
+
+
+def _load_default_words():
+    words = list(_BASE_WORDS)
+    try:  # พจนานุกรมเต็มจาก pythainlp (ถ้ามี)
+        from pythainlp.corpus import thai_words
+        words.extend(thai_words())
+    except Exception:
+        pass
+    return words
+
+
+_default_dict: ThaiDictionary | None = None
+_default_lock = threading.Lock()
+
+
+def default_dictionary() -> ThaiDictionary:
+    global _default_dict
+    if _default_dict is None:
+        with _default_lock:
+            if _default_dict is None:
+                _default_dict = ThaiDictionary(_load_default_words())
+    return _default_dict
+
+
+def load_dictionary_file(path: str, dictionary: ThaiDictionary | None = None) -> int:
+    """เพิ่มคำจากไฟล์ (1 คำต่อบรรทัด) คืนจำนวนบรรทัดที่อ่าน"""
+    d = dictionary or default_dictionary()
+    count = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                d.add(line)
+                count += 1
+    return count
+
+
+def _can_start(text: str, i: int) -> bool:
+    return i >= len(text) or text[i] not in _THAI_NONSTART
+
+
+def segment_thai(text: str, dictionary: ThaiDictionary | None = None) -> list[str]:
+    """
+    ตัดคำภาษาไทยด้วย maximal matching:
+    dp[i] = (จำนวนตัวอักษรที่ไม่รู้จัก, จำนวนคำ) ที่น้อยที่สุดสำหรับ text[:i]
+    ตัวอักษรที่ไม่รู้จักที่ติดกันจะถูกรวมเป็นคำเดียว
+    """
+    d = dictionary or default_dictionary()
+    n = len(text)
+    if n == 0:
+        return []
+
+    inf = (n + 1, n + 1)
+    best = [inf] * (n + 1)
+    back = [(-1, False)] * (n + 1)   # (ตำแหน่งเริ่ม, เป็นคำที่รู้จักไหม)
+    best[0] = (0, 0)
+
+    for i in range(n):
+        if best[i] == inf:
+            continue
+        unk, toks = best[i]
+        for j in d.prefixes_at(text, i):
+            if not _can_start(text, j) or (text[j - 1] in _THAI_NONEND and j < n):
+                continue
+            cand = (unk, toks + 1)
+            if cand < best[j]:
+                best[j] = cand
+                back[j] = (i, True)
+        cand = (unk + 1, toks + 1)
+        if cand < best[i + 1]:
+            best[i + 1] = cand
+            back[i + 1] = (i, False)
+
+    pieces: list[tuple[str, bool]] = []
+    j = n
+    while j > 0:
+        i, known = back[j]
+        pieces.append((text[i:j], known))
+        j = i
+    pieces.reverse()
+
+    words: list[str] = []
+    pending = ""
+    for piece, known in pieces:
+        if known:
+            if pending:
+                words.append(pending)
+                pending = ""
+            words.append(piece)
+        else:
+            pending += piece
+    if pending:
+        words.append(pending)
+    return words
+
+
+def words(text: str | None, dictionary: ThaiDictionary | None = None) -> list[str]:
+    """ตัดข้อความเป็นคำ (normalize แล้ว)"""
+    out: list[str] = []
+    for run in _RUN_RE.findall(normalize(text)):
+        if _THAI_RE.match(run):
+            out.extend(segment_thai(run, dictionary))
+        else:
+            out.append(run)
+    return out
+
+
+def char_ngrams(text: str | None, n: int = 2) -> list[str]:
+    """char n-gram ภายในแต่ละช่วงตัวอักษร (ไม่ข้ามช่องว่าง/เครื่องหมาย)"""
+    out: list[str] = []
+    for run in _RUN_RE.findall(normalize(text)):
+        if len(run) <= n:
+            out.append(run)
+        else:
+            out.extend(run[i:i + n] for i in range(len(run) - n + 1))
+    return out
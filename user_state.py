@@ -0,0 +1,182 @@
+# user_state.py
+"""
+สถานะการกระทำของผู้ใช้ต่อนิยาย (กดหัวใจตอน / อยู่ในชั้นหนังสือ / คะแนนที่ให้) สำหรับหน้า novel cover
+
+- โหลดทีละ (ผู้ใช้, เรื่อง) ด้วย query เดียว (UNION ALL ของ 3 ตาราง กรองด้วย users_id + novels_id)
+  แทนการดึงหัวใจทุกตอนที่ผู้ใช้เคยกดทั้งเว็บ
+- เก็บใน cache ต่อ worker: หัวใจเป็น bitmap แบบ roaring อย่างง่าย (แบ่ง chapters_id เป็นก้อนละ 65536
+  แต่ละก้อนเป็น int bitset) แยกต่อเรื่อง, ชั้นหนังสือเป็น set ของ novels_id และคะแนนเป็น dict
+- route ที่เขียน (กดหัวใจ / ชั้นหนังสือ / ให้คะแนน) อัปเดต cache ของ worker ตัวเองทันที
+  และเปลี่ยนเลขรุ่นใน session ของผู้ใช้ (SESSION_GEN_KEY) → request ถัดไปของคนนี้ที่ไปตก worker อื่น
+  เห็นว่าเลขรุ่นไม่ตรงกับ cache จึงโหลดใหม่ (ผู้ใช้เห็นการกระทำของตัวเองเสมอ)
+  การเปลี่ยนแปลงจากที่อื่น (เช่น ลบตอน) ตามทันภายใน USER_STATE_TTL วินาที
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+
+from flask import session
+
+USER_STATE_TTL = 30.0
+MAX_USERS = 10000
+CHUNK_BITS = 16
+_LOW_MASK = (1 << CHUNK_BITS) - 1
+SESSION_GEN_KEY = "user_state_gen"
+
+
+class ChapterBitmap:
+    """set ของ chapters_id แบบกระชับ: {ก้อนบน: int bitset ของ 16 บิตล่าง}"""
+
+    __slots__ = ("_chunks",)
+
+    def __init__(self, ids=()):
+        self._chunks: dict[int, int] = {}
+        for i in ids:
+            self.add(i)
+
+    def add(self, chapter_id: int) -> None:
+        hi, lo = int(chapter_id) >> CHUNK_BITS, int(chapter_id) & _LOW_MASK
+        self._chunks[hi] = self._chunks.get(hi, 0) | (1 << lo)
+
+    def discard(self, chapter_id: int) -> None:
+        hi, lo = int(chapter_id) >> CHUNK_BITS, int(chapter_id) & _LOW_MASK
+        bits = self._chunks.get(hi, 0) & ~(1 << lo)
+        if bits:
+            self._chunks[hi] = bits
+        else:
+            self._chunks.pop(hi, None)
+
+    def __contains__(self, chapter_id) -> bool:
+        if chapter_id is None:
+            return False
+        hi, lo = int(chapter_id) >> CHUNK_BITS, int(chapter_id) & _LOW_MASK
+        return bool(self._chunks.get(hi, 0) >> lo & 1)
+
+    def __len__(self) -> int:
+        return sum(bin(bits).count("1") for bits in self._chunks.values())
+
+
+class NovelState:
+    """สถานะของผู้ใช้ต่อเรื่องเดียว: ตอนไหนกดหัวใจแล้ว / อยู่ในชั้นหนังสือไหม / ให้คะแนนเท่าไร"""
+
+    __slots__ = ("liked", "in_bookshelf", "rating", "loaded_at", "gen")
+
+    def __init__(self, liked=None, in_bookshelf: bool = False, rating: int = 0, loaded_at: float = 0.0,
+                 gen: int = 0):
+        self.liked = liked if liked is not None else ChapterBitmap()
+        self.in_bookshelf = in_bookshelf
+        self.rating = rating
+        self.loaded_at = loaded_at
+        self.gen = gen      # เลขรุ่นใน session ตอนโหลด / อัปเดตล่าสุด
+
+    def is_liked(self, chapter_id) -> bool:
+        return chapter_id in self.liked
+
+
+ANONYMOUS = NovelState()
+
+_lock = threading.Lock()
+_users: OrderedDict[int, dict[int, NovelState]] = OrderedDict()    # users_id → {novels_id: NovelState}
+
+
+def _session_gen() -> int:
+    return int(session.get(SESSION_GEN_KEY) or 0)
+
+
+def _bump_session_gen() -> tuple[int, int]:
+    """เปลี่ยนเลขรุ่นของผู้ใช้หลังเขียน → (รุ่นเดิม, รุ่นใหม่) ใช้เวลาเป็นเลขรุ่นกันสอง request พร้อมกันได้เลขซ้ำ"""
+    old = _session_gen()
+    new = max(time.time_ns(), old + 1)
+    session[SESSION_GEN_KEY] = new
+    return old, new
+
+
+def _load(cur, uid: int, novels_id: int, gen: int) -> NovelState:
+    cur.execute(
+        """
+        SELECT 'like' AS kind, cl.chapters_id AS ref, NULL AS val
+        FROM chapter_likes cl
+        JOIN chapters c ON c.chapters_id = cl.chapters_id
+        WHERE cl.users_id = %s AND c.novels_id = %s
+        UNION ALL
+        SELECT 'shelf', b.novels_id, NULL
+        FROM bookshelf b
+        WHERE b.users_id = %s AND b.novels_id = %s
+        UNION ALL
+        SELECT 'rate', r.novels_id, r.rating
+        FROM ratings r
+        WHERE r.users_id = %s AND r.novels_id = %s
+        """,
+        (uid, novels_id) * 3,
+    )
+    st = NovelState(loaded_at=time.monotonic(), gen=gen)
+    for r in cur.fetchall():
+        kind = r["kind"]
+        if isinstance(kind, (bytes, bytearray)):
+            kind = kind.decode()
+        if kind == "like":
+            st.liked.add(r["ref"])
+        elif kind == "shelf":
+            st.in_bookshelf = True
+        elif kind == "rate":
+            st.rating = int(r["val"] or 0)
+    return st
+
+
+def get_novel_state(cur, uid: int | None, novels_id: int) -> NovelState:
+    """สถานะของผู้ใช้ต่อเรื่องนี้ (จาก cache ถ้ายังไม่เกิน TTL และเลขรุ่นตรงกับ session ไม่งั้น query เดียว)"""
+    if not uid:
+        return ANONYMOUS
+    now = time.monotonic()
+    gen = _session_gen()
+    with _lock:
+        novels = _users.get(uid)
+        st = novels.get(novels_id) if novels else None
+        if st is not None and st.gen == gen and now - st.loaded_at < USER_STATE_TTL:
+            _users.move_to_end(uid)
+            return st
+
+    st = _load(cur, uid, novels_id, gen)
+    with _lock:
+        novels = _users.setdefault(uid, {})
+        _users.move_to_end(uid)
+        # ทิ้งเรื่องที่หมดอายุของคนนี้ไปด้วย (กันคนเปิดหลายร้อยเรื่องค้างใน cache)
+        for nid in [n for n, s in novels.items() if now - s.loaded_at >= USER_STATE_TTL]:
+            del novels[nid]
+        novels[novels_id] = st
+        while len(_users) > MAX_USERS:
+            _users.popitem(last=False)
+    return st
+
+
+def _note(uid: int, novels_id: int, update) -> None:
+    """
+    อัปเดต cache ของ worker นี้ตามการเขียนของผู้ใช้ แล้วเปลี่ยนเลขรุ่นใน session
+    ถ้า cache ตามรุ่นเดิมไม่ทันอยู่แล้ว (ผู้ใช้เขียนผ่าน worker อื่นมาก่อน) ทิ้งไปให้โหลดใหม่แทน
+    """
+    old, new = _bump_session_gen()
+    with _lock:
+        novels = _users.get(uid)
+        st = novels.get(novels_id) if novels else None
+        if st is None:
+            return
+        if st.gen == old:
+            update(st)
+            st.gen = new
+        else:
+            del novels[novels_id]
+
+
+def note_like(uid: int, novels_id: int, chapters_id: int, liked: bool) -> None:
+    """เรียกหลังกด/ยกเลิกหัวใจสำเร็จ (ภายใน request ของผู้ใช้คนนั้น)"""
+    _note(uid, novels_id, lambda st: (st.liked.add if liked else st.liked.discard)(chapters_id))
+
+
+def note_bookshelf(uid: int, novels_id: int, in_bookshelf: bool) -> None:
+    _note(uid, novels_id, lambda st: setattr(st, "in_bookshelf", in_bookshelf))
+
+
+def note_rating(uid: int, novels_id: int, rating: int) -> None:
+    _note(uid, novels_id, lambda st: setattr(st, "rating", int(rating or 0)))
@@ -1,55 +1,38 @@
 from flask import Blueprint, render_template, request, jsonify, abort
+from MySQLdb.cursors import DictCursor
+from contextlib import closing
 from db import get_db_connection, query_all, query_one
+from stats import COMPLETION_THRESHOLD, ensure_writer_counters, load_daily_stats
 from datetime import datetime
 
 writerwork_bp = Blueprint('writerwork', __name__, template_folder='templates')
 
 # ---------- Helpers ----------
 def _writer_overview(users_id: int):
-    """ดึงข้อมูลโปรไฟล์ + สรุปผลงานของผู้เขียน"""
+    """ดึงข้อมูลโปรไฟล์ + สรุปผลงานของผู้เขียน (จาก writer_counters)"""
     sql = """
     SELECT u.users_id, u.username, u.pfpic,
-           COUNT(n.novels_id) AS work_count,
-           COALESCE(SUM(b.bookshelf_users), 0) AS total_bookshelf
+           COALESCE(wc.work_count, 0) AS work_count,
+           COALESCE(wc.total_bookshelf, 0) AS total_bookshelf
     FROM users u
-    LEFT JOIN novels n ON n.users_id = u.users_id
-    LEFT JOIN v_novel_bookshelf_counts b ON b.novels_id = n.novels_id
+    LEFT JOIN writer_counters wc ON wc.users_id = u.users_id
     WHERE u.users_id = %s
-    GROUP BY u.users_id, u.username, u.pfpic
     """
     return query_one(sql, (users_id,))
 
 def _writer_works(users_id: int):
-    """รายการนิยายของผู้เขียน + สถิติโดยย่อ (ตอน, ยอดดู, ไลก์, บุ๊คมาร์ก, คอมเมนต์, เรตติ้ง)"""
+    """รายการนิยายของผู้เขียน + สถิติโดยย่อ (อ่านจาก novel_counters เฉพาะแถวของผู้เขียนคนนี้)"""
     sql = """
     SELECT
       n.novels_id, n.title, n.cover, n.updated_at, n.status,
-      COALESCE(cc.total_chapters, 0) AS chapters,
-      COALESCE(vh.views, 0) AS views,
-      COALESCE(lk.likes, 0) AS likes,
-      COALESCE(bc.bookshelf_users, 0) AS bookmarks,
-      COALESCE(cm.comments, 0) AS comments_count,
-      COALESCE(rs.bayesian_avg, rs.raw_avg, 0) AS rating_avg
+      COALESCE(nc.chapters, 0) AS chapters,
+      COALESCE(nc.views, 0) AS views,
+      COALESCE(nc.likes, 0) AS likes,
+      COALESCE(nc.bookshelf, 0) AS bookmarks,
+      COALESCE(nc.comments, 0) AS comments_count,
+      COALESCE(nc.rating_avg, nc.rating_sum / NULLIF(nc.rating_count, 0), 0) AS rating_avg
     FROM novels n
-    LEFT JOIN v_novel_chapter_counts cc ON cc.novels_id = n.novels_id
-    LEFT JOIN (
-        SELECT novels_id, COUNT(*) AS views
-        FROM reading_history
-        GROUP BY novels_id
-    ) vh ON vh.novels_id = n.novels_id
-    LEFT JOIN (
-        SELECT c.novels_id, COUNT(*) AS likes
-        FROM chapter_likes cl
-        JOIN chapters c ON c.chapters_id = cl.chapters_id
-        GROUP BY c.novels_id
-    ) lk ON lk.novels_id = n.novels_id
-    LEFT JOIN v_novel_bookshelf_counts bc ON bc.novels_id = n.novels_id
-    LEFT JOIN (
-        SELECT novels_id, COUNT(*) AS comments
-        FROM comments
-        GROUP BY novels_id
-    ) cm ON cm.novels_id = n.novels_id
-    LEFT JOIN v_novel_rating_stats rs ON rs.novels_id = n.novels_id
+    LEFT JOIN novel_counters nc ON nc.novels_id = n.novels_id
     WHERE n.users_id = %s
     ORDER BY n.updated_at DESC, n.novels_id DESC
     """
@@ -62,6 +45,11 @@ def _novel_exists(novel_id: int):
 # ---------- Page: /writer/<writer_id>/works ----------
 @writerwork_bp.get("/writer/<int:writer_id>/works")
 def writer_works(writer_id: int):
+    # เติมตัวนับที่ยังขาด (เช่น นิยายที่เพิ่งสร้าง) เฉพาะของผู้เขียนคนนี้
+    with closing(get_db_connection()) as conn:
+        with conn.cursor(DictCursor) as cur:
+            ensure_writer_counters(cur, writer_id)
+
     writer = _writer_overview(writer_id)
     if not writer:
         abort(404)
@@ -105,100 +93,48 @@ def novel_stats(novel_id: int):
 
     days = max(1, min(request.args.get("days", default=28, type=int), 180))  # ป้องกันยิงยาวเกิน
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    # 1) ตัวเลขรวม
-    # - chapters (จาก view), views/unique_readers (จาก reading_history), likes (chapter_likes), bookmarks (view), comments, rating
-    totals_sql = """
-    SELECT
-      n.novels_id,
-      COALESCE(cc.total_chapters, 0) AS chapters,
-      (SELECT COUNT(*) FROM reading_history rh WHERE rh.novels_id = n.novels_id) AS views,
-      (SELECT COUNT(DISTINCT rh.users_id) FROM reading_history rh WHERE rh.novels_id = n.novels_id) AS readers_unique,
-      (SELECT COUNT(*) FROM chapter_likes cl JOIN chapters c ON c.chapters_id = cl.chapters_id WHERE c.novels_id = n.novels_id) AS likes,
-      COALESCE(bc.bookshelf_users, 0) AS bookmarks,
-      (SELECT COUNT(*) FROM comments cm WHERE cm.novels_id = n.novels_id) AS comments_count,
-      COALESCE(rs.bayesian_avg, rs.raw_avg, 0) AS rating_avg,
-      n.updated_at
-    FROM novels n
-    LEFT JOIN v_novel_chapter_counts cc ON cc.novels_id = n.novels_id
-    LEFT JOIN v_novel_bookshelf_counts bc ON bc.novels_id = n.novels_id
-    LEFT JOIN v_novel_rating_stats rs ON rs.novels_id = n.novels_id
-    WHERE n.novels_id = %s
-    """
-    cur.execute(totals_sql, (novel_id,))
-    totals = cur.fetchone()
-
-    # 2) completion_rate จาก reading_history:
-    #    - เอาความคืบหน้าสูงสุดต่อ user ในเรื่องนี้
-    #    - completed = max_progress >= 95
-    completion_sql = """
-    WITH last_per_user AS (
-      SELECT users_id, MAX(progress) AS max_progress
-      FROM reading_history
-      WHERE novels_id = %s
-      GROUP BY users_id
-    )
-    SELECT
-      COUNT(*) AS readers,
-      SUM(CASE WHEN COALESCE(max_progress,0) >= 95 THEN 1 ELSE 0 END) AS completed
-    FROM last_per_user
-    """
-    cur.execute(completion_sql, (novel_id,))
-    comp_row = cur.fetchone() or {"readers": 0, "completed": 0}
-    readers_total = int(comp_row["readers"] or 0)
-    completed_total = int(comp_row["completed"] or 0)
-    completion_rate = (completed_total / readers_total) if readers_total else 0.0
-
-    # 3) timeseries แบบละเอียด (รายวัน) จาก reading_history:
-    #    - views: จำนวน event ต่อวัน
-    #    - unique_readers: ผู้ใช้ไม่ซ้ำต่อวัน
-    #    - new_completions: จำนวนผู้ใช้ที่ "เพิ่ง" ถึง 95% ครั้งแรกในวันนั้น
-    #    - avg_progress: ค่าเฉลี่ย progress สูงสุดต่อ user ในวันนั้น
-    ts_sql = f"""
-    WITH day_events AS (
-      SELECT DATE(last_read_at) AS d,
-             COUNT(*) AS views,
-             COUNT(DISTINCT users_id) AS readers
-      FROM reading_history
-      WHERE novels_id = %s
-        AND last_read_at >= CURDATE() - INTERVAL %s DAY
-      GROUP BY DATE(last_read_at)
-    ),
-    base AS (
-      SELECT DATE(last_read_at) AS d, users_id, MAX(COALESCE(progress,0)) AS day_max
-      FROM reading_history
-      WHERE novels_id = %s
-        AND last_read_at >= CURDATE() - INTERVAL %s DAY
-      GROUP BY DATE(last_read_at), users_id
-    ),
-    cumprog AS (
-      SELECT d, users_id, day_max,
-             MAX(day_max) OVER (PARTITION BY users_id ORDER BY d
-                                ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) AS cum_max
-      FROM base
-    ),
-    flagged AS (
-      SELECT d, users_id, day_max, cum_max,
-             LAG(cum_max, 1, 0) OVER (PARTITION BY users_id ORDER BY d) AS prev_cum
-      FROM cumprog
-    )
-    SELECT
-      de.d AS date,
-      de.views,
-      de.readers AS unique_readers,
-      SUM(CASE WHEN f.cum_max >= 95 AND f.prev_cum < 95 THEN 1 ELSE 0 END) AS new_completions,
-      ROUND(AVG(f.day_max), 2) AS avg_progress
-    FROM day_events de
-    LEFT JOIN flagged f ON f.d = de.d
-    GROUP BY de.d
-    ORDER BY de.d
-    """
-    cur.execute(ts_sql, (novel_id, days, novel_id, days))
-    rows = cur.fetchall() or []
-
-    cur.close()
+    with closing(get_db_connection()) as conn:
+        with conn.cursor(DictCursor) as cur:
+            # 1) ตัวเลขรวม
+            # - chapters / likes / bookmarks / comments / rating จาก novel_counters
+            # - views / unique_readers / completed ดึงจาก reading_history ของเรื่องนี้ในรอบเดียว
+            #   (reading_history มี 1 แถวต่อ user ต่อเรื่อง → progress คือค่าล่าสุดของ user)
+            ensure_writer_counters(cur, novel["users_id"])
+            totals_sql = """
+            SELECT
+              n.novels_id,
+              COALESCE(nc.chapters, 0) AS chapters,
+              COALESCE(rh.views, 0) AS views,
+              COALESCE(rh.readers_unique, 0) AS readers_unique,
+              COALESCE(rh.completed, 0) AS completed,
+              COALESCE(nc.likes, 0) AS likes,
+              COALESCE(nc.bookshelf, 0) AS bookmarks,
+              COALESCE(nc.comments, 0) AS comments_count,
+              COALESCE(nc.rating_avg, nc.rating_sum / NULLIF(nc.rating_count, 0), 0) AS rating_avg,
+              n.updated_at
+            FROM novels n
+            LEFT JOIN (
+                SELECT novels_id,
+                       COUNT(*) AS views,
+                       COUNT(DISTINCT users_id) AS readers_unique,
+                       SUM(CASE WHEN COALESCE(progress, 0) >= %s THEN 1 ELSE 0 END) AS completed
+                FROM reading_history
+                WHERE novels_id = %s
+                GROUP BY novels_id
+            ) rh ON rh.novels_id = n.novels_id
+            LEFT JOIN novel_counters nc ON nc.novels_id = n.novels_id
+            WHERE n.novels_id = %s
+            """
+            cur.execute(totals_sql, (COMPLETION_THRESHOLD, novel_id, novel_id))
+            totals = cur.fetchone()
+
+            # 2) completion_rate = ผู้อ่านที่ progress >= 95 / ผู้อ่านทั้งหมด
+            readers_total = int(totals["readers_unique"] or 0)
+            completed_total = int(totals["completed"] or 0)
+            completion_rate = (completed_total / readers_total) if readers_total else 0.0
+
+            # 3) timeseries รายวันจากตาราง rollup (เติมโดย `flask stats rollup-daily`)
+            rows = load_daily_stats(cur, novel_id, days)
 
     payload = {
         "novels_id": novel_id,
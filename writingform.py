@@ -12,6 +12,10 @@ import MySQLdb  # สำหรับ conn.ping(True) ถ้าใช้ MySQLdb
 
 from db import get_db_connection
 from auth import roles_required
+from stats import bump_novel_counter
+from chapter_index import mark_chapter_changed
+import chapter_list
+import prerender
 
 # ---------- CONFIG ----------
 CHAPTER_IMAGE_SUBDIR = "chapter_images"  # รูปที่แทรกในเนื้อหาตอนจะเก็บที่ /static/chapter_images
@@ -278,8 +282,13 @@ def save_chapter():
                     (novels_id, title or None, content_html or None, chapter_no),
                 )
                 chapter_id = getattr(cur, "lastrowid", None)
+                bump_novel_counter(cur, novels_id, "chapters", 1)
+
+            mark_chapter_changed(cur, chapter_id)
 
         conn.commit()
+    chapter_list.invalidate(novels_id)
+    prerender.invalidate(novels_id)
 
        # --- ตอบกลับ ---
     if is_autosave: